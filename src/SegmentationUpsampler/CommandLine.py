@@ -0,0 +1,247 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from SegmentationUpsampler import ImageIO
+from SegmentationUpsampler import UpsampleMultiLabels
+
+"""
+Command-line entry point for batch upsampling
+
+DESCRIPTION:
+    The segupsample console script upsamples one label map, every
+    supported file in a directory, or the cases listed in a manifest.
+    Input spacing is read from the file (see ImageIO), and the output
+    is written in the format given by its extension, with the output
+    scale as spacing. Cases are independent, so a batch is processed
+    by a pool of --jobs worker processes, each running upsample() with
+    --workers label workers. A failed case is reported and the batch
+    continues; the exit status is 1 if any case failed.
+
+    A manifest is a text file with one case per line: an input path
+    and optionally an output path, separated by whitespace. Relative
+    paths are relative to the manifest, blank lines and lines starting
+    with # are ignored. Cases without an output path are written to
+    the output directory under their input file name.
+
+USAGE:
+    segupsample input.nii.gz output.nii.gz --scale 0.5
+    segupsample inputDir/ outputDir/ --scale 0.5 0.5 0.5 --jobs 8
+    segupsample --manifest cases.txt outputDir/ --scale 0.5 --fill-gaps
+
+ABOUT:
+    author - Liangpu Liu, Rui Xu, Bradley Treeby
+    date - 18th Oct 2026
+    last update - 18th Oct 2026
+
+LICENSE:
+    This function is part of the pySegmentationUpsampler.
+    Copyright (C) 2024  Liangpu Liu, Rui Xu, and Bradley Treeby.
+
+This file is part of pySegmentationUpsampler, pySegmentationUpsampler
+is free software: you can redistribute it and/or modify it under the
+terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+pySegmentationUpsampler is distributed in the hope that it will be
+useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with pySegmentationUpsampler. If not, see
+<http://www.gnu.org/licenses/>.
+
+"""
+
+def getParser():
+    """Argument parser of the segupsample command."""
+    parser = argparse.ArgumentParser(
+        prog="segupsample",
+        description="Upsample segmented images (.npy, .mat, .nii, .nii.gz).")
+    parser.add_argument("input", nargs="?",
+                        help="input file or directory of input files")
+    parser.add_argument("output",
+                        help="output file, or output directory for a " +
+                        "directory or manifest")
+    parser.add_argument("--manifest",
+                        help="text file listing one input [output] per line")
+    parser.add_argument("--scale", type=float, nargs="+", required=True,
+                        help="output voxel size, one value or three, in " +
+                        "the units of the input spacing")
+    parser.add_argument("--sigma", type=float, default=-1,
+                        help="Gaussian smoothing, -1 for automatic")
+    parser.add_argument("--iso", type=float, default=-1,
+                        help="isovalue, -1 for automatic")
+    parser.add_argument("--iso-tolerance", dest="isoTolerance", type=float,
+                        help="find the automatic isovalue by a " +
+                        "golden-section search to within this tolerance " +
+                        "instead of a 0.001-step scan")
+    parser.add_argument("--spacing", type=float, nargs=3,
+                        help="input voxel size, overriding the file")
+    parser.add_argument("--fill-gaps", dest="fillGaps", action="store_true",
+                        help="fill voxels left unlabelled between labels")
+    parser.add_argument("--no-numba", dest="NB", action="store_false",
+                        help="use the pure Python voxelizer and gap filler")
+    parser.add_argument("--engine", choices=("distance", "scanline"),
+                        default="distance", help="voxelization engine")
+    parser.add_argument("--mesh-repair", dest="meshRepair",
+                        choices=("always", "auto", "never"), default="always",
+                        help="fill holes and merge points of the label meshes")
+    parser.add_argument("--mesh-simplify", dest="meshSimplify",
+                        choices=("decimate", "smooth"),
+                        help="decimate or smooth the label meshes, moving " +
+                        "them by at most half an output voxel")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="label workers per case")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="cases processed in parallel")
+    parser.add_argument("--quiet", dest="verbose", action="store_false",
+                        help="do not print the progress of each label")
+    parser.add_argument("--variable",
+                        help="variable of .mat inputs, default the only " +
+                        "3D array")
+    return parser
+
+def readManifest(path, outputDir):
+    """List the (input, output) cases of a manifest."""
+    root = os.path.dirname(os.path.abspath(path))
+    cases = []
+    with open(path) as manifest:
+        for line in manifest:
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            if len(fields) > 2:
+                raise ValueError("Manifest line should be 'input [output]': " +
+                                 line.strip())
+            inputPath = os.path.join(root, fields[0])
+            if len(fields) == 2:
+                outputPath = os.path.join(root, fields[1])
+            else:
+                outputPath = os.path.join(outputDir,
+                                          os.path.basename(inputPath))
+            cases.append((inputPath, outputPath))
+    return cases
+
+def getCases(args):
+    """List the (input, output) cases selected by the arguments."""
+    if args.manifest is not None:
+        if args.input is not None:
+            raise ValueError("Give either an input or a manifest.")
+        return readManifest(args.manifest, args.output)
+    if args.input is None:
+        raise ValueError("Give an input or a manifest.")
+    if os.path.isdir(args.input):
+        return [(os.path.join(args.input, name),
+                 os.path.join(args.output, name))
+                for name in sorted(os.listdir(args.input))
+                if ImageIO.getExtension(name) is not None]
+    return [(args.input, args.output)]
+
+def upsampleFile(inputPath, outputPath, scale, sigma, iso, spacing,
+                 fillGaps, NB, engine, workers, variable, verbose = True,
+                 meshRepair = "always", meshSimplify = None,
+                 isoTolerance = None):
+    """
+    UPSAMPLEFILE Read, upsample and write one case.
+
+    RETURNS:
+        tuple: (input shape, output shape, seconds)
+    """
+    start = time.perf_counter()
+    matrix, fileSpacing, header = ImageIO.readImage(inputPath, variable)
+    spacing = fileSpacing if spacing is None else spacing
+
+    # Float and integer labels pass through, others such as bool
+    # are converted to float64
+    if not (matrix.dtype in (np.float32, np.float64) or
+            np.issubdtype(matrix.dtype, np.integer)):
+        matrix = matrix.astype(np.float64)
+
+    newMatrix = UpsampleMultiLabels.upsample(matrix, scale, sigma=sigma,
+                                             iso=iso, spacing=spacing,
+                                             fillGaps=fillGaps, NB=NB,
+                                             workers=workers, engine=engine,
+                                             verbose=verbose,
+                                             meshRepair=meshRepair,
+                                             meshSimplify=meshSimplify,
+                                             isoTolerance=isoTolerance)
+    outputDir = os.path.dirname(os.path.abspath(outputPath))
+    os.makedirs(outputDir, exist_ok=True)
+    ImageIO.writeImage(outputPath, newMatrix, scale, header)
+    return matrix.shape, newMatrix.shape, time.perf_counter() - start
+
+def _runCase(case, options):
+    # Runs in a worker, so failures are returned instead of raised
+    inputPath, outputPath = case
+    try:
+        return upsampleFile(inputPath, outputPath, **options), None
+    except Exception as error:
+        return None, repr(error)
+
+def main(argv = None):
+    """Run segupsample with argv, or the command-line arguments."""
+    parser = getParser()
+    args = parser.parse_args(argv)
+
+    if len(args.scale) == 1:
+        args.scale = args.scale * 3
+    if len(args.scale) != 3:
+        parser.error("--scale takes one or three values")
+    if args.jobs < 1 or args.workers < 1:
+        parser.error("--jobs and --workers should be >= 1")
+    if args.isoTolerance is not None and args.isoTolerance <= 0:
+        parser.error("--iso-tolerance should be > 0")
+
+    try:
+        cases = getCases(args)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    if not cases:
+        parser.error("no input files found")
+
+    for inputPath, outputPath in cases:
+        if ImageIO.getExtension(outputPath) is None:
+            parser.error("unsupported output file type: " + outputPath)
+
+    options = dict(scale=args.scale, sigma=args.sigma, iso=args.iso,
+                   spacing=args.spacing, fillGaps=args.fillGaps, NB=args.NB,
+                   engine=args.engine, workers=args.workers,
+                   variable=args.variable, verbose=args.verbose,
+                   meshRepair=args.meshRepair, meshSimplify=args.meshSimplify,
+                   isoTolerance=args.isoTolerance)
+
+    if args.jobs == 1 or len(cases) == 1:
+        results = (_runCase(case, options) for case in cases)
+        executor = None
+    else:
+        # Spawned, not forked, for the same reason as in upsample
+        executor = ProcessPoolExecutor(
+            min(args.jobs, len(cases)),
+            mp_context=multiprocessing.get_context("spawn"))
+        results = executor.map(_runCase, cases, [options] * len(cases))
+
+    failed = 0
+    try:
+        for (inputPath, outputPath), (result, error) in zip(cases, results):
+            if error is None:
+                inputShape, outputShape, seconds = result
+                print("%s -> %s %s -> %s %.2f s" % (inputPath, outputPath,
+                                                     inputShape, outputShape,
+                                                     seconds))
+            else:
+                failed += 1
+                print("%s failed: %s" % (inputPath, error), file=sys.stderr)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 import vtk
 import numpy as np
+from vtk.util import numpy_support
 
 class IsosurfaceExtractor:
     """
@@ -9,7 +10,21 @@ DESCRIPTION:
     ISOSURFACEEXTRACTOR is a class designed to extract isosurfaces 
     from a segmented image component using VTK's mesh processing 
     pipeline. Handles label-specific surface extraction including 
-    hole filling and mesh cleaning.
+    hole filling and mesh cleaning. The cropped smoothed block is 
+    passed to VTK without a copy, in its own dtype: float32 from 
+    Preprocess, which smooths in single precision, or float64.
+
+    The post-processing of the FlyingEdges3D surface is set by the 
+    meshRepair and meshSimplify attributes of the SegmentedImage:
+    - meshRepair   : "always" fills holes and merges duplicate points, 
+                     "auto" does so only if the surface has boundary or 
+                     non-manifold edges, "never" skips both
+    - meshSimplify : None keeps the surface, "decimate" reduces it with 
+                     vtkQuadricDecimation, "smooth" applies 
+                     vtkWindowedSincPolyDataFilter
+    Simplification moves the surface by at most maxError, half the 
+    smallest output voxel by default, so voxels further than that from 
+    the surface keep their label.
 
 USAGE:
     # As part of segmentation upsampling pipeline:
@@ -21,14 +36,27 @@ INPUTS:
         Container class with processed segmentation data
     i           : int
         Index of the label to process in segImg.binaryImgList
+    meshArrays  : bool
+        Build the faces/nodes arrays in addition to polyData
+    maxError    : float or None
+        Largest displacement of the surface by meshSimplify, in input 
+        voxels, half the smallest output voxel if None
 
 ATTRIBUTES:
     binaryImg    : ImageBase.BinaryImage
         Label-specific image data
     array        : numpy.ndarray
         3D array slice for the specified label
+    scalars      : vtk.vtkDataArray
+        VTK array sharing the memory of array, set by extractIsosurface
     threshold    : float
         Calculated isovalue for surface extraction
+    repair       : str
+        "always", "auto" or "never", see meshRepair
+    simplify     : str or None
+        None, "decimate" or "smooth", see meshSimplify
+    maxError     : float
+        Largest displacement of the surface by simplify
     faces        : numpy.ndarray
         Triangular faces from extracted mesh (Nx3)
     nodes        : numpy.ndarray
@@ -61,7 +89,7 @@ License along with pySegmentationUpsampler. If not, see
 <http://www.gnu.org/licenses/>.
     """
 
-    def __init__(self, segImg, i):
+    def __init__(self, segImg, i, meshArrays = True, maxError = None):
         """
         INIT Initialize label-specific surface extractor.
 
@@ -74,28 +102,38 @@ License along with pySegmentationUpsampler. If not, see
                 Main container with preprocessed segmentation data
             i           : int  
                 Index of label to process in binaryImgList
+            meshArrays  : bool
+                Build faces/nodes numpy arrays, set to False when only 
+                polyData is used downstream
+            maxError    : float or None
+                Largest displacement of the surface by meshSimplify, in 
+                input voxels, half the smallest output voxel if None
         """
         self.binaryImg = segImg.binaryImgList[i]
         self.array = self.binaryImg.croppedImg
         self.threshold = self.binaryImg.iso
+        self.meshArrays = meshArrays
+        self.repair = segImg.meshRepair
+        self.simplify = segImg.meshSimplify
+        if maxError is None:
+            maxError = 0.5*min(segImg.dx)
+        self.maxError = maxError
 
+        self.scalars = None
         self.faces = None
         self.nodes = None
         self.polyData = None
 
     def extractIsosurface(self):
         """
-        INIT Initialize label-specific surface extractor.
+        EXTRACTISOSURFACE Extract the isosurface of the cropped label.
 
         DESCRIPTION:
-            Configures extraction parameters from SegmentedImage 
-            container and specified label index.
-
-        INPUTS:
-            segImg      : ImageBase.SegmentedImage
-                Main container with preprocessed segmentation data
-            i           : int  
-                Index of label to process in binaryImgList
+            Runs FlyingEdges3D at the label's isovalue, fills small 
+            holes and merges duplicate points as set by repair, then 
+            decimates or smooths the mesh as set by simplify. Faces and 
+            nodes are copied out of the VTK arrays with numpy_support 
+            when meshArrays is set.
         """
         # Convert the numpy array to a VTK image data
         data = vtk.vtkImageData()
@@ -104,51 +142,135 @@ License along with pySegmentationUpsampler. If not, see
         data.SetSpacing(1, 1, 1)
         data.SetOrigin(0, 0, 0)
 
-        vtkDataArray = vtk.vtkFloatArray()
-        vtkDataArray.SetNumberOfComponents(1)
-        vtkDataArray.SetArray(self.array.ravel(), len(self.array.ravel()), 1)
-
-        data.GetPointData().SetScalars(vtkDataArray)
+        # VTK stores x fastest, so the C-ordered block is read as a 
+        # (z, y, x) image. numpy_to_vtk wraps the flat view without a 
+        # copy and keeps a reference to it for the life of the VTK 
+        # array, which the mesh pipeline holds on to
+        flatArray = np.ascontiguousarray(self.array).reshape(-1)
+        self.scalars = numpy_support.numpy_to_vtk(flatArray, deep=False)
+        data.GetPointData().SetScalars(self.scalars)
 
         # Extract the isosurface using the FlyingEdges3D algorithm
         surface = vtk.vtkFlyingEdges3D()
         surface.SetInputData(data)
         surface.SetValue(0, self.threshold)
         surface.Update()
+        polyData = surface.GetOutput()
 
-        # Fill holes in the mesh
-        fill = vtk.vtkFillHolesFilter()
-        fill.SetInputConnection(surface.GetOutputPort())
-        fill.SetHoleSize(5)
-        fill.Update()
-    
-        # Remove any duplicate points
-        cleanFilter = vtk.vtkCleanPolyData()
-        cleanFilter.SetInputConnection(fill.GetOutputPort())
-        cleanFilter.Update()
-
-        # Get the cleaned isosurface
-        polyData = cleanFilter.GetOutput()
-
-        # Extract faces from the isosurface
-        self.faces = []
-        cells = polyData.GetPolys()
-        cells.InitTraversal()
-        idList = vtk.vtkIdList()
-        while cells.GetNextCell(idList):
-            self.faces.append([idList.GetId(0), idList.GetId(1), 
-                               idList.GetId(2)])
-
-        # Extract nodes from the isosurface
-        self.nodes = []
-        points = polyData.GetPoints()
-        for i in range(points.GetNumberOfPoints()):
-            self.nodes.append(points.GetPoint(i))
+        if self.repair == "always" or (self.repair == "auto" and 
+                                       not self.isWatertight(polyData)):
+            # Fill holes in the mesh
+            fill = vtk.vtkFillHolesFilter()
+            fill.SetInputData(polyData)
+            fill.SetHoleSize(5)
+            fill.Update()
+        
+            # Remove any duplicate points
+            cleanFilter = vtk.vtkCleanPolyData()
+            cleanFilter.SetInputConnection(fill.GetOutputPort())
+            cleanFilter.Update()
+
+            # Get the cleaned isosurface
+            polyData = cleanFilter.GetOutput()
+
+        if self.simplify == "decimate":
+            polyData = self.decimate(polyData, self.maxError)
+        elif self.simplify == "smooth":
+            polyData = self.smooth(polyData, self.maxError)
 
         self.polyData = polyData
 
+        if self.meshArrays:
+            self.faces, self.nodes = self.getMeshArrays(polyData)
+
+    @staticmethod
+    def isWatertight(polyData):
+        """
+        ISWATERTIGHT True if every edge of the mesh is shared by 
+        exactly two faces, so it has no holes to fill.
+        """
+        edges = vtk.vtkFeatureEdges()
+        edges.SetInputData(polyData)
+        edges.BoundaryEdgesOn()
+        edges.NonManifoldEdgesOn()
+        edges.FeatureEdgesOff()
+        edges.ManifoldEdgesOff()
+        edges.Update()
+        return edges.GetOutput().GetNumberOfCells() == 0
+
+    @staticmethod
+    def decimate(polyData, maxError):
+        """
+        DECIMATE Collapse edges of the mesh while the quadric error, the 
+        squared distance to the planes of the original faces, stays 
+        below maxError squared.
+        """
+        # Hole filling adds polygons, the decimation needs triangles
+        triangles = vtk.vtkTriangleFilter()
+        triangles.SetInputData(polyData)
+
+        decimation = vtk.vtkQuadricDecimation()
+        decimation.SetInputConnection(triangles.GetOutputPort())
+        decimation.SetTargetReduction(0.99)
+        decimation.SetMaximumError(maxError**2)
+        decimation.VolumePreservationOn()
+        decimation.Update()
+        return decimation.GetOutput()
+
+    @staticmethod
+    def smooth(polyData, maxError):
+        """
+        SMOOTH Smooth the mesh with a windowed sinc filter, then move 
+        back the points that moved further than maxError to that 
+        distance along their displacement.
+        """
+        smoothing = vtk.vtkWindowedSincPolyDataFilter()
+        smoothing.SetInputData(polyData)
+        smoothing.SetNumberOfIterations(15)
+        smoothing.SetPassBand(0.1)
+        smoothing.NormalizeCoordinatesOn()
+        smoothing.BoundarySmoothingOff()
+        smoothing.Update()
+        smoothed = smoothing.GetOutput()
+        if smoothed.GetPoints() is None:
+            return smoothed
+
+        before = numpy_support.vtk_to_numpy(polyData.GetPoints().GetData())
+        after = numpy_support.vtk_to_numpy(smoothed.GetPoints().GetData())
+        displacement = after - before
+        distance = np.linalg.norm(displacement, axis=1, keepdims=True)
+        factor = np.minimum(1, maxError/np.maximum(distance, 1e-12))
+        # The points are a view of the VTK array, so this updates the mesh
+        after[:] = before + displacement*factor
+        smoothed.GetPoints().Modified()
+        return smoothed
+
+    @staticmethod
+    def getMeshArrays(polyData):
+        """
+        GETMESHARRAYS Copy faces and nodes of a mesh into numpy arrays.
+
+        DESCRIPTION:
+            Reads the cell connectivity and offsets arrays directly. 
+            Each face keeps the first three point ids of its cell, so 
+            polygons added by hole filling give one triangle.
+
+        RETURNS:
+            tuple: (faces (Nx3 int64), nodes (Mx3 float64))
+        """
+        points = polyData.GetPoints()
+        if points is None:
+            return (np.zeros((0, 3), dtype=np.int64), 
+                    np.zeros((0, 3), dtype=np.float64))
+
+        cells = polyData.GetPolys()
+        connectivity = numpy_support.vtk_to_numpy(cells.GetConnectivityArray())
+        offsets = numpy_support.vtk_to_numpy(cells.GetOffsetsArray())
+        faces = connectivity[offsets[:-1, None] + np.arange(3)].astype(np.int64, copy=False)
+
+        nodes = numpy_support.vtk_to_numpy(points.GetData()).astype(np.float64)
+        return faces, nodes
+
     def updateImg(self):
         """Update parent image with extracted surface data."""
-        self.binaryImg.setSurfaceMesh(self.polyData, 
-                                    np.array(self.faces), 
-                                    np.array(self.nodes))
\ No newline at end of file
+        self.binaryImg.setSurfaceMesh(self.polyData, self.faces, self.nodes)
\ No newline at end of file
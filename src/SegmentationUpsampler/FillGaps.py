@@ -94,6 +94,23 @@ License along with pySegmentationUpsampler. If not, see
                         surroundings.append(self.newMatrix[i, j, k])
         return surroundings
 
+    def getSmoothedValue(self, binImg, x, y, z):
+        """
+        GETSMOOTHEDVALUE Smoothed field of a label at an input grid voxel.
+
+        DESCRIPTION:
+            Reads the cropped smoothed block through its bounds. The 
+            smoothed field is zero outside the bounds.
+
+        RETURNS:
+            float       : Smoothed value of the label at (x, y, z)
+        """
+        lower, upper = binImg.bounds
+        if (lower[0] <= x < upper[0] and lower[1] <= y < upper[1] and 
+                lower[2] <= z < upper[2]):
+            return binImg.croppedImg[x - lower[0], y - lower[1], z - lower[2]]
+        return 0
+
     def fillZeros(self):
         """
         FILLZEROS Resolve interstitial voids in upsampled grid.
@@ -109,9 +126,9 @@ License along with pySegmentationUpsampler. If not, see
             inMesh = 0
 
             for binImg in binImgList:
-                smoothedMatrix = binImg.smoothedImg
-                if smoothedMatrix[int(x*self.dx[0]), int(y*self.dx[1]), 
-                                  int(z*self.dx[2])] > self.isovalue:
+                if self.getSmoothedValue(binImg, int(x*self.dx[0]), 
+                                         int(y*self.dx[1]), 
+                                         int(z*self.dx[2])) > self.isovalue:
                     inMesh = 1
                     continue
 
@@ -125,5 +142,6 @@ License along with pySegmentationUpsampler. If not, see
     def updateImg(self):
         """Finalize changes in SegmentedImage container."""
         self.segImg.setUpdatedImg(self.newMatrix)
-        print("Zeros filled")
+        if self.segImg.verbose:
+            print("Zeros filled")
         
\ No newline at end of file
@@ -8,9 +8,11 @@ FILLGAPSNUMBA Numba-accelerated post-processing for interstitial void filling.
 DESCRIPTION:
     Optimized version of FillGaps that uses Numba for performance-critical 
     operations. Part of segmentation upsampling pipeline. Features:
-    - Numba-accelerated neighborhood analysis
-    - Mesh existence validation using precomputed smooth fields
-    - Majority voting from 26-connected neighborhood
+    - Union mesh mask built once from the cropped smoothed fields
+    - Only zero voxels inside the mask are visited
+    - Parallel majority voting from the 26-connected neighborhood with 
+      a fixed-size label histogram
+    - Kernels cached on disk, see warmup()
 
 USAGE:
     # As part of segmentation processing pipeline:
@@ -27,11 +29,13 @@ ATTRIBUTES:
         Grid spacing from original to upsampled space
     isovalue    : float
         Threshold for mesh inclusion validation
+    inside      : numpy.ndarray
+        Union mesh mask on the input grid, built on first use
 
 ABOUT:
     author      : Liangpu Liu, Rui Xu, Bradley Treeby
     date        : 25th Aug 2024
-    last update :  1st Mar 2025
+    last update : 18th Oct 2026
 
 LICENSE:
     This function is part of the pySegmentationUpsampler.
@@ -69,77 +73,244 @@ License along with pySegmentationUpsampler. If not, see
         self.newMatrix = self.segImg.newImg
         self.dx = self.segImg.dx
         self.isovalue = self.segImg.iso
+        self.inside = None
+
+    def getInsideMask(self):
+        """
+        GETINSIDEMASK Union of all label meshes on the input grid.
+
+        DESCRIPTION:
+            Thresholds the cropped smoothed field of every label once 
+            and merges it into a boolean mask of the input grid. The 
+            smoothed fields are zero outside their bounds.
+
+        RETURNS:
+            numpy.ndarray : bool, True where any smoothed value > isovalue
+        """
+        # Compare in double precision, as the scalar loop did
+        isovalue = np.float64(self.isovalue)
+        inside = np.full(self.segImg.multiLabelMatrix.shape, 0 > isovalue)
+        for i in range(self.segImg.getLabelNumber()):
+            binImg = self.segImg.binaryImgList[i]
+            lower, upper = binImg.bounds
+            region = tuple(slice(lower[d], upper[d]) for d in range(3))
+            inside[region] |= (binImg.croppedImg.astype(np.float64, 
+                                                        copy=False) > 
+                               isovalue)
+        return inside
 
     def fillZeros(self):
         """
         FILLZEROS Execute Numba-accelerated void filling.
 
         PROCESS:
-            1. Identify remaining zeros in upsampled grid
-            2. Collect smoothed guidance fields from all labels
-            3. Delegate to Numba-optimized processing:
-               - Coordinate scaling
-               - Mesh inclusion checks
-               - Neighborhood analysis
+            1. Build the union mask of all label meshes on the input grid
+            2. Mark zero voxels of the upsampled grid inside the mask
+            3. Fill marked voxels without marked neighbours in parallel
+            4. Fill the remaining marked voxels in raster order, so each 
+               one sees the labels given to its earlier neighbours
         """
-        zeros = np.argwhere(self.newMatrix == 0)
-        smoothedList = []
-        for i in range(self.segImg.getLabelNumber()):
-            binImg = self.segImg.binaryImgList[i]
-            smoothedList.append(binImg.smoothedImg)
+        self.newMatrix = self.fillBlock(self.newMatrix, 0, 0, 
+                                        self.newMatrix.shape[0])
+
+    def fillBlock(self, block, start, first, last):
+        """
+        FILLBLOCK Fill the voids of a slab of the upsampled grid.
 
-        self.newMatrix = pointWiseProcess(zeros, smoothedList, self.dx, self.isovalue, self.newMatrix)
+        DESCRIPTION:
+            Fills rows first to last of block, a slab of the output grid 
+            starting at output row start. Rows outside that range are a 
+            halo: they count as neighbours but are left unchanged. 
+            Filling consecutive slabs in order, each with the final rows 
+            before it and the unfilled rows after it as halo, gives the 
+            same result as filling the whole grid at once.
+
+        INPUTS:
+            block       : numpy.ndarray
+                Slab of the output grid, modified in-place
+            start       : int
+                Output grid row of block[0]
+            first, last : int
+                Rows of block to fill
+
+        RETURNS:
+            numpy.ndarray : block with filled voids
+        """
+        if self.inside is None:
+            self.inside = self.getInsideMask()
+        ix = np.array([int(n * self.dx[0]) 
+                       for n in range(start, start + block.shape[0])], 
+                      dtype=np.int64)
+        iy, iz = (np.array([int(n * self.dx[d]) 
+                            for n in range(block.shape[d])], 
+                           dtype=np.int64) for d in (1, 2))
+
+        candidates = markCandidates(block, self.inside, ix, iy, iz)
+        for halo in (candidates[:first], candidates[last:]):
+            halo[halo == 1] = 2
+        clustered = fillIsolated(block, candidates)
+        return fillClustered(block, candidates, clustered)
     
     def updateImg(self):
         """Finalize changes in SegmentedImage container."""
         self.segImg.setUpdatedImg(self.newMatrix)
-        print("Zeros filled")
-        
-@nb.njit
-def pointWiseProcess(zeros, smoothed_list, dx, isovalue, new_matrix):
+        if self.segImg.verbose:
+            print("Zeros filled")
+
+def warmup(dtypes = (np.uint8,)):
+    """
+    WARMUP Compile the kernels for the output grid dtypes.
+
+    DESCRIPTION:
+        Fills a small grid of each dtype, with the argument types 
+        fillBlock uses. The kernels are cached on disk, so this loads 
+        them from the cache where compiled versions exist.
+
+    RETURNS:
+        int : number of kernel versions compiled or loaded
     """
-    NUMBA-ACCELERATED VOID PROCESSING CORE
+    kernels = (markCandidates, majorityLabel, hasCandidateNeighbour, 
+               fillIsolated, fillClustered)
+    before = sum(len(kernel.signatures) for kernel in kernels)
+    index = np.zeros(3, dtype=np.int64)
+    inside = np.ones((1, 1, 1), dtype=np.bool_)
+    for dtype in dtypes:
+        block = np.ones((3, 3, 3), dtype=dtype)
+        block[1, 1, 1:] = 0
+        candidates = markCandidates(block, inside, index, index, index)
+        clustered = fillIsolated(block, candidates)
+        fillClustered(block, candidates, clustered)
+    return sum(len(kernel.signatures) for kernel in kernels) - before
+
+@nb.njit(parallel=True, cache=True)
+def markCandidates(new_matrix, inside, ix, iy, iz):
+    """
+    NUMBA-ACCELERATED CANDIDATE MARKING
+
+    PARAMETERS:
+        new_matrix    : array[int]
+            Upsampled output grid
+        inside        : array[bool]
+            Union mesh mask on the input grid
+        ix, iy, iz    : array[int]
+            Input grid index of each output index along each axis
+
+    RETURNS:
+        array[uint8]  : 1 for zero voxels inside a mesh, 0 otherwise. 
+                        Callers may set 2 for candidates that count as 
+                        neighbours but are not filled
+    """
+    xx, yy, zz = new_matrix.shape
+    candidates = np.zeros((xx, yy, zz), dtype=np.uint8)
+    for x in nb.prange(xx):
+        for y in range(yy):
+            for z in range(zz):
+                if new_matrix[x, y, z] == 0 and inside[ix[x], iy[y], iz[z]]:
+                    candidates[x, y, z] = 1
+    return candidates
+
+@nb.njit(cache=True)
+def majorityLabel(new_matrix, x, y, z, labels, counts):
+    """
+    Most frequent non-zero label in the 26-connected neighbourhood, the 
+    smallest on ties and 0 if there is none. labels and counts are 
+    scratch arrays of length 26.
+    """
+    xx, yy, zz = new_matrix.shape
+    m = 0
+    for i in range(max(0, x-1), min(x+2, xx)):
+        for j in range(max(0, y-1), min(y+2, yy)):
+            for k in range(max(0, z-1), min(z+2, zz)):
+                value = new_matrix[i, j, k]
+                if value == 0 or (i == x and j == y and k == z):
+                    continue
+                n = 0
+                while n < m and labels[n] != value:
+                    n += 1
+                if n == m:
+                    labels[m] = value
+                    counts[m] = 0
+                    m += 1
+                counts[n] += 1
+
+    best = 0
+    for n in range(1, m):
+        if (counts[n] > counts[best] or 
+                (counts[n] == counts[best] and labels[n] < labels[best])):
+            best = n
+    return labels[best] if m > 0 else 0
+
+@nb.njit(cache=True)
+def hasCandidateNeighbour(candidates, x, y, z):
+    """True if another candidate lies in the 26-connected neighbourhood."""
+    xx, yy, zz = candidates.shape
+    for i in range(max(0, x-1), min(x+2, xx)):
+        for j in range(max(0, y-1), min(y+2, yy)):
+            for k in range(max(0, z-1), min(z+2, zz)):
+                if candidates[i, j, k] and not (i == x and j == y and k == z):
+                    return True
+    return False
+
+@nb.njit(parallel=True, cache=True)
+def fillIsolated(new_matrix, candidates):
+    """
+    NUMBA-ACCELERATED PARALLEL VOID FILLING
+
+    DESCRIPTION:
+        Candidates with no candidate neighbours only read voxels that 
+        never change, so they are filled in any order.
 
     PARAMETERS:
-        zeros         : array[int, int, int]
-            Array of (x,y,z) coordinates for void voxels
-        smoothed_list : list[array[float]]
-            List of smoothed guidance fields per label
-        dx            : (float, float, float)
-            Scaling factors between grid spaces
-        isovalue      : float
-            Threshold for mesh inclusion
         new_matrix    : array[int]
             Output grid to modify (in-place)
+        candidates    : array[uint8]
+            Candidate mask from markCandidates
+
+    RETURNS:
+        array[bool]   : Slabs along the first axis holding candidates 
+                        that still need filling
+    """
+    xx, yy, zz = new_matrix.shape
+    clustered = np.zeros(xx, dtype=np.bool_)
+    for x in nb.prange(xx):
+        labels = np.zeros(26, dtype=new_matrix.dtype)
+        counts = np.zeros(26, dtype=np.int64)
+        for y in range(yy):
+            for z in range(zz):
+                if candidates[x, y, z] != 1:
+                    continue
+                if hasCandidateNeighbour(candidates, x, y, z):
+                    clustered[x] = True
+                    continue
+                label = majorityLabel(new_matrix, x, y, z, labels, counts)
+                if label != 0:
+                    new_matrix[x, y, z] = label
+    return clustered
+
+@nb.njit(cache=True)
+def fillClustered(new_matrix, candidates, clustered):
+    """
+    NUMBA-ACCELERATED SEQUENTIAL VOID FILLING
+
+    DESCRIPTION:
+        Fills candidates with candidate neighbours in raster order, 
+        as a voxel by voxel scan of the grid would.
 
     RETURNS:
         array[int]    : Modified output grid with filled voids
     """
-    for x, y, z in zeros:
-        # Convert to original scale coordinates
-        orig_x = int(x * dx[0])
-        orig_y = int(y * dx[1])
-        orig_z = int(z * dx[2])
-        
-        # Check against all label guidance fields
-        in_mesh = False
-        for smoothed in smoothed_list:
-            if smoothed[orig_x, orig_y, orig_z] > isovalue:
-                in_mesh = True
-                break
-
-        if in_mesh:
-            # Analyze 26-connected neighborhood
-            surroundings = []
-            xx, yy, zz = new_matrix.shape
-            for i in range(max(0, x-1), min(x+2, xx)):
-                for j in range(max(0, y-1), min(y+2, yy)):
-                    for k in range(max(0, z-1), min(z+2, zz)):
-                        if (i, j, k) != (x, y, z) and new_matrix[i, j, k] != 0:
-                            surroundings.append(new_matrix[i, j, k])
-            
-            if surroundings:
-                # Apply majority label
-                new_matrix[x, y, z] = np.bincount(np.array(surroundings)).argmax()
-    
-    return new_matrix
\ No newline at end of file
+    xx, yy, zz = new_matrix.shape
+    labels = np.zeros(26, dtype=new_matrix.dtype)
+    counts = np.zeros(26, dtype=np.int64)
+    for x in range(xx):
+        if not clustered[x]:
+            continue
+        for y in range(yy):
+            for z in range(zz):
+                if (candidates[x, y, z] == 1 and 
+                        hasCandidateNeighbour(candidates, x, y, z)):
+                    label = majorityLabel(new_matrix, x, y, z, labels, 
+                                          counts)
+                    if label != 0:
+                        new_matrix[x, y, z] = label
+    return new_matrix
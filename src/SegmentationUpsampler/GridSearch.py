@@ -0,0 +1,211 @@
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from SegmentationUpsampler import ImageBase
+from SegmentationUpsampler import Upsampler
+
+"""
+Grid search of sigma and isovalue against a high-resolution reference
+
+DESCRIPTION:
+    GridSearch upsamples a low-resolution label map for every pair of
+    sigma and isovalue in a grid and compares the result with a
+    high-resolution ground truth, as the MATLAB scripts
+    SinglelabelGridSearch.m and MultilabelGridSearch.m do. For each
+    pair it records:
+    - mislabels    : number of voxels whose label differs from the
+                     reference
+    - mislabelRate : mislabels divided by the reference volume (the
+                     volume grade of the MATLAB scripts)
+    - gaps         : number of background voxels inside the reference
+    - volumeError  : relative difference of the labelled volume
+    Each sigma is one task, so the smoothed fields of a sigma are
+    computed once and shared by all its isovalues (see Upsampler).
+    Tasks run in parallel in worker processes.
+
+USAGE:
+    table, (sigma, iso) = gridSearch(lowRes, reference, scale,
+                                     np.arange(0, 2.5, 0.5),
+                                     np.arange(0.3, 0.8, 0.1),
+                                     workers=4)
+
+ABOUT:
+    author - Liangpu Liu, Rui Xu, Bradley Treeby
+    date - 18th Oct 2026
+    last update - 18th Oct 2026
+
+LICENSE:
+    This function is part of the pySegmentationUpsampler.
+    Copyright (C) 2024  Liangpu Liu, Rui Xu, and Bradley Treeby.
+
+This file is part of pySegmentationUpsampler, pySegmentationUpsampler
+is free software: you can redistribute it and/or modify it under the
+terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+pySegmentationUpsampler is distributed in the hope that it will be
+useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with pySegmentationUpsampler. If not, see
+<http://www.gnu.org/licenses/>.
+
+"""
+
+ERRORS = ("mislabels", "mislabelRate", "gaps", "volumeError")
+
+TABLE_DTYPE = np.dtype([("sigma", np.float64), ("iso", np.float64),
+                        ("mislabels", np.int64), ("mislabelRate", np.float64),
+                        ("gaps", np.int64), ("volumeError", np.float64)])
+
+def getErrors(newMatrix, referenceMatrix):
+    """
+    GETERRORS Compare an upsampled label map with the reference.
+
+    INPUTS:
+        newMatrix   : numpy.ndarray
+            Upsampled label map
+        referenceMatrix : numpy.ndarray
+            High-resolution ground truth of the same shape
+
+    RETURNS:
+        tuple: (mislabels, mislabelRate, gaps, volumeError)
+    """
+    referenceMask = referenceMatrix != 0
+    referenceVolume = int(np.count_nonzero(referenceMask))
+    mislabels = int(np.count_nonzero(newMatrix != referenceMatrix))
+    gaps = int(np.count_nonzero((newMatrix == 0) & referenceMask))
+    volume = int(np.count_nonzero(newMatrix))
+
+    if referenceVolume == 0:
+        return mislabels, np.inf, gaps, np.inf
+    return (mislabels, mislabels/referenceVolume, gaps,
+            (volume - referenceVolume)/referenceVolume)
+
+def evaluateSigma(upsampler, referenceMatrix, sigma, isoValues, options):
+    """
+    EVALUATESIGMA Errors of one sigma with every isovalue.
+
+    RETURNS:
+        list: one (sigma, iso, *errors) row per isovalue
+    """
+    rows = []
+    for iso in isoValues:
+        newMatrix = upsampler.upsample(sigma, iso, **options)
+        rows.append((sigma, iso) + getErrors(newMatrix, referenceMatrix))
+    return rows
+
+def getBestParameters(table, criterion = "mislabels"):
+    """
+    GETBESTPARAMETERS Sigma and isovalue with the smallest error.
+
+    DESCRIPTION:
+        Ties are broken by the number of gaps, then by table order.
+        volumeError is compared by its magnitude.
+
+    RETURNS:
+        tuple: (sigma, iso)
+    """
+    error = table[criterion]
+    if criterion == "volumeError":
+        error = np.abs(error)
+    best = np.lexsort((table["gaps"], error))[0]
+    return float(table["sigma"][best]), float(table["iso"][best])
+
+_workerUpsampler = None
+_workerReference = None
+
+def _initWorker(multiLabelMatrix, referenceMatrix, scale, spacing,
+                maxCacheBytes):
+    global _workerUpsampler, _workerReference
+    _workerUpsampler = Upsampler.Upsampler(multiLabelMatrix, scale, spacing,
+                                           maxCacheBytes)
+    _workerReference = referenceMatrix
+
+def _evaluateSigmaWorker(sigma, isoValues, options):
+    return evaluateSigma(_workerUpsampler, _workerReference, sigma,
+                         isoValues, options)
+
+def gridSearch(multiLabelMatrix, referenceMatrix, scale, sigmaValues,
+               isoValues, spacing = [1, 1, 1], fillGaps = False, NB = True,
+               engine = "distance", workers = 1, criterion = "mislabels",
+               maxCacheBytes = 2**30, verbose = True, isoTolerance = None):
+    """
+    GRIDSEARCH Evaluate every (sigma, iso) pair against a reference.
+
+    INPUTS:
+        multiLabelMatrix : numpy.ndarray
+            Low-resolution label map
+        referenceMatrix : numpy.ndarray
+            High-resolution ground truth on the output grid
+        scale       : list
+            Voxel size of the output grid
+        sigmaValues : sequence of float
+            Sigma values, -1 for automatic
+        isoValues   : sequence of float
+            Isovalues, -1 for automatic
+        spacing, fillGaps, NB, engine, isoTolerance : see
+            UpsampleMultiLabels.upsample
+        workers     : int
+            Number of worker processes, each evaluating whole sigma
+            rows. Scripts using workers > 1 need an
+            ``if __name__ == "__main__":`` guard, as workers are
+            spawned
+        criterion   : str
+            Error minimised by the best parameters, one of ERRORS
+        maxCacheBytes : int or None
+            Memory ceiling of each Upsampler cache
+        verbose     : bool
+            Print the progress of each label
+
+    RETURNS:
+        table       : numpy.ndarray
+            Structured array with fields sigma, iso and the ERRORS, one
+            row per pair in sigma-major order
+        best        : tuple
+            (sigma, iso) with the smallest criterion
+    """
+    sigmaValues = [float(sigma) for sigma in sigmaValues]
+    isoValues = [float(iso) for iso in isoValues]
+    if not sigmaValues or not isoValues:
+        raise ValueError("SigmaValues and isoValues should not be empty.")
+    if criterion not in ERRORS:
+        raise ValueError("Criterion should be one of " +
+                         ", ".join(ERRORS) + ".")
+    if not (isinstance(workers, int) and not isinstance(workers, bool) and
+            workers >= 1):
+        raise ValueError("Workers should be an integer >= 1.")
+
+    # Also validates the image, scale and spacing
+    upsampler = Upsampler.Upsampler(multiLabelMatrix, scale, spacing,
+                                    maxCacheBytes)
+    newShape = ImageBase.SegmentedImage(multiLabelMatrix, -1, scale, spacing,
+                                        -1, dtype=None).newShape
+    if np.shape(referenceMatrix) != newShape:
+        raise ValueError("ReferenceMatrix should have the output shape " +
+                         str(newShape) + ".")
+
+    options = dict(fillGaps=fillGaps, NB=NB, engine=engine, verbose=verbose,
+                   isoTolerance=isoTolerance)
+    if workers == 1 or len(sigmaValues) == 1:
+        rows = [evaluateSigma(upsampler, referenceMatrix, sigma, isoValues,
+                              options)
+                for sigma in sigmaValues]
+    else:
+        # Spawned, not forked, for the same reason as in upsample
+        with ProcessPoolExecutor(min(workers, len(sigmaValues)),
+                                 mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_initWorker,
+                                 initargs=(multiLabelMatrix, referenceMatrix,
+                                           scale, spacing,
+                                           maxCacheBytes)) as executor:
+            rows = list(executor.map(_evaluateSigmaWorker, sigmaValues,
+                                     [isoValues] * len(sigmaValues),
+                                     [options] * len(sigmaValues)))
+
+    table = np.array([row for sigmaRows in rows for row in sigmaRows],
+                     dtype=TABLE_DTYPE)
+    return table, getBestParameters(table, criterion)
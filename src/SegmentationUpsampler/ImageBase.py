@@ -1,4 +1,3 @@
-import vtk
 import numpy as np
 
 class BinaryImage:
@@ -14,7 +13,14 @@ DESCRIPTION:
 
 ATTRIBUTES:
     binImg       : numpy.ndarray 
-        Original binary mask for label
+        Original binary mask for label, expanded to the full input grid
+        from labelMask on each access
+    labelMask    : numpy.ndarray
+        Binary mask cropped to the label's bounding box
+    labelSlices  : tuple[slice]
+        Bounding box of the label in the input grid
+    gridShape    : tuple
+        Shape of the input grid
     label        : int
         Label identifier value
     iso          : float
@@ -22,7 +28,8 @@ ATTRIBUTES:
     sigma        : float
         Gaussian smoothing parameter
     smoothedImg  : numpy.ndarray
-        Smoothed binary mask
+        Smoothed binary mask on the full input grid, None in low 
+        memory mode
     croppedImg   : numpy.ndarray
         Region-of-interest cropped image
     bounds       : tuple
@@ -33,20 +40,32 @@ ATTRIBUTES:
         Mesh face connectivity (Nx3)
     nodes        : numpy.ndarray 
         Mesh vertex coordinates (Mx3)
+    verbose      : bool
+        Print the sigma and isovalue of the label when set
     """
 
-    def __init__(self, binImg, label):
+    def __init__(self, labelMask, label, labelSlices, gridShape, 
+                 verbose = True):
         """
         INIT Initialize label processing container.
 
         INPUTS:
-            binImg      : numpy.ndarray
-                Binary mask for target label
+            labelMask   : numpy.ndarray
+                Binary mask for target label within its bounding box
             label       : int
                 Label identifier value
+            labelSlices : tuple[slice]
+                Bounding box of labelMask in the input grid
+            gridShape   : tuple
+                Shape of the input grid
+            verbose     : bool
+                Print the sigma and isovalue of the label when set
         """
-        self.binImg = binImg
+        self.labelMask = labelMask
+        self.labelSlices = labelSlices
+        self.gridShape = gridShape
         self.label = label
+        self.verbose = verbose
 
         # Processing parameters
         self.iso = None
@@ -62,13 +81,21 @@ ATTRIBUTES:
         self.faces = None
         self.nodes = None
     
+    @property
+    def binImg(self):
+        """Binary mask on the full input grid, built when requested."""
+        binImg = np.zeros(self.gridShape, dtype=np.float32)
+        binImg[self.labelSlices] = self.labelMask
+        return binImg
+
     def setPreprocessedImg(self, smoothMatrix, croppedMatrix, nonZeroShape):
         """
         STOREPREPROCESSED Store smoothed and cropped image data.
 
         INPUTS:
             smoothMatrix   : numpy.ndarray
-                Gaussian-smoothed binary mask
+                Gaussian-smoothed binary mask, or None when only the 
+                cropped block is kept
             croppedMatrix  : numpy.ndarray
                 ROI-cropped image data
             nonZeroShape   : tuple
@@ -87,7 +114,8 @@ ATTRIBUTES:
                 Isovalue for surface extraction
         """
         self.iso = iso
-        print(f"Label {self.label}: Mesh extracted with iso={self.iso:.3f}")
+        if self.verbose:
+            print(f"Label {self.label}: Mesh extracted with iso={self.iso:.3f}")
 
     def setSigma(self, sigma):
         """
@@ -98,7 +126,8 @@ ATTRIBUTES:
                 Gaussian kernel standard deviation
         """
         self.sigma = sigma
-        print(f"Label {self.label}: Smoothed with σ={sigma}")
+        if self.verbose:
+            print(f"Label {self.label}: Smoothed with σ={sigma}")
 
     def setSurfaceMesh(self, polyData, faces, nodes):
         """
@@ -116,6 +145,42 @@ ATTRIBUTES:
         self.faces = faces
         self.nodes = nodes
 
+    def getLocalBlock(self, dx, rows = None):
+        """
+        GETLOCALBLOCK Output grid block covering the cropped region.
+
+        DESCRIPTION:
+            Locates the output samples of the cropped smoothed region, 
+            as the voxelizers sample it, optionally limited to a range 
+            of output rows along the first axis.
+
+        INPUTS:
+            dx        : list
+                Scaling factors (output/original) per axis
+            rows      : tuple
+                (start, stop) output grid rows along the first axis, 
+                all rows of the region if None
+
+        RETURNS:
+            tuple: (offset, localRows, shape) with offset the output 
+            grid index of the block's first voxel, localRows the 
+            (first, last) rows of the region in the block and shape 
+            the shape of the block
+        """
+        lower = self.bounds[0]
+        size = np.shape(self.croppedImg)
+        offset = tuple(int(lower[d]/dx[d]) for d in range(3))
+        shape = tuple(len(np.arange(lower[d], size[d] + lower[d], dx[d])) 
+                      for d in range(3))
+        localRows = (0, shape[0])
+        if rows is not None:
+            first = min(max(rows[0] - offset[0], 0), shape[0])
+            last = min(max(rows[1] - offset[0], first), shape[0])
+            localRows = (first, last)
+            offset = (offset[0] + first,) + offset[1:]
+            shape = (last - first,) + shape[1:]
+        return offset, localRows, shape
+
 
 class SegmentedImage:
     """
@@ -139,16 +204,38 @@ ATTRIBUTES:
         Original grid dimensions
     dx              : (float, float, float)
         Scaling factors (output/original) per axis
+    spacing         : (float, float, float)
+        Original voxel spacing
+    lowMemory       : bool
+        Keep only the cropped smoothed block of each label
+    isoTolerance    : float or None
+        Tolerance of the golden-section search of automatic isovalues, 
+        None for the 0.001-step scan
+    meshRepair      : str
+        Hole filling and point merging of the label meshes, "always", 
+        "auto" or "never", see Extractor
+    meshSimplify    : str or None
+        Simplification of the label meshes, None, "decimate" or 
+        "smooth", see Extractor
+    newShape        : tuple
+        Shape of the upsampled output volume
     newImg          : numpy.ndarray
         Upsampled output volume (XxYxZ)
+    outputLabels    : numpy.ndarray
+        Value written to newImg for each label (L,), the labels 
+        themselves unless compact label mode is used
     binaryImgList   : list[BinaryImage]
         Per-label processing containers
-    separateMatrix  : numpy.ndarray
-        Separated 4D label array (LxHxWxD)
+    labelMasks      : list[numpy.ndarray]
+        Binary mask of each label cropped to its bounding box
+    labelSlices     : list[tuple[slice]]
+        Bounding box of each label in the input grid
     labelVolume     : numpy.ndarray
         Voxel counts per label (L,)
     labels          : numpy.ndarray
         Unique label identifiers (L,)
+    verbose         : bool
+        Print progress messages of the pipeline
 
 ABOUT:
     author         : Liangpu Liu, Rui Xu, Bradley Treeby
@@ -178,7 +265,10 @@ License along with pySegmentationUpsampler. If not, see
 <http://www.gnu.org/licenses/>.
     """
 
-    def __init__(self, multiLabelMatrix, sigma, scale, spacing, iso):
+    def __init__(self, multiLabelMatrix, sigma, scale, spacing, iso, 
+                 lowMemory = True, outputPath = None, out = None, 
+                 dtype = np.uint8, verbose = True, meshRepair = "always", 
+                 meshSimplify = None, isoTolerance = None):
         """
         INIT Initialize segmentation processing container.
 
@@ -193,10 +283,37 @@ License along with pySegmentationUpsampler. If not, see
                 Original voxel spacing (dx, dy, dz)
             iso             : float
                 Default isovalue for surface extraction
+            lowMemory       : bool
+                Keep only the cropped smoothed block and its bounds for 
+                each label instead of a full-size smoothed image
+            outputPath      : str
+                Path of a .npy file holding the output grid as a 
+                memory map, the output grid is kept in memory if None
+            out             : numpy.ndarray
+                Writable array of shape newShape, such as a memory map, 
+                used as the output grid after clearing it
+            dtype           : numpy.dtype
+                Data type of the output grid. If None and out is None, 
+                the output grid is allocated later by allocateNewImg
+            verbose         : bool
+                Print progress messages of the pipeline
+            meshRepair      : str
+                "always", "auto" or "never", see Extractor
+            meshSimplify    : str or None
+                None, "decimate" or "smooth", see Extractor
+            isoTolerance    : float or None
+                Tolerance of the golden-section isovalue search, None 
+                for the 0.001-step scan, see Preprocess
         """
         self.multiLabelMatrix = multiLabelMatrix
         self.sigma = sigma
         self.iso = iso
+        self.lowMemory = lowMemory
+        self.isoTolerance = isoTolerance
+        self.spacing = spacing
+        self.verbose = verbose
+        self.meshRepair = meshRepair
+        self.meshSimplify = meshSimplify
         
         # Original grid dimensions
         self.gx, self.gy, self.gz = np.shape(multiLabelMatrix)
@@ -207,37 +324,139 @@ License along with pySegmentationUpsampler. If not, see
                    scale[2]/spacing[2]]
         
         # Initialize output grid
-        self.newImg = np.zeros(
-            (int(self.gx/self.dx[0]),
-             int(self.gy/self.dx[1]),
-             int(self.gz/self.dx[2])),
-            dtype=np.uint8
-        )
+        self.newShape = (int(self.gx/self.dx[0]),
+                         int(self.gy/self.dx[1]),
+                         int(self.gz/self.dx[2]))
+        self.newImg = None
+        self.outputLabels = None
+        if dtype is not None or out is not None:
+            self.allocateNewImg(dtype, outputPath, out)
         
         self.smoothedList = []  # Legacy attribute for compatibility
 
+    def allocateNewImg(self, dtype = None, outputPath = None, out = None):
+        """
+        ALLOCATENEWIMG Create the zeroed output grid.
+
+        INPUTS:
+            dtype       : numpy.dtype
+                Data type of the output grid, ignored if out is given. 
+                If None, the smallest type holding outputLabels
+            outputPath  : str
+                Path of a .npy file holding the output grid as a 
+                memory map, the output grid is kept in memory if None
+            out         : numpy.ndarray
+                Writable array of shape newShape used as the output grid
+        """
+        if out is not None:
+            if np.shape(out) != self.newShape:
+                raise ValueError(f"Out should have shape {self.newShape}.")
+            dtype = out.dtype
+        elif dtype is None:
+            dtype = self.getOutputDtype(self.outputLabels)
+        dtype = np.dtype(dtype)
+
+        if self.outputLabels is not None and not self.canHold(
+                dtype, self.outputLabels):
+            raise ValueError(f"Output dtype {dtype} cannot hold the " +
+                             "label values, choose a larger dtype or the " +
+                             "compact label mode.")
+
+        if out is not None:
+            out[...] = 0
+            self.newImg = out
+        elif outputPath is None:
+            self.newImg = np.zeros(self.newShape, dtype=dtype)
+        else:
+            self.newImg = np.lib.format.open_memmap(outputPath, mode="w+", 
+                                                    dtype=dtype, 
+                                                    shape=self.newShape)
+
+    @staticmethod
+    def getOutputDtype(values):
+        """
+        GETOUTPUTDTYPE Smallest data type that stores all label values.
+
+        RETURNS:
+            numpy.dtype : uint8 for no labels, the smallest integer type 
+            for integral values, the type of values otherwise
+        """
+        values = np.asarray(values)
+        if values.size == 0:
+            return np.dtype(np.uint8)
+        if np.all(values == np.round(values)):
+            return np.result_type(np.min_scalar_type(int(values.min())), 
+                                  np.min_scalar_type(int(values.max())))
+        return values.dtype
+
+    @staticmethod
+    def canHold(dtype, values):
+        """CANHOLD True if every value is stored exactly in dtype."""
+        values = np.asarray(values)
+        if values.size == 0:
+            return True
+        if np.issubdtype(dtype, np.integer):
+            info = np.iinfo(dtype)
+            return bool(np.all(values == np.round(values)) and 
+                        info.min <= values.min() and values.max() <= info.max)
+        return bool(np.all(values.astype(dtype) == values))
+
+    def setOutputLabels(self, compact = False):
+        """
+        SETOUTPUTLABELS Choose the values written to the output grid.
+
+        DESCRIPTION:
+            By default every label is written with its own value. In 
+            compact mode the labels are written as dense indices 1..L in 
+            ascending label order, which keeps the output type small and 
+            keeps the order of labels for tie breaks in gap filling.
+
+        INPUTS:
+            compact     : bool
+                Write dense indices instead of label values
+
+        RETURNS:
+            numpy.ndarray : lookup table from output value to label, 
+            with 0 for background, or None when compact is False
+        """
+        if not compact:
+            self.outputLabels = self.labels
+            return None
+
+        lookupTable = np.concatenate([np.zeros(1, dtype=self.labels.dtype), 
+                                      np.sort(self.labels)])
+        self.outputLabels = np.searchsorted(lookupTable[1:], self.labels) + 1
+        return lookupTable
+
     def generateBinaryImgList(self):
         """Create BinaryImage instances for each separated label."""
         self.binaryImgList = []
         for i in range(self.getLabelNumber()):
-            img, label = self.getLabel(i)
-            self.binaryImgList.append(BinaryImage(img, label))
+            self.binaryImgList.append(BinaryImage(self.labelMasks[i], 
+                                                  self.labels[i],
+                                                  self.labelSlices[i], 
+                                                  (self.gx, self.gy, self.gz),
+                                                  self.verbose))
 
-    def setSeparateLabels(self, separateMatrix, labelVolume, labels):
+    def setSeparateLabels(self, labelMasks, labelSlices, labelVolume, labels):
         """
         STORESEPARATEDLABELS Register label separation results.
 
         INPUTS:
-            separateMatrix : numpy.ndarray
-                4D array of separated labels (LxHxWxD)
+            labelMasks     : list[numpy.ndarray]
+                Binary mask of each label within its bounding box
+            labelSlices    : list[tuple[slice]]
+                Bounding box of each label in the input grid
             labelVolume    : numpy.ndarray
                 Voxel counts per label (L,)
             labels         : numpy.ndarray
                 Unique label identifiers (L,)
         """
-        self.separateMatrix = np.float32(separateMatrix)
+        self.labelMasks = labelMasks
+        self.labelSlices = labelSlices
         self.labelVolume = labelVolume
         self.labels = labels
+        self.outputLabels = labels
         self.generateBinaryImgList()
 
     def setUpdatedImg(self, newImg):
@@ -255,13 +474,39 @@ License along with pySegmentationUpsampler. If not, see
         GETLABELDATA Retrieve separated label information.
 
         RETURNS:
-            tuple: (separateMatrix, labelVolume, labels)
+            tuple: (labelMasks, labelSlices, labelVolume, labels)
+        """
+        return self.labelMasks, self.labelSlices, self.labelVolume, self.labels
+    
+    def getLabelStatistics(self):
+        """
+        GETLABELSTATISTICS Per-label statistics from label separation.
+
+        DESCRIPTION:
+            Returns the statistics gathered in the single pass of label 
+            separation, in the same descending volume order as labels, 
+            so later stages can reuse them without reading the input.
+
+        RETURNS:
+            tuple: (labels, voxelCounts, volumes, lower, upper)
+                labels      - (L,) label identifiers
+                voxelCounts - (L,) number of voxels of each label
+                volumes     - (L,) voxel counts times the voxel volume
+                lower       - (L, 3) first voxel of each bounding box
+                upper       - (L, 3) end (exclusive) of each bounding box
         """
-        return self.separateMatrix, self.labelVolume, self.labels
+        lower = np.array([[s.start for s in labelSlice] 
+                          for labelSlice in self.labelSlices], 
+                         dtype=int).reshape(-1, 3)
+        upper = np.array([[s.stop for s in labelSlice] 
+                          for labelSlice in self.labelSlices], 
+                         dtype=int).reshape(-1, 3)
+        volumes = self.labelVolume * float(np.prod(self.spacing))
+        return self.labels, self.labelVolume, volumes, lower, upper
     
     def getLabelNumber(self):
         """GETLABELCOUNT Return number of unique labels."""
-        return len(self.separateMatrix)
+        return len(self.labels)
     
     def getLabel(self, i):
         """
@@ -269,9 +514,10 @@ License along with pySegmentationUpsampler. If not, see
 
         INPUTS:
             i           : int
-                Label index in separateMatrix
+                Label index in labels
 
         RETURNS:
-            tuple: (binary_mask, label_value)
+            tuple: (binary_mask, label_value), the mask expanded to the 
+            full input grid
         """
-        return self.separateMatrix[i], self.labels[i]
\ No newline at end of file
+        return self.binaryImgList[i].binImg, self.labels[i]
\ No newline at end of file
@@ -0,0 +1,176 @@
+import os
+import numpy as np
+import scipy.io
+import vtk
+from vtk.util import numpy_support
+
+"""
+Reading and writing of label maps with their voxel spacing
+
+DESCRIPTION:
+    ImageIO reads and writes label maps in the formats of the bundled
+    data:
+    - .npy          : the array only, spacing [1, 1, 1]
+    - .mat          : a 3D variable and, if present, a "spacing"
+                      variable, as in padded_liver.mat
+    - .nii, .nii.gz : NIfTI-1 image, spacing from the header pixdim
+    NIfTI files are read with vtkNIFTIImageReader, so no dependency
+    beyond VTK is needed. Arrays are indexed (i, j, k) in file order.
+    The orientation of a NIfTI input is kept in the returned header
+    and written back to the output with the new spacing.
+
+USAGE:
+    matrix, spacing, header = readImage(path)
+    writeImage(outputPath, newMatrix, scale, header)
+
+ABOUT:
+    author - Liangpu Liu, Rui Xu, Bradley Treeby
+    date - 18th Oct 2026
+    last update - 18th Oct 2026
+
+LICENSE:
+    This function is part of the pySegmentationUpsampler.
+    Copyright (C) 2024  Liangpu Liu, Rui Xu, and Bradley Treeby.
+
+This file is part of pySegmentationUpsampler, pySegmentationUpsampler
+is free software: you can redistribute it and/or modify it under the
+terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+pySegmentationUpsampler is distributed in the hope that it will be
+useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with pySegmentationUpsampler. If not, see
+<http://www.gnu.org/licenses/>.
+
+"""
+
+EXTENSIONS = (".npy", ".mat", ".nii", ".nii.gz")
+
+def getExtension(path):
+    """Supported extension of path, None if it is not supported."""
+    name = os.fspath(path).lower()
+    for extension in sorted(EXTENSIONS, key=len, reverse=True):
+        if name.endswith(extension):
+            return extension
+    return None
+
+def readImage(path, variable = None):
+    """
+    READIMAGE Read a label map and its voxel spacing.
+
+    INPUTS:
+        path        : str
+            .npy, .mat, .nii or .nii.gz file
+        variable    : str or None
+            Variable of a .mat file, None for its only 3D array
+
+    RETURNS:
+        tuple: (matrix, spacing, header) with header the NIfTI reader
+        of a NIfTI file, None otherwise
+    """
+    extension = getExtension(path)
+    if extension == ".npy":
+        return np.load(path), [1, 1, 1], None
+    if extension == ".mat":
+        return readMat(path, variable)
+    if extension in (".nii", ".nii.gz"):
+        return readNifti(path)
+    raise ValueError("Unsupported file type of " + os.fspath(path) +
+                     ", expected one of " + ", ".join(EXTENSIONS) + ".")
+
+def readMat(path, variable = None):
+    """Read a 3D variable and the optional spacing of a .mat file."""
+    contents = scipy.io.loadmat(path)
+    if variable is None:
+        names = [name for name, value in contents.items()
+                 if isinstance(value, np.ndarray) and value.ndim == 3]
+        if len(names) != 1:
+            raise ValueError(os.fspath(path) + " should hold exactly one " +
+                             "3D array, select one with variable.")
+        variable = names[0]
+    if variable not in contents:
+        raise ValueError(os.fspath(path) + " has no variable " + variable +
+                         ".")
+
+    spacing = [1, 1, 1]
+    if "spacing" in contents:
+        spacing = [float(s) for s in np.ravel(contents["spacing"])]
+    return contents[variable], spacing, None
+
+def readNifti(path):
+    """Read a NIfTI image, keeping the reader for its orientation."""
+    reader = vtk.vtkNIFTIImageReader()
+    reader.SetFileName(os.fspath(path))
+    reader.Update()
+    image = reader.GetOutput()
+    scalars = image.GetPointData().GetScalars()
+    if scalars is None:
+        raise ValueError("Could not read " + os.fspath(path) + ".")
+
+    # VTK stores i fastest, so the (k, j, i) array is transposed
+    dimensions = image.GetDimensions()
+    matrix = numpy_support.vtk_to_numpy(scalars).reshape(dimensions[::-1])
+    matrix = np.ascontiguousarray(matrix.transpose(2, 1, 0))
+    if reader.GetRescaleSlope() not in (0, 1) or reader.GetRescaleIntercept():
+        matrix = (matrix*reader.GetRescaleSlope() +
+                  reader.GetRescaleIntercept())
+    return matrix, list(image.GetSpacing()), reader
+
+def writeImage(path, matrix, spacing, header = None):
+    """
+    WRITEIMAGE Write a label map with its voxel spacing.
+
+    INPUTS:
+        path        : str
+            .npy, .mat, .nii or .nii.gz file
+        matrix      : numpy.ndarray
+            3D label map
+        spacing     : list
+            Voxel size of matrix, not stored in .npy files
+        header      : vtk.vtkNIFTIImageReader or None
+            Reader of the input, to keep its NIfTI orientation
+    """
+    extension = getExtension(path)
+    if extension == ".npy":
+        np.save(path, matrix)
+    elif extension == ".mat":
+        scipy.io.savemat(path, {"newMatrix": matrix,
+                                "spacing": np.array(spacing, dtype=float)},
+                         do_compression=True)
+    elif extension in (".nii", ".nii.gz"):
+        writeNifti(path, matrix, spacing, header)
+    else:
+        raise ValueError("Unsupported file type of " + os.fspath(path) +
+                         ", expected one of " + ", ".join(EXTENSIONS) + ".")
+
+def writeNifti(path, matrix, spacing, header = None):
+    """Write a NIfTI image, compressed if path ends with .gz."""
+    # The flat (k, j, i) array is referenced by VTK until it is written
+    data = np.ascontiguousarray(np.asarray(matrix).transpose(2, 1, 0)).ravel()
+    image = vtk.vtkImageData()
+    image.SetDimensions(*np.shape(matrix))
+    image.SetSpacing(*[float(s) for s in spacing])
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(data, deep=0))
+
+    writer = vtk.vtkNIFTIImageWriter()
+    writer.SetInputData(image)
+    writer.SetFileName(os.fspath(path))
+    if header is not None:
+        # Dimensions and pixdim of the header are replaced by the image
+        writer.SetNIFTIHeader(header.GetNIFTIHeader())
+        # readNifti has already applied the scaling of the input
+        writer.SetRescaleSlope(1.0)
+        writer.SetRescaleIntercept(0.0)
+        writer.SetQFac(header.GetQFac())
+        if header.GetQFormMatrix() is not None:
+            writer.SetQFormMatrix(header.GetQFormMatrix())
+        if header.GetSFormMatrix() is not None:
+            writer.SetSFormMatrix(header.GetSFormMatrix())
+    writer.Write()
+    if writer.GetErrorCode():
+        raise OSError("Could not write " + os.fspath(path) + ".")
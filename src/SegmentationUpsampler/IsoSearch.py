@@ -0,0 +1,156 @@
+import numpy as np
+
+class IsovalueSearch:
+    """
+ISOVALUESEARCH Fast isovalue selection on a smoothed label field.
+
+DESCRIPTION:
+    Finds the isovalue whose thresholded shape best preserves the AV
+    ratio (√A/∛V) of the original label. The smoothed values are sorted
+    once, together with the smaller value of every pair of 6-connected
+    neighbours. For any threshold t:
+    - V(t) is the number of voxels with value >= t
+    - E(t) is the number of neighbour pairs with both values >= t
+    - A(t) = 6*V(t) - 2*E(t) is the number of exposed faces
+    so volume and surface area at every threshold are read off the
+    sorted arrays without re-thresholding the image.
+
+USAGE:
+    searcher = IsovalueSearch(croppedMatrix)
+    iso = searcher.linearSearch(originalAV)
+    iso = searcher.goldenSectionSearch(originalAV, tolerance=1e-4)
+
+ATTRIBUTES:
+    values       : numpy.ndarray
+        Sorted non-zero smoothed values
+    pairs        : numpy.ndarray
+        Sorted minimum values of neighbouring voxel pairs
+
+ABOUT:
+    author         : Liangpu Liu, Rui Xu, Bradley Treeby
+    date           : 18th Oct 2026
+    last update    : 18th Oct 2026
+
+LICENSE:
+    This function is part of the pySegmentationUpsampler.
+    Copyright (C) 2024  Liangpu Liu, Rui Xu, and Bradley Treeby.
+
+This file is part of pySegmentationUpsampler, pySegmentationUpsampler
+is free software: you can redistribute it and/or modify it under the
+terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+pySegmentationUpsampler is distributed in the hope that it will be
+useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with pySegmentationUpsampler. If not, see
+<http://www.gnu.org/licenses/>.
+    """
+
+    def __init__(self, smoothedMatrix):
+        """
+        INIT Sort voxel and neighbour pair values once.
+
+        INPUTS:
+            smoothedMatrix : numpy.ndarray
+                Smoothed (cropped) label field
+        """
+        smoothedMatrix = np.asarray(smoothedMatrix)
+        self.dtype = smoothedMatrix.dtype
+
+        self.values = np.sort(smoothedMatrix[smoothedMatrix > 0])
+
+        pairs = []
+        for axis in range(3):
+            lower = [slice(None)] * 3
+            upper = [slice(None)] * 3
+            lower[axis] = slice(None, -1)
+            upper[axis] = slice(1, None)
+            pairMin = np.minimum(smoothedMatrix[tuple(lower)],
+                                 smoothedMatrix[tuple(upper)])
+            pairs.append(pairMin[pairMin > 0])
+        self.pairs = np.sort(np.concatenate(pairs))
+
+    def getShapeMetrics(self, iso):
+        """
+        GETSHAPEMETRICS Volume and surface area of the shape >= iso.
+
+        INPUTS:
+            iso         : float or numpy.ndarray
+                Threshold(s), compared in the dtype of the field as
+                ``smoothedMatrix >= iso`` would be
+
+        RETURNS:
+            tuple: (volume, surfaceArea) with the shape of iso
+        """
+        iso = np.asarray(iso).astype(self.dtype)
+        volume = len(self.values) - np.searchsorted(self.values, iso,
+                                                    side='left')
+        pairs = len(self.pairs) - np.searchsorted(self.pairs, iso,
+                                                  side='left')
+        return volume, 6*volume - 2*pairs
+
+    def getParameterAV(self, iso):
+        """AV ratio (√A/∛V) of the shape >= iso, NaN where it is empty."""
+        volume, area = self.getShapeMetrics(iso)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sqrt(area)/np.cbrt(volume)
+
+    def linearSearch(self, targetAV, stepsize=0.001, upper=0.6):
+        """
+        LINEARSEARCH Scan isovalues stepsize, 2*stepsize, ... up to upper.
+
+        DESCRIPTION:
+            Evaluates every step at once and returns the first isovalue
+            with the smallest AV error, matching a step-by-step scan.
+
+        RETURNS:
+            float: best isovalue, 0 if every threshold gives an empty shape
+        """
+        isovalues = []
+        isovalue = 0
+        while isovalue < upper:
+            isovalue += stepsize
+            isovalues.append(isovalue)
+
+        error = np.abs(self.getParameterAV(np.array(isovalues)) - targetAV)
+        if np.all(np.isnan(error)):
+            return 0
+        return isovalues[np.nanargmin(error)]
+
+    def goldenSectionSearch(self, targetAV, lower=0, upper=0.6,
+                            tolerance=1e-3):
+        """
+        GOLDENSECTIONSEARCH Minimise the AV error to within tolerance.
+
+        DESCRIPTION:
+            Assumes the AV error has a single minimum in [lower, upper].
+            Each evaluation is a binary search in the sorted arrays, so
+            the cost no longer depends on the number of steps.
+
+        RETURNS:
+            float: best isovalue
+        """
+        def error(iso):
+            value = abs(self.getParameterAV(iso) - targetAV)
+            return np.inf if np.isnan(value) else value
+
+        ratio = (np.sqrt(5) - 1)/2
+        a, b = lower, upper
+        c = b - ratio*(b - a)
+        d = a + ratio*(b - a)
+        errorC, errorD = error(c), error(d)
+        while b - a > tolerance:
+            if errorC <= errorD:
+                b, d, errorD = d, c, errorC
+                c = b - ratio*(b - a)
+                errorC = error(c)
+            else:
+                a, c, errorC = c, d, errorD
+                d = a + ratio*(b - a)
+                errorD = error(d)
+        return (a + b)/2
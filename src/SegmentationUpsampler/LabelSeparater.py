@@ -1,4 +1,5 @@
 import numpy as np
+from scipy.ndimage import find_objects
 
 class LabelSeparation:
     """
@@ -20,8 +21,15 @@ ATTRIBUTES:
         Main container with original segmentation data
     labels         : numpy.ndarray
         Unique non-zero labels from input matrix
-    separateMatrix : numpy.ndarray 
-        4D array (label_count x X x Y x Z) of binary masks
+    chunkRows      : int
+        Number of input rows along the first axis read at a time
+    valueCounts    : numpy.ndarray
+        Voxel count of every label value for uint8/uint16 input, where 
+        label values are used as indices directly, None otherwise
+    labelMasks     : list[numpy.ndarray]
+        Binary mask of each label cropped to its bounding box
+    labelSlices    : list[tuple[slice]]
+        Bounding box of each label in the input grid
     labelVolume    : numpy.ndarray
         Voxel counts for each label (sorted descending)
 
@@ -50,50 +58,111 @@ License along with pySegmentationUpsampler. If not, see
 <http://www.gnu.org/licenses/>.
 """
 
-    def __init__(self, segImg):
+    def __init__(self, segImg, chunkSize = 2**22):
         """
         INIT Prepare label separation for SegmentedImage instance.
 
         DESCRIPTION:
             Initializes label processing from SegmentedImage container.
-            Identifies unique non-zero labels and preallocates storage.
+            Identifies unique non-zero labels slab by slab, so inputs 
+            such as memory-mapped arrays are never copied whole. Labels 
+            of uint8/uint16 input are found with a single bincount of 
+            the label values instead of sorting.
 
         INPUTS:
             segImg      : ImageBase.SegmentedImage
                 Container with multi-label matrix and spatial parameters
+            chunkSize   : int
+                Approximate number of voxels read at a time
         """
         self.segImg = segImg
+        _, gy, gz = np.shape(self.segImg.multiLabelMatrix)
+        self.chunkRows = max(1, chunkSize // max(1, gy*gz))
         
-        self.labels = np.unique(self.segImg.multiLabelMatrix)
-        if self.labels[0] == 0:
-            self.labels = self.labels[1:]
-
-        self.separateMatrix = np.zeros((len(self.labels), self.segImg.gx, self.segImg.gy, 
-                                        self.segImg.gz), dtype=int)
+        dtype = np.asarray(self.segImg.multiLabelMatrix[:0]).dtype
+        if dtype.kind == 'u' and dtype.itemsize <= 2:
+            self.valueCounts = np.zeros(np.iinfo(dtype).max + 1, dtype=int)
+            for _, slab in self.getSlabs():
+                self.valueCounts += np.bincount(slab.ravel(), 
+                                                minlength=len(self.valueCounts))
+            self.labels = np.flatnonzero(self.valueCounts[1:]).astype(dtype) + 1
+        else:
+            self.valueCounts = None
+            self.labels = np.unique(np.concatenate(
+                [np.unique(slab) for _, slab in self.getSlabs()]))
+            self.labels = self.labels[self.labels != 0]
+
+        self.labelMasks = []
+        self.labelSlices = []
         self.labelVolume = np.zeros(len(self.labels), dtype=int)
 
+    def getSlabs(self):
+        """Yield (start row, slab) pairs covering the input matrix."""
+        matrix = self.segImg.multiLabelMatrix
+        for start in range(0, max(1, np.shape(matrix)[0]), self.chunkRows):
+            yield start, np.asarray(matrix[start:start + self.chunkRows])
+
     def separateLabels(self):
         """
         SEPARATELABELS Isolate labels and calculate volumetric properties.
 
         DESCRIPTION:
             Processes multi-label matrix to:
-            1. Create binary masks for each unique label
-            2. Calculate voxel counts for each label
-            3. Sort labels by descending volume
+            1. Count the voxels and find the bounding box of every 
+               label in one pass over the slabs of the input
+            2. Create binary masks for each label within its box
+            3. Calculate voxel counts for each label
+            4. Sort labels by descending volume
         """
-        for i, label in enumerate(self.labels):
-            # Create a binary matrix where 1 corresponds to the current label
-            self.separateMatrix[i] = (self.segImg.multiLabelMatrix == label).astype(float)
-
-            # Calculate the sum of the binary matrix to get the label volume
-            self.labelVolume[i] = np.sum(self.separateMatrix[i])
+        labelNumber = len(self.labels)
+        volume = np.zeros(labelNumber + 1, dtype=int)
+        lower = np.full((labelNumber, 3), np.iinfo(int).max)
+        upper = np.zeros((labelNumber, 3), dtype=int)
+
+        for start, slab in self.getSlabs():
+            if self.valueCounts is not None:
+                # Label values index the bounding boxes directly
+                objects = find_objects(slab, int(self.labels[-1]) 
+                                       if labelNumber else 0)
+                objects = [objects[label - 1] for label in self.labels]
+            else:
+                # 0 marks background, i + 1 marks self.labels[i]
+                labelIndex = np.searchsorted(self.labels, slab) + 1
+                labelIndex[slab == 0] = 0
+
+                # Voxel counts and bounding boxes of all labels in the slab
+                volume += np.bincount(labelIndex.ravel(), 
+                                      minlength=labelNumber + 1)
+                objects = find_objects(labelIndex, labelNumber)
+
+            for i, slabSlice in enumerate(objects):
+                if slabSlice is None:
+                    continue
+                box = [(s.start, s.stop) for s in slabSlice]
+                box[0] = (box[0][0] + start, box[0][1] + start)
+                lower[i] = np.minimum(lower[i], [b[0] for b in box])
+                upper[i] = np.maximum(upper[i], [b[1] for b in box])
+
+        if self.valueCounts is not None:
+            self.labelVolume = self.valueCounts[self.labels]
+        else:
+            self.labelVolume = volume[1:]
+        self.labelSlices = [tuple(slice(int(lower[i, d]), int(upper[i, d])) 
+                                  for d in range(3)) 
+                            for i in range(labelNumber)]
+
+        for i, labelSlice in enumerate(self.labelSlices):
+            # Binary mask of the current label inside its bounding box
+            self.labelMasks.append(
+                np.asarray(self.segImg.multiLabelMatrix[labelSlice]) == 
+                self.labels[i])
 
         # Sort labels by volume in descending order
         sortedLabels = np.argsort(self.labelVolume)[::-1]
 
         # Use the sorted indices to rearrange attributes
-        self.separateMatrix = self.separateMatrix[sortedLabels]
+        self.labelMasks = [self.labelMasks[i] for i in sortedLabels]
+        self.labelSlices = [self.labelSlices[i] for i in sortedLabels]
         self.labelVolume = self.labelVolume[sortedLabels]
         self.labels = self.labels[sortedLabels]
 
@@ -105,7 +174,7 @@ License along with pySegmentationUpsampler. If not, see
             Transfers processed label data back to parent SegmentedImage
             instance for subsequent pipeline steps.
         """
-        self.segImg.setSeparateLabels(self.separateMatrix, 
+        self.segImg.setSeparateLabels(self.labelMasks, 
+                                    self.labelSlices,
                                     self.labelVolume, 
                                     self.labels)
-        #return np.float32(self.separateMatrix), self.labelVolume, self.labels
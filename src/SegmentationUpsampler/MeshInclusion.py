@@ -0,0 +1,90 @@
+import vtk
+import numpy as np
+from vtk.util import numpy_support
+
+"""
+Batched inside/outside testing of points against a surface mesh
+
+DESCRIPTION:
+    MeshInclusion evaluates the signed distance of many points to a
+    surface mesh with a single call into VTK. It uses the same
+    vtkImplicitPolyDataDistance function as a point-by-point
+    EvaluateFunction loop, so the values are identical, but the loop
+    over points runs in C++ instead of Python.
+
+USAGE:
+    distanceFilter = MeshInclusion.getDistanceFilter(polyData)
+    inside = MeshInclusion.insideMesh(distanceFilter, points)
+
+ABOUT:
+    author - Liangpu Liu, Rui Xu, Bradley Treeby
+    date - 18th Oct 2026
+    last update - 18th Oct 2026
+
+LICENSE:
+    This function is part of the pySegmentationUpsampler.
+    Copyright (C) 2024  Liangpu Liu, Rui Xu, and Bradley Treeby.
+
+This file is part of pySegmentationUpsampler, pySegmentationUpsampler
+is free software: you can redistribute it and/or modify it under the
+terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+pySegmentationUpsampler is distributed in the hope that it will be
+useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with pySegmentationUpsampler. If not, see
+<http://www.gnu.org/licenses/>.
+
+"""
+
+def getDistanceFilter(polyData):
+    """
+    GETDISTANCEFILTER Build the implicit distance function of a mesh.
+
+    INPUTS:
+        polyData    : vtk.vtkPolyData
+            Closed surface mesh
+
+    RETURNS:
+        vtk.vtkImplicitPolyDataDistance
+    """
+    distanceFilter = vtk.vtkImplicitPolyDataDistance()
+    distanceFilter.SetInput(polyData)
+    return distanceFilter
+
+def signedDistance(distanceFilter, points):
+    """
+    SIGNEDDISTANCE Signed distance of an (N,3) array of points.
+
+    INPUTS:
+        distanceFilter : vtk.vtkImplicitPolyDataDistance
+            Distance function from getDistanceFilter
+        points      : numpy.ndarray
+            (N,3) point coordinates in mesh space (x, y, z)
+
+    RETURNS:
+        numpy.ndarray : (N,) distances, negative inside the mesh
+    """
+    points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 3)
+    if len(points) == 0:
+        return np.zeros(0, dtype=np.float64)
+
+    # points must stay referenced while VTK reads the wrapped buffer
+    vtkPoints = numpy_support.numpy_to_vtk(points, deep=0)
+    vtkDistances = vtk.vtkDoubleArray()
+    distanceFilter.FunctionValue(vtkPoints, vtkDistances)
+    return numpy_support.vtk_to_numpy(vtkDistances).copy()
+
+def insideMesh(distanceFilter, points):
+    """
+    INSIDEMESH Test an (N,3) array of points for inclusion in a mesh.
+
+    RETURNS:
+        numpy.ndarray : (N,) boolean, True where the distance is < 0
+    """
+    return signedDistance(distanceFilter, points) < 0
@@ -1,6 +1,34 @@
 import numpy as np
-from scipy.signal import convolve
-from scipy.ndimage import gaussian_filter
+from scipy.ndimage import correlate, gaussian_filter
+from SegmentationUpsampler import ShapeMetrics
+from SegmentationUpsampler import IsoSearch
+
+# 6-connected surface kernels, total and normal to the X, Y, Z axes
+SURFACE_KERNEL = np.array([[[0,0,0],[0,-1,0],[0,0,0]],
+                           [[0,-1,0],[-1,6,-1],[0,-1,0]],
+                           [[0,0,0],[0,-1,0],[0,0,0]]])
+AXIAL_KERNELS = (np.array([[[0,0,0],[0,0,0],[0,0,0]],
+                           [[0,-1,0],[-1,4,-1],[0,-1,0]],
+                           [[0,0,0],[0,0,0],[0,0,0]]]),
+                 np.array([[[0,0,0],[0,-1,0],[0,0,0]],
+                           [[0,0,0],[-1,4,-1],[0,0,0]],
+                           [[0,0,0],[0,-1,0],[0,0,0]]]),
+                 np.array([[[0,0,0],[0,-1,0],[0,0,0]],
+                           [[0,-1,0],[0,4,0],[0,-1,0]],
+                           [[0,0,0],[0,-1,0],[0,0,0]]]))
+
+class SurfaceRatioSearch(IsoSearch.IsovalueSearch):
+    """Isovalue search on the AV ratio measured by sparseConvolution.
+
+    The surface pass overwrites the thresholded mask before its volume 
+    is summed, so the volume of each candidate shape is its area.
+    """
+
+    def getParameterAV(self, iso):
+        _, area = self.getShapeMetrics(iso)
+        area = np.asarray(area, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return area**(1/2)/area**(1/3)
 
 class ImagePreprocess:
     """
@@ -8,7 +36,7 @@ IMAGEPREPROCESS Geometric analysis and preprocessing for binary segmentation mas
 
 DESCRIPTION:
     Performs label-specific preprocessing including:
-    - Surface area/volume ratio calculations
+    - Surface area/volume ratio calculations (see ShapeMetrics)
     - Adaptive Gaussian smoothing parameter computation
     - Isovalue determination for mesh extraction
     - Image cropping and filtering
@@ -42,7 +70,7 @@ License along with pySegmentationUpsampler. If not, see
 
     """
 
-    def __init__(self, segImg, i, isotropoic = True):
+    def __init__(self, segImg, i, isotropoic = True, isoTolerance = None):
         """
         INIT Initialize preprocessing for specific label.
 
@@ -53,76 +81,63 @@ License along with pySegmentationUpsampler. If not, see
                 Index in binaryImgList
             isotropoic  : bool
                 Smoothing mode flag (True=isotropic)
+            isoTolerance : float or None
+                Tolerance of the golden-section isovalue search,
+                None for the 0.001-step scan
         """
         self.binaryImg = segImg.binaryImgList[i]
         self.segImg = segImg
-        self.array = np.int32(self.binaryImg.binImg)
-        self.originalImg = self.binaryImg.binImg
+        # Label mask cropped to its bounding box in the input grid
+        self.originalImg = self.binaryImg.labelMask
+        self.array = np.int32(self.originalImg)
         
         # Processing parameters
         self.sigma = 0        # Isotropic smoothing factor
         self.sigmaAnI = 0      # Anisotropic smoothing factors [x,y,z]
         self.isotropic = isotropoic  # Smoothing mode
         self.iso = 0          # Surface extraction threshold
+        self.isoTolerance = isoTolerance  # None = 0.001-step scan
 
         # Image data containers
         self.smoothMatrix = None   # Smoothed intensity field
         self.nonZeroShape = None   # Bounding box of non-zero region
         self.croppedMatrix = None  # Cropped region-of-interest
+        self.truncate = 4.0        # Gaussian kernel radius in sigmas
+
+    def getShapeMetrics(self):
+        """Measure volume, surface area and axial areas in one pass.
+
+        RETURNS:
+            tuple: (volume, surfaceArea, (Ax, Ay, Az))
+        """
+        return ShapeMetrics.computeShapeMetrics(self.array)
 
     def getVolume(self):
         """Calculate binary mask volume (voxel count)."""
-        return np.sum(np.concatenate(self.array))
+        return np.sum(self.array)
     
     def getSurfaceArea(self):
         """Calculate surface area using 3*3*3 kernel."""
-        surfaceAreaKernel = np.array([[[0,0,0],[0,-1,0],[0,0,0]],
-                                    [[0,-1,0],[-1,6,-1],[0,-1,0]],
-                                    [[0,0,0],[0,-1,0],[0,0,0]]])
-        surface = self.sparseConvolution(self.array, surfaceAreaKernel)
-        return np.sum(np.abs(np.concatenate(surface)))
+        surface = self.sparseConvolution(self.array, SURFACE_KERNEL)
+        return np.sum(np.abs(surface))
     
     def getAxialSurfaceArea(self):
         """Calculate axis-aligned surface areas (X,Y,Z directions)."""
-        # X-axis kernel
-        surfaceAreaKernel_X = np.array([[[0,0,0],[0,0,0],[0,0,0]],
-                                      [[0,-1,0],[-1,4,-1],[0,-1,0]],
-                                      [[0,0,0],[0,0,0],[0,0,0]]])
-        # Y-axis kernel                                    
-        surfaceAreaKernel_Y = np.array([[[0,0,0],[0,-1,0],[0,0,0]],
-                                      [[0,0,0],[-1,4,-1],[0,0,0]],
-                                      [[0,0,0],[0,-1,0],[0,0,0]]])
-        # Z-axis kernel
-        surfaceAreaKernel_Z = np.array([[[0,0,0],[0,-1,0],[0,0,0]],
-                                      [[0,-1,0],[0,4,0],[0,-1,0]],
-                                      [[0,0,0],[0,-1,0],[0,0,0]]])
-        
-        # Calculate directional surface areas
-        surface_X = self.sparseConvolution(self.array, surfaceAreaKernel_X)
-        surface_Y = self.sparseConvolution(self.array, surfaceAreaKernel_Y)
-        surface_Z = self.sparseConvolution(self.array, surfaceAreaKernel_Z)
-        
-        return (np.sum(np.abs(np.concatenate(surface_X))),
-                np.sum(np.abs(np.concatenate(surface_Y))),
-                np.sum(np.abs(np.concatenate(surface_Z))))
+        surfaces = [self.sparseConvolution(self.array, kernel)
+                    for kernel in AXIAL_KERNELS]
+        return tuple(np.sum(np.abs(surface)) for surface in surfaces)
     
     def sparseConvolution(self, array, kernel):
-        """Convolution that only consider non-zero voxels"""
-        outputArray = array
-        padArray = np.pad(array, pad_width=1, mode='constant', constant_values=0)
-        nonZeroLabels = np.nonzero(padArray)
-        nonZeroLabels = list(zip(*nonZeroLabels))
-        for voxel in nonZeroLabels:
-            x, y, z = voxel
-            val = 0
-            for i in range(3):
-                for j in range(3):
-                    for k in range(3):
-                        xi, yj, zk = x + i - 1, y + j - 1, z + k - 1
-                        val = val + padArray[xi, yj, zk] * kernel[i, j, k]
-            outputArray[x-1, y-1, z-1] = val
-        
-        return outputArray
+        """Convolution that only consider non-zero voxels.
+
+        The result is written back into array, so chained measurements 
+        see the output of the previous one. The automatic sigma and 
+        isovalue depend on this order.
+        """
+        surface = correlate(array, kernel, mode='constant', cval=0)
+        nonZero = array != 0
+        array[nonZero] = surface[nonZero]
+        return array
             
     def grossParameterAV(self):
         """Compute surface-to-volume ratio metric (√A/∛V)."""
@@ -158,20 +173,22 @@ License along with pySegmentationUpsampler. If not, see
         self.sigmaAnI = [self.sigma*Ax/M, self.sigma*Ay/M, self.sigma*Az/M]
         
     def computeIso(self):
-        """Iterative isovalue search for AV ratio preservation."""
+        """Isovalue search for AV ratio preservation.
+
+        Scans isovalues in steps of 0.001 up to 0.6, or runs a
+        golden-section search when isoTolerance is set. Both read
+        volume and surface area from one sort of croppedMatrix (see
+        IsoSearch).
+        """
         originalAV = self.grossParameterAV()
-        minDiff = 9999        
-        stepsize = 0.001
-
-        # Linear search through isovalues
-        isovalue = 0
-        while isovalue < 0.6:
-            isovalue += stepsize
-            self.array = np.int32(self.croppedMatrix >= isovalue)
-            thisAV = self.grossParameterAV()
-            if abs(thisAV - originalAV) < minDiff:
-                minDiff = abs(thisAV - originalAV)
-                self.iso = isovalue
+        searcher = SurfaceRatioSearch(self.croppedMatrix)
+
+        if self.isoTolerance is None:
+            self.iso = searcher.linearSearch(originalAV, stepsize=0.001,
+                                             upper=0.6)
+        else:
+            self.iso = searcher.goldenSectionSearch(originalAV, 0, 0.6,
+                                                    self.isoTolerance)
 
     def setSigma(self):
         """Apply computed or predefined sigma to BinaryImage."""
@@ -195,7 +212,38 @@ License along with pySegmentationUpsampler. If not, see
 
     def applyGaussianFilter(self, image):
         """Apply Gaussian smoothing with current sigma parameters."""
-        return gaussian_filter(image, sigma=self.binaryImg.sigma)
+        return gaussian_filter(image, sigma=self.binaryImg.sigma, 
+                               truncate=self.truncate)
+
+    def padLabels(self):
+        """Place the label mask in a box padded by the kernel radius.
+
+        The box extends the label's bounding box by the Gaussian kernel 
+        radius on each side, clipped to the input grid. Everything 
+        outside the box smooths to exactly zero, and reflection at a 
+        clipped side matches reflection at the grid edge, so smoothing 
+        the box gives the same values as smoothing the full image.
+
+        RETURNS:
+            tuple: (paddedImg, offset) with offset the input grid index 
+            of paddedImg[0, 0, 0]
+        """
+        sigma = np.broadcast_to(self.binaryImg.sigma, 3)
+        # Same kernel radius as scipy.ndimage.gaussian_filter
+        radius = [int(self.truncate * float(s) + 0.5) for s in sigma]
+        labelSlices = self.binaryImg.labelSlices
+        gridShape = self.binaryImg.gridShape
+
+        lower = np.array([max(labelSlices[d].start - radius[d], 0) 
+                          for d in range(3)])
+        upper = np.array([min(labelSlices[d].stop + radius[d], gridShape[d]) 
+                          for d in range(3)])
+
+        paddedImg = np.zeros(upper - lower, dtype=np.float32)
+        paddedImg[tuple(slice(labelSlices[d].start - lower[d], 
+                              labelSlices[d].stop - lower[d]) 
+                        for d in range(3))] = self.originalImg
+        return paddedImg, lower
     
     def cropLabels(self, image):
         """Crop image to minimal non-zero bounding box.
@@ -214,15 +262,31 @@ License along with pySegmentationUpsampler. If not, see
     def meshPreprocessing(self):
         """Full preprocessing pipeline:
         1. Sigma computation
-        2. Gaussian smoothing
-        3. ROI cropping
-        4. Isovalue determination
+        2. Padding of the label's bounding box by the kernel radius
+        3. Gaussian smoothing of the padded box
+        4. ROI cropping
+        5. Isovalue determination
         """
+        self.smoothLabel()
+        self.setIsovalue()
+
+    def smoothLabel(self):
+        """Steps 1-4 of meshPreprocessing, which depend on sigma only."""
         self.setSigma()
-        self.smoothMatrix = self.applyGaussianFilter(self.originalImg)
-        self.croppedMatrix, self.nonZeroShape = self.cropLabels(self.smoothMatrix)
+        paddedImg, offset = self.padLabels()
+        smoothedBox = self.applyGaussianFilter(paddedImg)
+        self.croppedMatrix, (lowerBound, upperBound) = self.cropLabels(smoothedBox)
         self.croppedMatrix =  np.ascontiguousarray(self.croppedMatrix)
-        self.setIsovalue()
+        self.nonZeroShape = (lowerBound + offset, upperBound + offset)
+
+        # Later stages read croppedMatrix through nonZeroShape, so the 
+        # full-grid smoothed field is only built on request
+        if not self.segImg.lowMemory:
+            self.smoothMatrix = np.zeros(self.binaryImg.gridShape, 
+                                         dtype=smoothedBox.dtype)
+            self.smoothMatrix[offset[0]:offset[0] + smoothedBox.shape[0], 
+                              offset[1]:offset[1] + smoothedBox.shape[1], 
+                              offset[2]:offset[2] + smoothedBox.shape[2]] = smoothedBox
 
     def updateImg(self):
         """Store processed data in BinaryImage container."""
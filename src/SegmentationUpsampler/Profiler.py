@@ -0,0 +1,166 @@
+import contextlib
+import logging
+import os
+import threading
+import time
+
+class Profiler:
+    """
+PROFILER Per-stage timing and memory records of the pipeline.
+
+DESCRIPTION:
+    Collects one record per pipeline stage and label while upsample()
+    runs. Each record is a dict with:
+    - stage        : "separation", "compilation", "preprocessing",
+                     "extraction", "voxelization" or "fillGaps".
+                     "compilation" is the time spent compiling or
+                     loading Numba kernels before their first use
+    - label        : label value, None for whole-image stages
+    - seconds      : wall time
+    - memoryDelta  : change of the resident set size in bytes, None
+                     where /proc is not available. Stages running in
+                     parallel threads share the process, so their
+                     deltas overlap
+    - counts       : dict of stage sizes, e.g. voxels, triangles and
+                     boundaryPoints
+    Every record is logged to the "SegmentationUpsampler" logger and
+    passed to the callback, if given, as soon as the stage finishes.
+    Records from worker processes are passed on when the label returns.
+
+USAGE:
+    profiler = Profiler(callback=print)
+    newMatrix = upsample(multiLabelMatrix, scale, profiler=profiler)
+    print(profiler)
+    summary = profiler.getSummary()
+
+ATTRIBUTES:
+    records      : list[dict]
+        Records in the order the stages finished
+    callback     : callable or None
+        Called with each record
+    logger       : logging.Logger
+        Logger the records are emitted to
+    level        : int
+        Logging level of the records
+
+ABOUT:
+    author         : Liangpu Liu, Rui Xu, Bradley Treeby
+    date           : 18th Oct 2026
+    last update    : 18th Oct 2026
+
+LICENSE:
+    This function is part of the pySegmentationUpsampler.
+    Copyright (C) 2024  Liangpu Liu, Rui Xu, and Bradley Treeby.
+
+This file is part of pySegmentationUpsampler, pySegmentationUpsampler
+is free software: you can redistribute it and/or modify it under the
+terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+pySegmentationUpsampler is distributed in the hope that it will be
+useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with pySegmentationUpsampler. If not, see
+<http://www.gnu.org/licenses/>.
+    """
+
+    def __init__(self, callback = None, logger = None, level = logging.DEBUG):
+        """
+        INIT Create an empty profiler.
+
+        INPUTS:
+            callback    : callable or None
+                Called with each record
+            logger      : logging.Logger or None
+                Logger of the records, "SegmentationUpsampler" if None
+            level       : int
+                Logging level of the records
+        """
+        self.records = []
+        self.callback = callback
+        self.logger = logger or logging.getLogger("SegmentationUpsampler")
+        self.level = level
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def getRSS():
+        """Resident set size of the process in bytes, None if unknown."""
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    @contextlib.contextmanager
+    def stage(self, stage, label = None):
+        """
+        STAGE Time the enclosed code as one stage of a label.
+
+        DESCRIPTION:
+            Yields the counts dict of the record, to be filled by the
+            enclosed code. The record is added when the block exits
+            without an exception.
+        """
+        counts = {}
+        startRSS = self.getRSS()
+        start = time.perf_counter()
+        yield counts
+        seconds = time.perf_counter() - start
+        endRSS = self.getRSS()
+        memoryDelta = None
+        if startRSS is not None and endRSS is not None:
+            memoryDelta = endRSS - startRSS
+        self.addRecord(dict(stage=stage, label=label, seconds=seconds,
+                            memoryDelta=memoryDelta, counts=counts))
+
+    def addRecord(self, record):
+        """Store, log and pass on a record."""
+        with self.lock:
+            self.records.append(record)
+        if self.logger.isEnabledFor(self.level):
+            counts = " ".join("%s=%d" % item
+                              for item in record["counts"].items())
+            self.logger.log(self.level, "%s label=%s %.3f s %s",
+                            record["stage"], record["label"],
+                            record["seconds"], counts)
+        if self.callback is not None:
+            self.callback(record)
+
+    def getSummary(self):
+        """
+        GETSUMMARY Totals of the records per stage.
+
+        RETURNS:
+            dict: stage -> dict of calls, seconds, memoryDelta (sum of
+            the known deltas) and counts (summed), in pipeline order
+        """
+        summary = {}
+        for record in self.records:
+            total = summary.setdefault(record["stage"],
+                                       dict(calls=0, seconds=0.0,
+                                            memoryDelta=0, counts={}))
+            total["calls"] += 1
+            total["seconds"] += record["seconds"]
+            total["memoryDelta"] += record["memoryDelta"] or 0
+            for name, count in record["counts"].items():
+                total["counts"][name] = total["counts"].get(name, 0) + count
+        return summary
+
+    def getTotalSeconds(self):
+        """Sum of the wall times of all records."""
+        return sum(record["seconds"] for record in self.records)
+
+    def __str__(self):
+        lines = ["%-14s %6s %10s %12s  %s" % ("stage", "calls", "seconds",
+                                             "memory MiB", "counts")]
+        for stage, total in self.getSummary().items():
+            counts = " ".join("%s=%d" % item
+                              for item in total["counts"].items())
+            lines.append("%-14s %6d %10.3f %12.1f  %s" % (
+                stage, total["calls"], total["seconds"],
+                total["memoryDelta"]/2**20, counts))
+        return "\n".join(lines)
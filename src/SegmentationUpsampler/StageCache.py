@@ -0,0 +1,130 @@
+from collections import Counter, OrderedDict
+
+class StageCache:
+    """
+STAGECACHE Least recently used cache of pipeline stage results.
+
+DESCRIPTION:
+    Stores the results of pipeline stages under hashable keys together
+    with their size in bytes. When the total size exceeds the memory
+    ceiling, the least recently used entries are evicted first. A
+    result larger than the ceiling is not stored. The first element of
+    each key names the stage, and hits and misses are counted per stage.
+
+USAGE:
+    cache = StageCache(maxBytes=2**30)
+    value = cache.get(("smooth", label, sigma))
+    if value is None:
+        value = ...
+        cache.put(("smooth", label, sigma), value, value.nbytes)
+
+ATTRIBUTES:
+    maxBytes     : int or None
+        Memory ceiling in bytes, None for no ceiling
+    nbytes       : int
+        Total size of the stored entries
+    hits         : collections.Counter
+        Number of cache hits per stage
+    misses       : collections.Counter
+        Number of cache misses per stage
+
+ABOUT:
+    author         : Liangpu Liu, Rui Xu, Bradley Treeby
+    date           : 18th Oct 2026
+    last update    : 18th Oct 2026
+
+LICENSE:
+    This function is part of the pySegmentationUpsampler.
+    Copyright (C) 2024  Liangpu Liu, Rui Xu, and Bradley Treeby.
+
+This file is part of pySegmentationUpsampler, pySegmentationUpsampler
+is free software: you can redistribute it and/or modify it under the
+terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+pySegmentationUpsampler is distributed in the hope that it will be
+useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with pySegmentationUpsampler. If not, see
+<http://www.gnu.org/licenses/>.
+    """
+
+    def __init__(self, maxBytes = 2**30):
+        """
+        INIT Create an empty cache.
+
+        INPUTS:
+            maxBytes    : int or None
+                Memory ceiling in bytes, None for no ceiling
+        """
+        self.entries = OrderedDict()   # key -> (value, nbytes)
+        self.nbytes = 0
+        self.hits = Counter()
+        self.misses = Counter()
+        self.setMaxBytes(maxBytes)
+
+    def setMaxBytes(self, maxBytes):
+        """Change the memory ceiling, evicting entries to meet it."""
+        if not (maxBytes is None or
+                (isinstance(maxBytes, int) and not isinstance(maxBytes, bool)
+                 and maxBytes >= 0)):
+            raise ValueError("MaxBytes should be an integer >= 0 or None.")
+        self.maxBytes = maxBytes
+        self.evict()
+
+    def get(self, key):
+        """
+        GET Look up a stage result and mark it as recently used.
+
+        RETURNS:
+            The stored value, or None if key is not in the cache
+        """
+        if key not in self.entries:
+            self.misses[key[0]] += 1
+            return None
+        self.hits[key[0]] += 1
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+
+    def put(self, key, value, nbytes):
+        """
+        PUT Store a stage result of nbytes bytes.
+
+        RETURNS:
+            bool: True if the value was stored
+        """
+        self.discard(key)
+        if self.maxBytes is not None and nbytes > self.maxBytes:
+            return False
+        self.entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        self.evict()
+        return True
+
+    def discard(self, key):
+        """Remove key from the cache if present."""
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+
+    def evict(self):
+        """Remove least recently used entries until within maxBytes."""
+        while self.maxBytes is not None and self.nbytes > self.maxBytes:
+            _, (_, nbytes) = self.entries.popitem(last=False)
+            self.nbytes -= nbytes
+
+    def clear(self):
+        """Remove all entries and reset the hit and miss counts."""
+        self.entries.clear()
+        self.nbytes = 0
+        self.hits.clear()
+        self.misses.clear()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
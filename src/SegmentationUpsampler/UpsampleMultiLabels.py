@@ -1,12 +1,13 @@
+import contextlib
+import copy
+import os
+import multiprocessing
 import numpy as np
-from SegmentationUpsampler import Extractor
-from SegmentationUpsampler import FillGaps
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from SegmentationUpsampler import LabelSeparater
-from SegmentationUpsampler import Voxelizer
-from SegmentationUpsampler import VoxelizerNumba
 from SegmentationUpsampler import ImageBase
-from SegmentationUpsampler import FillGapsNumba
 from SegmentationUpsampler import Preprocess
+from SegmentationUpsampler import Profiler
 
 """
 Upsamples a labelled image
@@ -16,11 +17,29 @@ DESCRIPTION:
     method with Numba-accelerated processing for efficient voxelization
     and gap filling.
 
+    The Numba kernels are compiled on their first call and cached on 
+    disk, so later processes load them instead of compiling. Call 
+    warmup() to compile or load them ahead of the first upsample(), 
+    e.g. when a worker process starts. upsample() warms up the kernels 
+    it is about to use, so with a profiler their compile time is 
+    recorded as a separate "compilation" stage instead of being part 
+    of the first voxelization or gap filling.
+
+    The isosurface extractor, voxelizers and gap fillers are imported 
+    when first used, so importing this module, e.g. for ValidateInputs, 
+    loads neither vtk nor numba, and upsample() only loads the engine 
+    selected by NB, engine and fillGaps.
+
 USAGE:
     call from this function:
     newMatrix = upsample(
-        multiLabelMatrix, scale, sigma, iso, spacing, fillGaps, NB
+        multiLabelMatrix, scale, sigma, iso, spacing, fillGaps, NB,
+        workers, backend, lowMemory, engine, tileSize, outputPath, out, 
+        dtype, compact, profiler, verbose, meshRepair, meshSimplify, 
+        isoTolerance
     )
+    newMatrix, lookupTable = upsample(..., compact=True)
+    warmup(voxelizer, gapFiller, dtypes, profiler, engine)
     call from Matlab:
     newMatrix = pyrunfile(codeDirect + "/UpsampleMultiLabels.py", ...
                           "newMatrix", ...
@@ -34,7 +53,10 @@ USAGE:
 
 INPUTS:
     multiLabelMatrix 
-            - 3D numpy array of segmented image
+            - 3D numpy array of integer or floating point labels, 
+              integer labels are used without conversion. May be a 
+              memory map (np.memmap or np.load(..., mmap_mode='r')), 
+              which is read in slabs and never copied whole
     scale   - list of 3 floating numbers, scale of upsampling
     sigma   - floating number >= 0, Gaussian smoothing parameter, 
               set to -1 for automatic calculation
@@ -46,10 +68,69 @@ INPUTS:
               connecting objects (default: False)
     NB      - boolean, enable Numba acceleration for voxelization 
               and gap filling (default: True)
+    workers - integer >= 1, number of labels processed in parallel
+              (default: 1)
+    backend - "process" or "thread", pool used when workers > 1. 
+              Process workers are spawned, so scripts using them need 
+              an if __name__ == "__main__" guard (default: "process")
+    lowMemory 
+            - boolean, keep only the cropped smoothed block of each 
+              label instead of a full-size smoothed image (default: True)
+    engine  - "distance" or "scanline", how voxels near the surface are 
+              tested against the mesh. "distance" queries the signed 
+              distance of each voxel, "scanline" counts ray crossings 
+              along each output row, which is faster but treats voxels 
+              exactly on the surface or beside open mesh edges 
+              differently (default: "distance")
+    tileSize 
+            - integer >= 1, voxelize and gap fill the output in slabs of 
+              this many rows along the first axis, so intermediate 
+              arrays scale with the slab instead of the volume. Label 
+              meshes are extracted once and kept for all slabs, labels 
+              run in a thread pool when workers > 1 and gap filling 
+              always uses the Numba kernels (default: None, no tiling)
+    outputPath 
+            - path of a .npy file to write the output into as a memory 
+              map instead of holding it in memory (default: None)
+    out     - writable integer or floating point array of the output 
+              shape, e.g. a memory map, to write the output into 
+              instead of allocating it (default: None)
+    dtype   - data type of the output, ignored if out is given 
+              (default: None, the smallest type holding all labels)
+    compact - boolean, write the labels as dense indices 1..L in 
+              ascending label order and also return the lookup table 
+              from index to label (default: False)
+    profiler 
+            - Profiler.Profiler, filled with the time, memory change 
+              and sizes of every stage of every label, see Profiler 
+              (default: None, no profiling)
+    verbose - boolean, print the sigma and isovalue of each label and 
+              the end of gap filling (default: True)
+    meshRepair 
+            - "always", "auto" or "never", fill small holes and merge 
+              duplicate points of each label mesh: always, only when the 
+              extracted surface is not watertight, or never 
+              (default: "always")
+    meshSimplify 
+            - None, "decimate" or "smooth", reduce each label mesh with 
+              quadric decimation or smooth it with a windowed sinc 
+              filter before voxelization, moving the surface by at most 
+              half the smallest output voxel. Fewer triangles speed up 
+              voxelization at the cost of small boundary changes 
+              (default: None)
+    isoTolerance 
+            - None or floating number > 0, with iso = -1 find the 
+              isovalue by a golden-section search to within this 
+              tolerance instead of scanning steps of 0.001 
+              (default: None, step scan)
     
 OUTPUTS:
     newMatrix
-            - upsampled segmented matrix
+            - upsampled segmented matrix, out or the memory map at 
+              outputPath if given
+    lookupTable
+            - only returned in compact mode, lookupTable[v] is the label 
+              written as v, lookupTable[0] = 0
 
 ABOUT:
     author - Liangpu Liu, Rui Xu, Bradley Treeby
@@ -77,13 +158,19 @@ License along with pySegmentationUpsampler. If not, see
 
 """
 
-def ValidateInputs(multiLabelMatrix, sigma, scale, spacing, iso, fillGaps, NB):
+def ValidateInputs(multiLabelMatrix, sigma, scale, spacing, iso, fillGaps, NB,
+                   workers = 1, backend = "process", lowMemory = True,
+                   engine = "distance", tileSize = None, outputPath = None,
+                   out = None, dtype = None, compact = False, 
+                   profiler = None, verbose = True, meshRepair = "always", 
+                   meshSimplify = None, isoTolerance = None):
 
     if not (isinstance(multiLabelMatrix, np.ndarray) and 
             multiLabelMatrix.ndim == 3 and 
-            multiLabelMatrix.dtype in [np.float32, np.float64]):
+            (multiLabelMatrix.dtype in [np.float32, np.float64] or 
+             np.issubdtype(multiLabelMatrix.dtype, np.integer))):
         raise ValueError("MultiLabelMatrix should be a 3D numpy array of " +
-                         "floating numbers.")
+                         "integer or floating numbers.")
     
     if not (isinstance(sigma, (float, int)) and (sigma >= 0 or sigma == -1)):
         raise ValueError("Sigma should be a floating number >= 0, set to -1 to generate sigma automatically.")
@@ -105,45 +192,384 @@ def ValidateInputs(multiLabelMatrix, sigma, scale, spacing, iso, fillGaps, NB):
     if not isinstance(NB, bool):
         raise ValueError("NB should be a boolean value.")
     
+    if not (isinstance(workers, int) and not isinstance(workers, bool) and 
+            workers >= 1):
+        raise ValueError("Workers should be an integer >= 1.")
+    
+    if backend not in ("process", "thread"):
+        raise ValueError("Backend should be 'process' or 'thread'.")
+    
+    if not isinstance(lowMemory, bool):
+        raise ValueError("LowMemory should be a boolean value.")
+    
+    if engine not in ("distance", "scanline"):
+        raise ValueError("Engine should be 'distance' or 'scanline'.")
+    
+    if not (tileSize is None or 
+            (isinstance(tileSize, int) and not isinstance(tileSize, bool) and 
+             tileSize >= 1)):
+        raise ValueError("TileSize should be an integer >= 1 or None.")
+    
+    if not (outputPath is None or isinstance(outputPath, (str, os.PathLike))):
+        raise ValueError("OutputPath should be a path or None.")
+    
+    if not (out is None or 
+            (isinstance(out, np.ndarray) and out.flags.writeable and 
+             (np.issubdtype(out.dtype, np.integer) or 
+              np.issubdtype(out.dtype, np.floating)))):
+        raise ValueError("Out should be a writable numeric numpy array or None.")
+    
+    if out is not None and outputPath is not None:
+        raise ValueError("Only one of out and outputPath can be given.")
+    
+    if dtype is not None:
+        try:
+            dtype = np.dtype(dtype)
+        except TypeError:
+            dtype = None
+        if dtype is None or not (np.issubdtype(dtype, np.integer) or 
+                                 np.issubdtype(dtype, np.floating)):
+            raise ValueError("Dtype should be an integer or floating " +
+                             "numpy data type or None.")
+    
+    if not isinstance(compact, bool):
+        raise ValueError("Compact should be a boolean value.")
+    
+    if not (profiler is None or isinstance(profiler, Profiler.Profiler)):
+        raise ValueError("Profiler should be a Profiler or None.")
+    
+    if not isinstance(verbose, bool):
+        raise ValueError("Verbose should be a boolean value.")
+    
+    if meshRepair not in ("always", "auto", "never"):
+        raise ValueError("MeshRepair should be 'always', 'auto' or 'never'.")
+    
+    if meshSimplify not in (None, "decimate", "smooth"):
+        raise ValueError("MeshSimplify should be None, 'decimate' or 'smooth'.")
+    
+    if not (isoTolerance is None or 
+            (isinstance(isoTolerance, (float, int)) and 
+             not isinstance(isoTolerance, bool) and isoTolerance > 0)):
+        raise ValueError("IsoTolerance should be a floating number > 0 or None.")
+    
     return True
 
 
-def upsample(multiLabelMatrix, scale, sigma = -1, iso = -1, spacing = [1, 1, 1], fillGaps = False, NB = True):
-    
-    ValidateInputs(multiLabelMatrix, sigma, scale, spacing, iso, fillGaps, NB)
+def stage(profiler, name, label = None):
+    """
+    Profiler stage of the given name, or an unrecorded stage without a 
+    profiler. Both yield the counts dict of the stage.
+    """
+    if profiler is None:
+        return contextlib.nullcontext({})
+    return profiler.stage(name, label)
+
+
+def warmup(voxelizer = True, gapFiller = True, dtypes = (np.uint8,), 
+           profiler = None, engine = "distance"):
+    """
+    Compile, or load from the disk cache, the Numba kernels of the 
+    voxelizer of engine (the "distance" kernel is used with NB, the 
+    "scanline" kernels always) for float32 smoothed fields, and of the 
+    gap filler (used with NB or tileSize and fillGaps) for output 
+    grids of dtypes. The time is recorded as a "compilation" stage 
+    with the number of kernel versions compiled or loaded, 0 if all 
+    were ready.
+
+    RETURNS:
+        kernels - number of kernel versions compiled or loaded
+    """
+    if voxelizer and engine == "scanline":
+        from SegmentationUpsampler import VoxelizerScanline as voxelizerModule
+    elif voxelizer:
+        from SegmentationUpsampler import VoxelizerNumba as voxelizerModule
+    if gapFiller:
+        from SegmentationUpsampler import FillGapsNumba
+
+    with stage(profiler, "compilation") as counts:
+        kernels = 0
+        if voxelizer:
+            kernels += voxelizerModule.warmup((np.float32,))
+        if gapFiller:
+            kernels += FillGapsNumba.warmup(dtypes)
+        counts.update(kernels=kernels)
+    return kernels
+
+
+def getVoxelizerClass(NB, engine = "distance"):
+    """Voxelizer class of the engine, importing its module on first use."""
+    if engine == "scanline":
+        from SegmentationUpsampler import VoxelizerScanline
+        return VoxelizerScanline.MeshVoxelizerScanline
+    if NB:
+        from SegmentationUpsampler import VoxelizerNumba
+        return VoxelizerNumba.MeshVoxelizerNumba
+    from SegmentationUpsampler import Voxelizer
+    return Voxelizer.MeshVoxelizer
+
+
+def getGapFillerClass(NB):
+    """Gap filler class, importing its module on first use."""
+    if NB:
+        from SegmentationUpsampler import FillGapsNumba
+        return FillGapsNumba.FillGaps
+    from SegmentationUpsampler import FillGaps
+    return FillGaps.FillGaps
+
+
+def upsampleLabel(segImg, i, NB, engine = "distance", profiler = None):
+    """
+    Run preprocessing, isosurface extraction and voxelization for one 
+    label. The label is voxelized into its own block instead of 
+    segImg.newImg, so labels can be processed in any order.
+
+    RETURNS:
+        block   - uint8 array on the output grid, 1 inside the label
+        offset  - output grid index of block[0, 0, 0]
+    """
+    prepareLabel(segImg, i, profiler)
+    return voxelizeLabel(segImg, i, NB, engine, profiler=profiler)
 
-    segImg = ImageBase.SegmentedImage(multiLabelMatrix, sigma, scale, spacing, iso)
 
-    labelSeparationInstance = LabelSeparater.LabelSeparation(segImg)
-    labelSeparationInstance.separateLabels()
-    labelSeparationInstance.updateImg()
+def prepareLabel(segImg, i, profiler = None):
+    """
+    Run preprocessing and isosurface extraction for one label, storing 
+    the cropped smoothed block and the mesh in its BinaryImage.
+    """
+    from SegmentationUpsampler import Extractor
 
-    for i in range(segImg.getLabelNumber()):
-        preprocesser = Preprocess.ImagePreprocess(segImg, i, False)
+    binImg = segImg.binaryImgList[i]
+    with stage(profiler, "preprocessing", binImg.label) as counts:
+        preprocesser = Preprocess.ImagePreprocess(segImg, i, False, 
+                                                  segImg.isoTolerance)
         preprocesser.meshPreprocessing()
         preprocesser.updateImg()
+        counts.update(voxels=int(segImg.labelVolume[i]), 
+                      smoothedVoxels=int(binImg.croppedImg.size))
 
-
-        isosurfaceExtractor = Extractor.IsosurfaceExtractor(segImg, i)
+    with stage(profiler, "extraction", binImg.label) as counts:
+        # The voxelizers only read polyData
+        isosurfaceExtractor = Extractor.IsosurfaceExtractor(segImg, i, 
+                                                            meshArrays=False)
         isosurfaceExtractor.extractIsosurface()
         isosurfaceExtractor.updateImg()
+        counts.update(triangles=binImg.polyData.GetNumberOfPolys(), 
+                      points=binImg.polyData.GetNumberOfPoints())
+
+
+def voxelizeLabel(segImg, i, NB, engine = "distance", rows = None, 
+                  profiler = None):
+    """
+    Voxelize the mesh of a prepared label into its own block, limited 
+    to the output rows (start, stop) along the first axis if given.
+
+    RETURNS:
+        block   - uint8 array on the output grid, 1 inside the label
+        offset  - output grid index of block[0, 0, 0]
+    """
+    voxelizerClass = getVoxelizerClass(NB, engine)
+    with stage(profiler, "voxelization", 
+               segImg.binaryImgList[i].label) as counts:
+        voxelizer = voxelizerClass(segImg, i)
+        voxelizer.setLocalBackground(rows)
+        if voxelizer.background.size:
+            voxelizer.voxeliseMesh()
+        counts.update(voxelizer.getCounts())
+
+    return voxelizer.background, voxelizer.offset
+
+
+def mergeLabel(segImg, i, block, offset):
+    """
+    Write the voxelized block of label i into segImg.newImg. Merging 
+    blocks in label order (descending volume) gives the same output as 
+    voxelizing every label directly into newImg.
+    """
+    mergeBlock(segImg.newImg, segImg.outputLabels[i], block, offset)
+
+
+def mergeBlock(newImg, label, block, offset):
+    """
+    Write label into newImg where block is 1, with block[0, 0, 0] at 
+    index offset of newImg.
+    """
+    region = tuple(slice(offset[d], min(offset[d] + block.shape[d], 
+                                        newImg.shape[d])) 
+                   for d in range(3))
+    block = block[tuple(slice(0, r.stop - r.start) for r in region)]
+    newImg[region][block == 1] = label
+
+
+def upsampleTiled(segImg, NB, engine, tileSize, fillGaps, workers, 
+                  profiler = None):
+    """
+    Upsample all labels slab by slab along the first output axis. Each 
+    label is preprocessed and meshed once, then every slab is voxelized 
+    label by label, gap filled and copied into segImg.newImg. With gap 
+    filling, a slab carries one extra row on each side as halo: the row 
+    before is copied from the finished output, the row after is 
+    voxelized but left to the next slab. Slabs are processed in raster 
+    order, so the output matches untiled processing.
+    """
+    labelIndices = range(segImg.getLabelNumber())
+    newImg = segImg.newImg
+    halo = 1 if fillGaps else 0
+    gapFiller = getGapFillerClass(True)(segImg) if fillGaps else None
+
+    with ThreadPoolExecutor(workers) as executor:
+        list(executor.map(lambda i: prepareLabel(segImg, i, profiler), 
+                          labelIndices))
+
+        for start in range(0, newImg.shape[0], tileSize):
+            stop = min(start + tileSize, newImg.shape[0])
+            lower = max(start - halo, 0)
+            upper = min(stop + halo, newImg.shape[0])
+
+            tile = np.zeros((upper - lower,) + newImg.shape[1:], 
+                            dtype=newImg.dtype)
+            tile[:start - lower] = newImg[lower:start]
+
+            results = executor.map(
+                lambda i: voxelizeLabel(segImg, i, NB, engine, 
+                                        (start, upper), profiler), 
+                labelIndices)
+            for i, (block, offset) in zip(labelIndices, results):
+                mergeBlock(tile, segImg.outputLabels[i], block, 
+                           (offset[0] - lower, offset[1], offset[2]))
+
+            if gapFiller is not None:
+                with stage(profiler, "fillGaps") as counts:
+                    tile = gapFiller.fillBlock(tile, lower, start - lower, 
+                                               stop - lower)
+                    counts.update(voxels=int(stop - start)*tile[0].size)
+            newImg[start:stop] = tile[start - lower:stop - lower]
+
+    if gapFiller is not None and segImg.verbose:
+        print("Zeros filled")
+
+
+_workerImg = None
+_workerWarm = False
+
+def _initWorker(segImg):
+    global _workerImg
+    _workerImg = segImg
+
+def _upsampleLabelWorker(i, NB, engine, profile):
+    # vtk objects cannot be sent back to the parent process, so only 
+    # the numpy results of the label are returned, with the profiling 
+    # records for the parent profiler
+    global _workerWarm
+    profiler = Profiler.Profiler() if profile else None
+    if not _workerWarm:
+        if NB or engine == "scanline":
+            warmup(True, False, profiler=profiler, engine=engine)
+        _workerWarm = True
+    block, offset = upsampleLabel(_workerImg, i, NB, engine, profiler)
+    binImg = _workerImg.binaryImgList[i]
+    records = profiler.records if profile else []
+    return (block, offset, binImg.sigma, binImg.iso, binImg.smoothedImg, 
+            binImg.croppedImg, binImg.bounds, records)
+
+def _workerImage(segImg):
+    # Shallow copy without the full-size arrays the label pipeline does 
+    # not read, to keep the data sent to each worker small
+    workerImg = copy.copy(segImg)
+    workerImg.multiLabelMatrix = None
+    workerImg.newImg = None
+    return workerImg
+
+
+def upsample(multiLabelMatrix, scale, sigma = -1, iso = -1, spacing = [1, 1, 1], fillGaps = False, NB = True,
+             workers = 1, backend = "process", lowMemory = True, 
+             engine = "distance", tileSize = None, outputPath = None, 
+             out = None, dtype = None, compact = False, profiler = None, 
+             verbose = True, meshRepair = "always", meshSimplify = None, 
+             isoTolerance = None):
+    
+    ValidateInputs(multiLabelMatrix, sigma, scale, spacing, iso, fillGaps, NB,
+                   workers, backend, lowMemory, engine, tileSize, outputPath, 
+                   out, dtype, compact, profiler, verbose, meshRepair, 
+                   meshSimplify, isoTolerance)
+
+    # The output grid is allocated once the labels are known
+    segImg = ImageBase.SegmentedImage(multiLabelMatrix, sigma, scale, spacing, iso,
+                                      lowMemory, dtype=None, verbose=verbose, 
+                                      meshRepair=meshRepair, 
+                                      meshSimplify=meshSimplify, 
+                                      isoTolerance=isoTolerance)
+
+    with stage(profiler, "separation") as counts:
+        labelSeparationInstance = LabelSeparater.LabelSeparation(segImg)
+        labelSeparationInstance.separateLabels()
+        labelSeparationInstance.updateImg()
+        counts.update(voxels=int(np.size(multiLabelMatrix)), 
+                      labels=segImg.getLabelNumber())
+
+    lookupTable = segImg.setOutputLabels(compact)
+    segImg.allocateNewImg(dtype, outputPath, out)
+
+    labelIndices = range(segImg.getLabelNumber())
 
-        if NB:
-            voxelizer = VoxelizerNumba.MeshVoxelizerNumba(segImg, i)
-        else:
-            voxelizer = Voxelizer.MeshVoxelizer(segImg, i)
+    # Worker processes load their own voxelizer kernels, the scanline 
+    # engine and tiled gap filling always use Numba
+    numbaVoxelizer = ((NB or engine == "scanline") and 
+                      (tileSize is not None or workers == 1 or 
+                       backend == "thread"))
+    numbaGapFiller = fillGaps and (NB or tileSize is not None)
+    if numbaVoxelizer or numbaGapFiller:
+        warmup(numbaVoxelizer, numbaGapFiller, (segImg.newImg.dtype,), 
+               profiler, engine)
 
-        voxelizer.voxeliseMesh()
-        voxelizer.updateImg()
+    if tileSize is not None:
+        upsampleTiled(segImg, NB, engine, tileSize, fillGaps, workers, 
+                      profiler)
+        fillGaps = False
+    elif workers == 1:
+        for i in labelIndices:
+            block, offset = upsampleLabel(segImg, i, NB, engine, profiler)
+            mergeLabel(segImg, i, block, offset)
+    elif backend == "thread":
+        with ThreadPoolExecutor(workers) as executor:
+            results = executor.map(lambda i: upsampleLabel(segImg, i, NB, 
+                                                             engine, 
+                                                             profiler), 
+                                   labelIndices)
+            for i, (block, offset) in zip(labelIndices, results):
+                mergeLabel(segImg, i, block, offset)
+    else:
+        # Forking after Numba's TBB thread pool has run hangs the 
+        # parent at exit, so workers start from a fresh interpreter
+        with ProcessPoolExecutor(workers, 
+                                 mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_initWorker, 
+                                 initargs=(_workerImage(segImg),)) as executor:
+            results = executor.map(_upsampleLabelWorker, labelIndices, 
+                                   [NB] * len(labelIndices), 
+                                   [engine] * len(labelIndices), 
+                                   [profiler is not None] * len(labelIndices))
+            for i, result in zip(labelIndices, results):
+                (block, offset, labelSigma, labelIso, smoothed, cropped, 
+                 bounds, records) = result
+                for record in records:
+                    profiler.addRecord(record)
+                binImg = segImg.binaryImgList[i]
+                binImg.sigma, binImg.iso = labelSigma, labelIso
+                binImg.setPreprocessedImg(smoothed, cropped, bounds)
+                mergeLabel(segImg, i, block, offset)
 
     if fillGaps:
-        if NB:
-            gapFiller = FillGapsNumba.FillGaps(segImg)
-        else:
-            gapFiller = FillGaps.FillGaps(segImg)
-        gapFiller.fillZeros()
-        gapFiller.updateImg()
+        gapFillerClass = getGapFillerClass(NB)
+        with stage(profiler, "fillGaps") as counts:
+            gapFiller = gapFillerClass(segImg)
+            gapFiller.fillZeros()
+            gapFiller.updateImg()
+            counts.update(voxels=int(segImg.newImg.size))
 
     newMatrix = segImg.newImg
+    if isinstance(newMatrix, np.memmap):
+        newMatrix.flush()
 
+    if compact:
+        return newMatrix, lookupTable
     return newMatrix
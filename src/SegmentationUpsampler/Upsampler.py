@@ -0,0 +1,228 @@
+from SegmentationUpsampler import ImageBase
+from SegmentationUpsampler import LabelSeparater
+from SegmentationUpsampler import Preprocess
+from SegmentationUpsampler import StageCache
+from SegmentationUpsampler import UpsampleMultiLabels
+from SegmentationUpsampler.UpsampleMultiLabels import stage
+
+class Upsampler:
+    """
+UPSAMPLER Stateful upsampling of one labelled image.
+
+DESCRIPTION:
+    Upsamples the same image repeatedly, e.g. in a sweep over sigma and
+    iso, reusing the results of earlier calls. The pipeline stages are
+    cached in a StageCache:
+    - ("labels",) : separated labels, which depend on the image only
+    - ("smooth", label, sigma) : sigma used, cropped smoothed field
+      and its bounds
+    - ("mesh", label, sigma, iso, isoTolerance, meshRepair,
+      meshSimplify) : isovalue used and surface mesh
+    so a call only recomputes the stages whose inputs changed. Changing
+    iso keeps the smoothed fields, and changing fillGaps, NB, engine,
+    dtype or compact keeps the meshes. Voxelization is always rerun.
+    With a profiler, only the stages that are computed are recorded.
+    Evicted stages are recomputed when needed again, so the ceiling
+    only affects speed, never the output.
+
+USAGE:
+    upsampler = Upsampler(multiLabelMatrix, scale, spacing)
+    for sigma in [0.4, 0.6]:
+        for iso in [0.3, 0.4, 0.5]:
+            newMatrix = upsampler.upsample(sigma, iso)
+
+ATTRIBUTES:
+    multiLabelMatrix : numpy.ndarray
+        Input labelled image
+    scale        : list
+        Voxel size of the output grid
+    spacing      : list
+        Voxel size of the input grid
+    cache        : StageCache
+        Cached stage results
+    segImg       : SegmentedImage
+        Image of the last call, None before the first call
+
+ABOUT:
+    author         : Liangpu Liu, Rui Xu, Bradley Treeby
+    date           : 18th Oct 2026
+    last update    : 18th Oct 2026
+
+LICENSE:
+    This function is part of the pySegmentationUpsampler.
+    Copyright (C) 2024  Liangpu Liu, Rui Xu, and Bradley Treeby.
+
+This file is part of pySegmentationUpsampler, pySegmentationUpsampler
+is free software: you can redistribute it and/or modify it under the
+terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+pySegmentationUpsampler is distributed in the hope that it will be
+useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with pySegmentationUpsampler. If not, see
+<http://www.gnu.org/licenses/>.
+    """
+
+    def __init__(self, multiLabelMatrix, scale, spacing = [1, 1, 1],
+                 maxCacheBytes = 2**30):
+        """
+        INIT Validate the image and create an empty cache.
+
+        INPUTS:
+            multiLabelMatrix : numpy.ndarray
+                3D labelled image, integer or floating
+            scale       : list
+                Voxel size of the output grid
+            spacing     : list
+                Voxel size of the input grid
+            maxCacheBytes : int or None
+                Memory ceiling of the cache in bytes, None for no
+                ceiling
+        """
+        UpsampleMultiLabels.ValidateInputs(multiLabelMatrix, -1, scale,
+                                           spacing, -1, False, True)
+        self.multiLabelMatrix = multiLabelMatrix
+        self.scale = scale
+        self.spacing = spacing
+        self.cache = StageCache.StageCache(maxCacheBytes)
+        self.segImg = None
+
+    def separateLabels(self, segImg, profiler = None):
+        """Register the separated labels in segImg, from the cache."""
+        key = ("labels",)
+        labels = self.cache.get(key)
+        if labels is None:
+            with stage(profiler, "separation") as counts:
+                labelSeparationInstance = LabelSeparater.LabelSeparation(
+                    segImg)
+                labelSeparationInstance.separateLabels()
+                labelSeparationInstance.updateImg()
+                counts.update(voxels=int(self.multiLabelMatrix.size),
+                              labels=segImg.getLabelNumber())
+            labels = segImg.getAllLabels()
+            self.cache.put(key, labels,
+                           sum(mask.nbytes for mask in labels[0]))
+        else:
+            segImg.setSeparateLabels(*labels)
+
+    def prepareLabel(self, segImg, i, profiler = None):
+        """
+        PREPARELABEL Smoothed field, isovalue and mesh of label i.
+
+        DESCRIPTION:
+            Equivalent to UpsampleMultiLabels.prepareLabel, with the
+            smoothed field looked up by the requested sigma and the
+            mesh by the requested sigma, iso and mesh options.
+            Automatic values (-1) are cached under -1, as they only
+            depend on the label.
+        """
+        from SegmentationUpsampler import Extractor
+
+        binaryImg = segImg.binaryImgList[i]
+        preprocesser = Preprocess.ImagePreprocess(segImg, i, False,
+                                                  segImg.isoTolerance)
+
+        smoothKey = ("smooth", binaryImg.label, segImg.sigma)
+        smoothed = self.cache.get(smoothKey)
+        if smoothed is None:
+            with stage(profiler, "preprocessing", binaryImg.label) as counts:
+                preprocesser.smoothLabel()
+                counts.update(voxels=int(segImg.labelVolume[i]),
+                              smoothedVoxels=int(
+                                  preprocesser.croppedMatrix.size))
+            smoothed = (binaryImg.sigma, preprocesser.croppedMatrix,
+                        preprocesser.nonZeroShape)
+            self.cache.put(smoothKey, smoothed,
+                           preprocesser.croppedMatrix.nbytes)
+        binaryImg.setSigma(smoothed[0])
+        preprocesser.croppedMatrix, preprocesser.nonZeroShape = smoothed[1:]
+
+        meshKey = ("mesh", binaryImg.label, segImg.sigma, segImg.iso,
+                   segImg.isoTolerance, segImg.meshRepair,
+                   segImg.meshSimplify)
+        mesh = self.cache.get(meshKey)
+        if mesh is None:
+            with stage(profiler, "preprocessing", binaryImg.label):
+                preprocesser.setIsovalue()
+                preprocesser.updateImg()
+            with stage(profiler, "extraction", binaryImg.label) as counts:
+                isosurfaceExtractor = Extractor.IsosurfaceExtractor(
+                    segImg, i, meshArrays=False)
+                isosurfaceExtractor.extractIsosurface()
+                isosurfaceExtractor.updateImg()
+                counts.update(triangles=binaryImg.polyData.GetNumberOfPolys(),
+                              points=binaryImg.polyData.GetNumberOfPoints())
+            mesh = (binaryImg.iso, binaryImg.polyData)
+            # GetActualMemorySize is in kibibytes
+            self.cache.put(meshKey, mesh,
+                           binaryImg.polyData.GetActualMemorySize()*1024)
+        else:
+            binaryImg.setIsovalue(mesh[0])
+            preprocesser.updateImg()
+            binaryImg.setSurfaceMesh(mesh[1], None, None)
+
+    def upsample(self, sigma = -1, iso = -1, fillGaps = False, NB = True,
+                 engine = "distance", dtype = None, compact = False,
+                 verbose = True, isoTolerance = None, meshRepair = "always",
+                 meshSimplify = None, profiler = None):
+        """
+        UPSAMPLE Upsample the image with the given parameters.
+
+        INPUTS:
+            See UpsampleMultiLabels.upsample, the other parameters of
+            which are fixed by this class.
+
+        RETURNS:
+            newMatrix, or (newMatrix, lookupTable) if compact is True,
+            identical to the output of UpsampleMultiLabels.upsample
+        """
+        UpsampleMultiLabels.ValidateInputs(self.multiLabelMatrix, sigma,
+                                           self.scale, self.spacing, iso,
+                                           fillGaps, NB, engine=engine,
+                                           dtype=dtype, compact=compact,
+                                           profiler=profiler,
+                                           verbose=verbose,
+                                           meshRepair=meshRepair,
+                                           meshSimplify=meshSimplify,
+                                           isoTolerance=isoTolerance)
+
+        segImg = ImageBase.SegmentedImage(self.multiLabelMatrix, sigma,
+                                          self.scale, self.spacing, iso,
+                                          dtype=None, verbose=verbose,
+                                          meshRepair=meshRepair,
+                                          meshSimplify=meshSimplify,
+                                          isoTolerance=isoTolerance)
+        self.segImg = segImg
+        self.separateLabels(segImg, profiler)
+
+        lookupTable = segImg.setOutputLabels(compact)
+        segImg.allocateNewImg(dtype)
+
+        numbaVoxelizer = NB or engine == "scanline"
+        numbaGapFiller = fillGaps and NB
+        if numbaVoxelizer or numbaGapFiller:
+            UpsampleMultiLabels.warmup(numbaVoxelizer, numbaGapFiller,
+                                       (segImg.newImg.dtype,), profiler,
+                                       engine)
+
+        for i in range(segImg.getLabelNumber()):
+            self.prepareLabel(segImg, i, profiler)
+            block, offset = UpsampleMultiLabels.voxelizeLabel(
+                segImg, i, NB, engine, profiler=profiler)
+            UpsampleMultiLabels.mergeLabel(segImg, i, block, offset)
+
+        if fillGaps:
+            with stage(profiler, "fillGaps") as counts:
+                gapFiller = UpsampleMultiLabels.getGapFillerClass(NB)(segImg)
+                gapFiller.fillZeros()
+                gapFiller.updateImg()
+                counts.update(voxels=int(segImg.newImg.size))
+
+        if compact:
+            return segImg.newImg, lookupTable
+        return segImg.newImg
@@ -1,5 +1,5 @@
-import vtk
 import numpy as np
+from SegmentationUpsampler import MeshInclusion
 
 class MeshVoxelizer:
     """
@@ -22,7 +22,7 @@ ATTRIBUTES:
     binImg         : ImageBase.BinaryImage
         Label-specific processing data
     smoothedMatrix : numpy.ndarray 
-        Pre-processed mask guiding voxelization
+        Pre-processed mask guiding voxelization, cropped to bounds
     mesh           : vtk.vtkPolyData
         Surface mesh for current label
     background     : numpy.ndarray
@@ -33,6 +33,12 @@ ATTRIBUTES:
         Dimensions of cropped processing area
     lower          : tuple
         Minimum bounds of cropped region
+    offset         : tuple
+        Output grid index of background[0, 0, 0]
+    rows           : tuple
+        Range of output samples along the first axis to voxelize
+    boundaryPoints : int
+        Number of points tested against the mesh by voxeliseMesh
 
 ABOUT:
     author        : Liangpu Liu, Rui Xu, Bradley Treeby
@@ -77,7 +83,7 @@ License along with pySegmentationUpsampler. If not, see
         self.binImg = segImg.binaryImgList[i]
 
         # Inherit processing parameters from container
-        self.smoothedMatrix = self.binImg.smoothedImg
+        self.smoothedMatrix = self.binImg.croppedImg
         self.mesh = self.binImg.polyData
         self.background = self.segImg.newImg  # Direct reference to output grid
         self.label = self.binImg.label
@@ -85,6 +91,31 @@ License along with pySegmentationUpsampler. If not, see
         # Get spatial parameters for voxelization
         self.gx, self.gy, self.gz = np.shape(self.binImg.croppedImg)
         self.lower = self.binImg.bounds[0]
+        self.offset = (0, 0, 0)
+        self.boundaryPoints = 0
+        self.rows = (0, len(np.arange(self.lower[0], self.gx + self.lower[0], 
+                                      self.segImg.dx[0])))
+
+    def setLocalBackground(self, rows = None):
+        """
+        SETLOCALBACKGROUND Voxelize into a block covering this label only.
+
+        DESCRIPTION:
+            Replaces the reference to segImg.newImg with a zeroed block 
+            spanning the label's cropped region on the output grid (see 
+            BinaryImage.getLocalBlock). Voxels inside the mesh are set 
+            to 1, so the block can be merged into the output grid later 
+            in label order.
+
+        INPUTS:
+            rows        : tuple
+                (start, stop) output grid rows along the first axis to 
+                voxelize, all rows of the label if None
+        """
+        self.offset, self.rows, shape = self.binImg.getLocalBlock(
+            self.segImg.dx, rows)
+        self.background = np.zeros(shape, dtype=np.uint8)
+        self.label = 1
 
     def voxeliseMesh(self):
         """
@@ -99,39 +130,57 @@ License along with pySegmentationUpsampler. If not, see
         PROCESS:
             - Iterates through cropped processing region
             - Uses pre-computed smoothed matrix to skip processed areas
-            - Applies mesh distance function for boundary resolution
+            - Collects boundary points and resolves them with one 
+              batched mesh distance query
             - Updates segmentation grid in-place
         """
         # VTK distance calculator for mesh inclusion testing
-        distanceFilter = vtk.vtkImplicitPolyDataDistance()
-        distanceFilter.SetInput(self.mesh)
+        distanceFilter = MeshInclusion.getDistanceFilter(self.mesh)
+        points = []
+        indices = []
 
         # Get grid spacing from parent container
         dx = self.segImg.dx
 
         # Process voxels in cropped region
-        for k in np.arange(self.lower[0], self.gx + self.lower[0], dx[0]):
+        rows = np.arange(self.lower[0], self.gx + self.lower[0], dx[0])
+        for k in rows[self.rows[0]:self.rows[1]]:
             for j in np.arange(self.lower[1], self.gy + self.lower[1], dx[1]):
                 for i in np.arange(self.lower[2], self.gz + self.lower[2], dx[2]):
                     # Convert to output grid coordinates
-                    px = round((k - self.lower[0])/dx[0]) + int(self.lower[0]/dx[0])
-                    py = round((j - self.lower[1])/dx[1]) + int(self.lower[1]/dx[1])
-                    pz = round((i - self.lower[2])/dx[2]) + int(self.lower[2]/dx[2])
+                    px = (round((k - self.lower[0])/dx[0]) + 
+                          int(self.lower[0]/dx[0]) - self.offset[0])
+                    py = (round((j - self.lower[1])/dx[1]) + 
+                          int(self.lower[1]/dx[1]) - self.offset[1])
+                    pz = (round((i - self.lower[2])/dx[2]) + 
+                          int(self.lower[2]/dx[2]) - self.offset[2])
 
                     # Apply pre-computed guidance matrix
-                    sm_val = self.smoothedMatrix[int(k), int(j), int(i)]
+                    sm_val = self.smoothedMatrix[int(k) - self.lower[0], 
+                                                 int(j) - self.lower[1], 
+                                                 int(i) - self.lower[2]]
                     if sm_val == 1:
                         self.background[px, py, pz] = self.label
                     elif sm_val == 0:
                         continue  # Skip fully processed areas
                     else:
-                        # Resolve boundary regions with mesh testing
-                        point = np.array([i-self.lower[2], 
-                                        j-self.lower[1], 
-                                        k-self.lower[0]], dtype=float)
-                        if distanceFilter.EvaluateFunction(point) < 0:
-                            self.background[px, py, pz] = self.label
+                        # Boundary regions are resolved with mesh testing
+                        points.append([i-self.lower[2], 
+                                       j-self.lower[1], 
+                                       k-self.lower[0]])
+                        indices.append([px, py, pz])
+
+        self.boundaryPoints = len(points)
+        inside = MeshInclusion.insideMesh(distanceFilter, points)
+        for (px, py, pz), isInside in zip(indices, inside):
+            if isInside:
+                self.background[px, py, pz] = self.label
                         
+    def getCounts(self):
+        """Number of voxels in the block and of mesh-tested points."""
+        return {"voxels": int(self.background.size), 
+                "boundaryPoints": self.boundaryPoints}
+
     def updateImg(self):
         """Propagate changes to SegmentedImage container."""
         self.segImg.setUpdatedImg(self.background)
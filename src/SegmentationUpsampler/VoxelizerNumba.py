@@ -1,6 +1,6 @@
-import vtk
 import numpy as np
 import numba as nb
+from SegmentationUpsampler import MeshInclusion
 
 class MeshVoxelizerNumba:
     """
@@ -10,7 +10,8 @@ DESCRIPTION:
     Optimized version of MeshVoxelizer that combines Numba-accelerated grid 
     processing with VTK's mesh operations. Part of segmentation upsampling 
     pipeline. Features:
-    - Numba-optimized grid traversal
+    - Numba-optimized grid traversal, parallel over output rows
+    - Kernel cached on disk, see warmup()
     - VTK-based mesh inclusion testing
     - Selective processing using guidance matrix
 
@@ -26,7 +27,8 @@ ATTRIBUTES:
     binImg         : ImageBase.BinaryImage
         Label-specific processing data
     smoothedMatrix : numpy.ndarray 
-        Pre-computed guidance matrix (1=set, 0=ignore, other=test)
+        Pre-computed guidance matrix (1=set, 0=ignore, other=test), 
+        cropped to bounds
     mesh           : vtk.vtkPolyData
         Target surface mesh for voxelization
     background     : numpy.ndarray
@@ -37,6 +39,12 @@ ATTRIBUTES:
         Dimensions of cropped processing region
     lower          : tuple
         Minimum bounds of cropped region
+    offset         : tuple
+        Output grid index of background[0, 0, 0]
+    rows           : tuple
+        Range of output samples along the first axis to voxelize
+    boundaryPoints : int
+        Number of points tested against the mesh by voxeliseMesh
 
 ABOUT:
     author        : Liangpu Liu, Rui Xu, Bradley Treeby
@@ -81,67 +89,153 @@ License along with pySegmentationUpsampler. If not, see
         self.segImg = segImg
         self.binImg = segImg.binaryImgList[i]
 
-        self.smoothedMatrix = self.binImg.smoothedImg
+        self.smoothedMatrix = self.binImg.croppedImg
         self.mesh = self.binImg.polyData
         self.background = self.segImg.newImg
         self.label = self.binImg.label
 
         self.gx, self.gy, self.gz = np.shape(self.binImg.croppedImg)
         self.lower = self.binImg.bounds[0]
+        self.offset = (0, 0, 0)
+        self.boundaryPoints = 0
+        self.rows = (0, len(np.arange(self.lower[0], self.gx + self.lower[0], 
+                                      self.segImg.dx[0])))
+
+    def setLocalBackground(self, rows = None):
+        """
+        SETLOCALBACKGROUND Voxelize into a block covering this label only.
+
+        DESCRIPTION:
+            Replaces the reference to segImg.newImg with a zeroed block 
+            spanning the label's cropped region on the output grid (see 
+            BinaryImage.getLocalBlock). Voxels inside the mesh are set 
+            to 1, so the block can be merged into the output grid later 
+            in label order.
+
+        INPUTS:
+            rows        : tuple
+                (start, stop) output grid rows along the first axis to 
+                voxelize, all rows of the label if None
+        """
+        self.offset, self.rows, shape = self.binImg.getLocalBlock(
+            self.segImg.dx, rows)
+        self.background = np.zeros(shape, dtype=np.uint8)
+        self.label = 1
+
+    def getSamples(self, d):
+        """
+        Output grid coordinates along axis d, in input voxels. Computed 
+        as lower + n*dx like np.arange inside Numba, which can differ 
+        from NumPy's np.arange in the last bit.
+        """
+        size = (self.gx, self.gy, self.gz)[d]
+        dx = self.segImg.dx[d]
+        count = len(np.arange(self.lower[d], size + self.lower[d], dx))
+        return self.lower[d] + np.arange(count)*dx
 
     def voxeliseMesh(self):
         """
         VOXELISEMESH Execute hybrid Numba/VTK voxelization pipeline.
 
         DESCRIPTION:
-            1. Uses Numba-accelerated pre-processing to:
+            1. Computes the output grid samples and their guidance and 
+               output indices along each axis
+            2. Uses a parallel Numba kernel to:
                - Apply guidance matrix rules
                - Collect boundary points needing mesh testing
-            2. Applies VTK distance filter to boundary points
-            3. Updates output grid in SegmentedImage
+            3. Applies VTK distance filter to all boundary points in 
+               one batched call
+            4. Updates output grid in SegmentedImage
         """
-        distanceFilter = vtk.vtkImplicitPolyDataDistance()
-        distanceFilter.SetInput(self.mesh)
+        distanceFilter = MeshInclusion.getDistanceFilter(self.mesh)
 
         dx = self.segImg.dx
-        self.background, points = pointWiseProcess(self.gx, self.gy, self.gz, 
-                                                   dx, self.lower, 
-                                                   self.smoothedMatrix, 
-                                                   self.label, 
+        samples = [self.getSamples(d) for d in range(3)]
+        samples[0] = samples[0][self.rows[0]:self.rows[1]]
+
+        # Guidance matrix indices and output indices of the samples, 
+        # np.rint rounds half to even like round()
+        guidance = [np.int64(s) - self.lower[d] 
+                    for d, s in enumerate(samples)]
+        indices = [np.rint((s - self.lower[d]) / dx[d]).astype(np.int64) + 
+                   int(self.lower[d] / dx[d]) - self.offset[d] 
+                   for d, s in enumerate(samples)]
+        coords = [s - self.lower[d] for d, s in enumerate(samples)]
+
+        self.background, points = pointWiseProcess(self.smoothedMatrix, 
+                                                   guidance[0], guidance[1], 
+                                                   guidance[2], indices[0], 
+                                                   indices[1], indices[2], 
+                                                   coords[0], coords[1], 
+                                                   coords[2], self.label, 
                                                    self.background)
-        for p in points:
-            distance = distanceFilter.EvaluateFunction(p)
-            if distance < 0:
-                px = round(p[2] / dx[0]) + int(self.lower[0] / dx[0])
-                py = round(p[1] / dx[1]) + int(self.lower[1] / dx[1])
-                pz = round(p[0] / dx[2]) + int(self.lower[2] / dx[2])
-                self.background[px, py, pz] = self.label
+        self.boundaryPoints = len(points)
+        p = points[MeshInclusion.insideMesh(distanceFilter, points)]
+
+        # np.rint rounds half to even like round()
+        px = (np.rint(p[:, 2] / dx[0]).astype(np.int64) + 
+              int(self.lower[0] / dx[0]) - self.offset[0])
+        py = (np.rint(p[:, 1] / dx[1]).astype(np.int64) + 
+              int(self.lower[1] / dx[1]) - self.offset[1])
+        pz = (np.rint(p[:, 0] / dx[2]).astype(np.int64) + 
+              int(self.lower[2] / dx[2]) - self.offset[2])
+        self.background[px, py, pz] = self.label
     
+    def getCounts(self):
+        """Number of voxels in the block and of mesh-tested points."""
+        return {"voxels": int(self.background.size), 
+                "boundaryPoints": self.boundaryPoints}
+
     def updateImg(self):
         """Propagate grid changes to SegmentedImage container."""
         self.segImg.setUpdatedImg(self.background)
 
-@nb.njit
-def pointWiseProcess(gx, gy, gz, dx, lower, smoothedMatrix, label, 
-                     background):
+def warmup(smoothedDtypes = (np.float32,)):
+    """
+    WARMUP Compile pointWiseProcess for the guidance matrix dtypes.
+
+    DESCRIPTION:
+        Calls the kernel on a one-voxel grid for each dtype, with the 
+        argument types voxeliseMesh uses. The kernel is cached on disk, 
+        so this loads it from the cache where a compiled version exists.
+
+    RETURNS:
+        int : number of kernel versions compiled or loaded
+    """
+    before = len(pointWiseProcess.signatures)
+    index = np.zeros(1, dtype=np.int64)
+    coord = np.zeros(1, dtype=np.float64)
+    for dtype in smoothedDtypes:
+        pointWiseProcess(np.full((1, 1, 1), 0.5, dtype=dtype), index, index, 
+                         index, index, index, index, coord, coord, coord, 1, 
+                         np.zeros((1, 1, 1), dtype=np.uint8))
+    return len(pointWiseProcess.signatures) - before
+
+@nb.njit(parallel=True, cache=True)
+def pointWiseProcess(smoothedMatrix, gk, gj, gi, pk, pj, pi, ck, cj, ci, 
+                     label, background):
     """
     NUMBA-ACCELERATED GRID PROCESSING
 
     DESCRIPTION:
         First-stage processing that handles:
-        - Grid coordinate calculations
         - Guidance matrix application
         - Boundary point collection
+        Output rows along the first axis are processed in parallel, in 
+        two passes. The first writes interior voxels into background 
+        and counts the boundary points of each row, the second fills 
+        them into one preallocated array, in the order of a serial 
+        scan. Different rows write different voxels of background.
 
     PARAMETERS:
-        gx, gy, gz   : int
-            Cropped region dimensions
-        dx           : (float, float, float)
-            Grid spacing from SegmentedImage
-        lower        : (int, int, int)
-            Minimum bounds of cropped region
         smoothedMatrix : array[float]
-            3D guidance matrix
+            3D guidance matrix cropped to the region starting at lower
+        gk, gj, gi   : array[int]
+            Guidance matrix index of the samples along each axis
+        pk, pj, pi   : array[int]
+            Background index of the samples along each axis
+        ck, cj, ci   : array[float]
+            Mesh coordinate of the samples along each axis
         label        : int
             Target label value
         background   : array[int]
@@ -150,26 +244,34 @@ def pointWiseProcess(gx, gy, gz, dx, lower, smoothedMatrix, label,
     RETURNS:
         background   : array[int]
             Updated output grid reference
-        test_points  : list[array[float]]
-            Collected points needing mesh testing
+        points       : array[float]
+            (N,3) points needing mesh testing, as (x, y, z) = (i, j, k)
     """
-    ApplyDistanceFilter = []
-
-    for k in np.arange(lower[0], gx + lower[0], dx[0]):
-        for j in np.arange(lower[1], gy + lower[1], dx[1]):
-            for i in np.arange(lower[2], gz + lower[2], dx[2]):
-                px = round((k - lower[0]) / dx[0]) + int(lower[0] / dx[0])
-                py = round((j - lower[1]) / dx[1]) + int(lower[1] / dx[1])
-                pz = round((i - lower[2]) / dx[2]) + int(lower[2] / dx[2])
-
+    counts = np.zeros(len(gk) + 1, dtype=np.int64)
+    for r in nb.prange(len(gk)):
+        count = 0
+        for b in range(len(gj)):
+            for c in range(len(gi)):
                 # A point is ignored if its corresponding point on the 
                 # smoothed matrix is 1 or 0
-                if smoothedMatrix[int(k), int(j), int(i)] == 1:
-                    background[px, py, pz] = label
-                elif smoothedMatrix[int(k), int(j), int(i)] == 0:
-                    continue 
-                else:
-                    ApplyDistanceFilter.append(
-                        [i - lower[2], j - lower[1], k - lower[0]])
-
-    return background, ApplyDistanceFilter
+                value = smoothedMatrix[gk[r], gj[b], gi[c]]
+                if value == 1:
+                    background[pk[r], pj[b], pi[c]] = label
+                elif value != 0:
+                    count += 1
+        counts[r + 1] = count
+
+    starts = np.cumsum(counts)
+    points = np.empty((starts[-1], 3), dtype=np.float64)
+    for r in nb.prange(len(gk)):
+        n = starts[r]
+        for b in range(len(gj)):
+            for c in range(len(gi)):
+                value = smoothedMatrix[gk[r], gj[b], gi[c]]
+                if value != 1 and value != 0:
+                    points[n, 0] = ci[c]
+                    points[n, 1] = cj[b]
+                    points[n, 2] = ck[r]
+                    n += 1
+
+    return background, points
@@ -0,0 +1,172 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from SegmentationUpsampler import ImageIO
+from SegmentationUpsampler.Profiler import Profiler
+from SegmentationUpsampler.UpsampleMultiLabels import upsample
+from benchmarks import benchmarkStages
+
+"""
+Speed against accuracy of the mesh post-processing options
+
+DESCRIPTION:
+    Upsamples each image with every combination of meshRepair and
+    meshSimplify in VARIANTS and records:
+    - seconds       : wall time of upsample()
+    - extraction    : seconds of isosurface extraction
+    - voxelization  : seconds of voxelization
+    - triangles     : faces of all label meshes
+    - dice          : mean Dice coefficient over the labels against
+                      the reference
+    For the synthetic spheres the reference is the analytic shape
+    sampled on the output grid. For multilabelTestShape.npy and the
+    bundled padded_liver.mat and vertebra, which have no high-resolution
+    ground truth, it is the output of the default chain (the first
+    variant), so the Dice measures how far an option moves the result.
+
+USAGE:
+    PYTHONPATH=src python src/benchmarks/benchmarkMeshPostProcessing.py
+    PYTHONPATH=src python src/benchmarks/benchmarkMeshPostProcessing.py \
+        --no-files --engine scanline
+
+ABOUT:
+    author - Liangpu Liu, Rui Xu, Bradley Treeby
+    date - 18th Oct 2026
+    last update - 18th Oct 2026
+
+LICENSE:
+    This function is part of the pySegmentationUpsampler.
+    Copyright (C) 2024  Liangpu Liu, Rui Xu, and Bradley Treeby.
+
+This file is part of pySegmentationUpsampler, pySegmentationUpsampler
+is free software: you can redistribute it and/or modify it under the
+terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+pySegmentationUpsampler is distributed in the hope that it will be
+useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with pySegmentationUpsampler. If not, see
+<http://www.gnu.org/licenses/>.
+
+"""
+
+VARIANTS = (("always", None), ("auto", None), ("never", None),
+            ("always", "decimate"), ("always", "smooth"),
+            ("auto", "decimate"))
+
+def makeSpheresReference(size, labels, scale):
+    """Spheres of benchmarkStages.makeSpheres sampled on the output grid."""
+    shape = int(size/scale)
+    x, y, z = (np.arange(shape)*scale for _ in range(3))
+    x, y, z = np.ix_(x, y, z)
+    image = np.zeros((shape, shape, shape), dtype=np.uint8)
+    centres, radius = benchmarkStages.getCells(size, labels)
+    for label, (cx, cy, cz) in enumerate(centres, start=1):
+        image[(x - cx)**2 + (y - cy)**2 + (z - cz)**2 <= radius**2] = label
+    return image
+
+def getDice(newMatrix, referenceMatrix):
+    """Mean Dice coefficient over the labels of referenceMatrix."""
+    dice = []
+    for label in np.unique(referenceMatrix)[1:]:
+        reference = referenceMatrix == label
+        result = newMatrix == label
+        dice.append(2*np.count_nonzero(reference & result) /
+                    (np.count_nonzero(reference) + np.count_nonzero(result)))
+    return float(np.mean(dice))
+
+def getDatasets(files = True):
+    """
+    GETDATASETS Benchmark images.
+
+    RETURNS:
+        list: (name, multiLabelMatrix, spacing, scale, reference) per
+        image, reference None where the default chain is used
+    """
+    datasets = [("spheres-48-8", benchmarkStages.makeSpheres(48, 8),
+                 [1, 1, 1], [0.5]*3, makeSpheresReference(48, 8, 0.5)),
+                ("multilabelTestShape",
+                 np.load(os.path.join(benchmarkStages.DATA_DIR,
+                                      "multilabelTestShape.npy")),
+                 [1, 1, 1], [0.5]*3, None)]
+    if files:
+        for name, scale in (("padded_liver.mat", None),
+                            ("sub-gl003_dir-ax_seg-vert_msk.nii.gz", 0.8)):
+            matrix, spacing, _ = ImageIO.readImage(
+                os.path.join(benchmarkStages.DATA_DIR, name))
+            scale = min(spacing) if scale is None else scale
+            datasets.append((name.split(".")[0].split("_seg")[0], matrix,
+                             spacing, [scale]*3, None))
+    return datasets
+
+def benchmarkDataset(name, multiLabelMatrix, spacing, scale,
+                     reference = None, variants = VARIANTS,
+                     engine = "distance"):
+    """
+    BENCHMARKDATASET Upsample one image with every variant.
+
+    RETURNS:
+        list: one record dict per variant
+    """
+    records = []
+    for meshRepair, meshSimplify in variants:
+        profiler = Profiler()
+        start = time.perf_counter()
+        newMatrix = upsample(multiLabelMatrix, scale, spacing=spacing,
+                             engine=engine, profiler=profiler, verbose=False,
+                             meshRepair=meshRepair, meshSimplify=meshSimplify)
+        seconds = time.perf_counter() - start
+        if reference is None:
+            reference = newMatrix
+
+        summary = profiler.getSummary()
+        records.append(dict(
+            dataset=name, meshRepair=meshRepair, meshSimplify=meshSimplify,
+            seconds=seconds, extraction=summary["extraction"]["seconds"],
+            voxelization=summary["voxelization"]["seconds"],
+            triangles=summary["extraction"]["counts"]["triangles"],
+            dice=getDice(newMatrix, reference)))
+    return records
+
+def printRecords(records):
+    """Print a table of records."""
+    print("%-20s %-7s %-9s %9s %11s %13s %10s %8s" % (
+        "dataset", "repair", "simplify", "seconds", "extraction",
+        "voxelization", "triangles", "dice"))
+    for record in records:
+        print("%-20s %-7s %-9s %9.2f %11.2f %13.2f %10d %8.5f" % (
+            record["dataset"], record["meshRepair"],
+            record["meshSimplify"] or "-", record["seconds"],
+            record["extraction"], record["voxelization"],
+            record["triangles"], record["dice"]))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark speed against Dice of the mesh " +
+        "post-processing options.")
+    parser.add_argument("--no-files", dest="files", action="store_false",
+                        help="skip padded_liver.mat and the vertebra")
+    parser.add_argument("--engine", choices=("distance", "scanline"),
+                        default="distance", help="voxelization engine")
+    args = parser.parse_args(argv)
+
+    # Compiles the Numba kernels
+    upsample(benchmarkStages.makeSpheres(8, 2), [0.5]*3, engine=args.engine,
+             verbose=False)
+
+    records = []
+    for name, matrix, spacing, scale, reference in getDatasets(args.files):
+        records += benchmarkDataset(name, matrix, spacing, scale, reference,
+                                    engine=args.engine)
+    printRecords(records)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import argparse
+import os
+import sys
+import time
+import numba as nb
+import numpy as np
+from SegmentationUpsampler import ImageBase
+from SegmentationUpsampler import UpsampleMultiLabels
+from SegmentationUpsampler import VoxelizerNumba
+from benchmarks import benchmarkStages
+
+"""
+Benchmark of the grid processing kernel of MeshVoxelizerNumba
+
+DESCRIPTION:
+    Times VoxelizerNumba.pointWiseProcess, the parallel two-pass kernel
+    applying the guidance matrix on the output grid, against the serial
+    kernel it replaced, kept here as legacyPointWiseProcess. Both run
+    on every label of multilabelTestShape.npy, and of a synthetic
+    sphere image, at a 4x upsample (scale 0.25). The outputs are
+    checked to be identical: the same interior voxels and the same
+    boundary points in the same order. The best of --repeats runs is
+    reported, after a first call that compiles both kernels.
+
+USAGE:
+    PYTHONPATH=src python src/benchmarks/benchmarkPointWiseProcess.py
+    PYTHONPATH=src NUMBA_NUM_THREADS=4 python \
+        src/benchmarks/benchmarkPointWiseProcess.py --scale 0.25
+
+ABOUT:
+    author - Liangpu Liu, Rui Xu, Bradley Treeby
+    date - 18th Oct 2026
+    last update - 18th Oct 2026
+
+LICENSE:
+    This function is part of the pySegmentationUpsampler.
+    Copyright (C) 2024  Liangpu Liu, Rui Xu, and Bradley Treeby.
+
+This file is part of pySegmentationUpsampler, pySegmentationUpsampler
+is free software: you can redistribute it and/or modify it under the
+terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+pySegmentationUpsampler is distributed in the hope that it will be
+useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with pySegmentationUpsampler. If not, see
+<http://www.gnu.org/licenses/>.
+
+"""
+
+@nb.njit
+def legacyPointWiseProcess(gx, gy, gz, dx, lower, smoothedMatrix, label,
+                           background, offset, rows):
+    """Serial kernel of MeshVoxelizerNumba before the parallel rewrite."""
+    ApplyDistanceFilter = []
+
+    for k in np.arange(lower[0], gx + lower[0], dx[0])[rows[0]:rows[1]]:
+        for j in np.arange(lower[1], gy + lower[1], dx[1]):
+            for i in np.arange(lower[2], gz + lower[2], dx[2]):
+                px = (round((k - lower[0]) / dx[0]) + int(lower[0] / dx[0]) -
+                      offset[0])
+                py = (round((j - lower[1]) / dx[1]) + int(lower[1] / dx[1]) -
+                      offset[1])
+                pz = (round((i - lower[2]) / dx[2]) + int(lower[2] / dx[2]) -
+                      offset[2])
+
+                value = smoothedMatrix[int(k) - lower[0], int(j) - lower[1],
+                                       int(i) - lower[2]]
+                if value == 1:
+                    background[px, py, pz] = label
+                elif value == 0:
+                    continue
+                else:
+                    ApplyDistanceFilter.append(
+                        [i - lower[2], j - lower[1], k - lower[0]])
+
+    return background, ApplyDistanceFilter
+
+def runLegacy(voxelizer):
+    """Legacy kernel on a voxelizer, as (background, (N,3) points)."""
+    background, points = legacyPointWiseProcess(
+        voxelizer.gx, voxelizer.gy, voxelizer.gz, voxelizer.segImg.dx,
+        voxelizer.lower, voxelizer.smoothedMatrix, voxelizer.label,
+        voxelizer.background, voxelizer.offset, voxelizer.rows)
+    return background, np.array(points, dtype=np.float64).reshape(-1, 3)
+
+def runParallel(voxelizer):
+    """Parallel kernel on a voxelizer, as in voxeliseMesh."""
+    dx = voxelizer.segImg.dx
+    lower = voxelizer.lower
+    samples = [voxelizer.getSamples(d) for d in range(3)]
+    samples[0] = samples[0][voxelizer.rows[0]:voxelizer.rows[1]]
+    guidance = [np.int64(s) - lower[d] for d, s in enumerate(samples)]
+    indices = [np.rint((s - lower[d]) / dx[d]).astype(np.int64) +
+               int(lower[d] / dx[d]) - voxelizer.offset[d]
+               for d, s in enumerate(samples)]
+    coords = [s - lower[d] for d, s in enumerate(samples)]
+    return VoxelizerNumba.pointWiseProcess(
+        voxelizer.smoothedMatrix, *guidance, *indices, *coords,
+        voxelizer.label, voxelizer.background)
+
+def prepareImage(multiLabelMatrix, scale):
+    """Separated, smoothed and meshed SegmentedImage of an image."""
+    segImg = ImageBase.SegmentedImage(multiLabelMatrix, -1, [scale]*3,
+                                      [1, 1, 1], -1, verbose=False)
+    benchmarkStages.separateLabels(segImg)
+    for i in range(segImg.getLabelNumber()):
+        UpsampleMultiLabels.prepareLabel(segImg, i)
+    return segImg
+
+def timeKernel(segImg, run, repeats):
+    """Best total seconds of run over all labels, and its outputs."""
+    best = np.inf
+    for _ in range(repeats):
+        outputs = []
+        seconds = 0.0
+        for i in range(segImg.getLabelNumber()):
+            voxelizer = VoxelizerNumba.MeshVoxelizerNumba(segImg, i)
+            voxelizer.setLocalBackground()
+            start = time.perf_counter()
+            outputs.append(run(voxelizer))
+            seconds += time.perf_counter() - start
+        best = min(best, seconds)
+    return best, outputs
+
+def benchmarkImage(name, multiLabelMatrix, scale, repeats):
+    """
+    BENCHMARKIMAGE Time both kernels on one image.
+
+    RETURNS:
+        dict: dataset, outputVoxels, boundaryPoints, legacy and
+        parallel seconds
+    """
+    segImg = prepareImage(multiLabelMatrix, scale)
+    legacy, legacyOutputs = timeKernel(segImg, runLegacy, repeats)
+    parallel, parallelOutputs = timeKernel(segImg, runParallel, repeats)
+
+    for (oldBlock, oldPoints), (newBlock, newPoints) in zip(legacyOutputs,
+                                                            parallelOutputs):
+        if not (np.array_equal(oldBlock, newBlock) and
+                np.array_equal(oldPoints, newPoints)):
+            raise AssertionError("Kernels differ on " + name + ".")
+
+    return dict(dataset=name,
+                outputVoxels=sum(block.size for block, _ in legacyOutputs),
+                boundaryPoints=sum(len(points)
+                                   for _, points in legacyOutputs),
+                legacy=legacy, parallel=parallel)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the grid processing kernel of " +
+        "MeshVoxelizerNumba against the legacy serial kernel.")
+    parser.add_argument("--scale", type=float, default=0.25,
+                        help="output voxel size, 0.25 for a 4x upsample")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    # Compiles both kernels
+    benchmarkImage("warmup", benchmarkStages.makeSpheres(8, 2), 0.5, 1)
+
+    datasets = [("multilabelTestShape",
+                 np.load(os.path.join(benchmarkStages.DATA_DIR,
+                                      "multilabelTestShape.npy"))),
+                ("spheres-32-8", benchmarkStages.makeSpheres(32, 8))]
+
+    print("threads %d" % nb.get_num_threads())
+    print("%-22s %12s %12s %10s %10s %8s" % ("dataset", "outputVoxels",
+                                             "boundary", "legacy s",
+                                             "parallel s", "speedup"))
+    for name, matrix in datasets:
+        result = benchmarkImage(name, matrix, args.scale, args.repeats)
+        print("%-22s %12d %12d %10.3f %10.3f %7.2fx" % (
+            name, result["outputVoxels"], result["boundaryPoints"],
+            result["legacy"], result["parallel"],
+            result["legacy"]/result["parallel"]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
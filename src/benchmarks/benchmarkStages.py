@@ -0,0 +1,329 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import sys
+import time
+import numpy as np
+from SegmentationUpsampler import Extractor
+from SegmentationUpsampler import FillGaps
+from SegmentationUpsampler import FillGapsNumba
+from SegmentationUpsampler import ImageBase
+from SegmentationUpsampler import ImageIO
+from SegmentationUpsampler import LabelSeparater
+from SegmentationUpsampler import Preprocess
+from SegmentationUpsampler import UpsampleMultiLabels
+
+"""
+Benchmark of the upsampling pipeline stage by stage
+
+DESCRIPTION:
+    Runs each stage of the pipeline on synthetic spheres and tori of
+    several sizes and label counts, and on the bundled padded_liver.mat
+    and vertebra NIfTI, recording for every stage:
+    - seconds      : wall time
+    - peakMiB      : peak resident set size during the stage
+    - deltaMiB     : peak minus the resident set size at its start
+    The peak is reset before each stage through /proc/self/clear_refs,
+    so it covers that stage only. Where this is not available, the
+    process high-water mark is reported and deltaMiB is NaN.
+
+    Stages, each over all labels of an image:
+    - separation, preprocessing (automatic sigma and iso), extraction
+    - voxelizer-numba, voxelizer-python, voxelizer-scanline
+    - fillgaps-numba, fillgaps-python, on the first voxelizer output
+    The pure Python stages are skipped on outputs larger than
+    --max-python-voxels. A tiny image is run first, so Numba compile
+    time is not part of the results.
+
+USAGE:
+    PYTHONPATH=src python src/benchmarks/benchmarkStages.py
+    PYTHONPATH=src python src/benchmarks/benchmarkStages.py \
+        --sizes 32 64 --labels 1 8 --no-files --json after.json \
+        --compare before.json
+
+ABOUT:
+    author - Liangpu Liu, Rui Xu, Bradley Treeby
+    date - 18th Oct 2026
+    last update - 18th Oct 2026
+
+LICENSE:
+    This function is part of the pySegmentationUpsampler.
+    Copyright (C) 2024  Liangpu Liu, Rui Xu, and Bradley Treeby.
+
+This file is part of pySegmentationUpsampler, pySegmentationUpsampler
+is free software: you can redistribute it and/or modify it under the
+terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at
+your option) any later version.
+
+pySegmentationUpsampler is distributed in the hope that it will be
+useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with pySegmentationUpsampler. If not, see
+<http://www.gnu.org/licenses/>.
+
+"""
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "..", "data")
+
+STAGES = ("separation", "preprocessing", "extraction", "voxelizer-numba",
+          "voxelizer-python", "voxelizer-scanline", "fillgaps-numba",
+          "fillgaps-python")
+
+PYTHON_STAGES = ("voxelizer-python", "fillgaps-python")
+
+def getCells(size, labels):
+    """Centres and radius of a grid of cells holding one shape each."""
+    perAxis = int(np.ceil(labels**(1/3)))
+    cell = size/perAxis
+    centres = [((i + 0.5)*cell, (j + 0.5)*cell, (k + 0.5)*cell)
+               for i in range(perAxis) for j in range(perAxis)
+               for k in range(perAxis)][:labels]
+    return centres, 0.4*cell
+
+def makeSpheres(size, labels):
+    """Cubic image of edge size with labels spheres of labels 1, 2, ..."""
+    x, y, z = np.ogrid[:size, :size, :size]
+    image = np.zeros((size, size, size), dtype=np.uint8)
+    centres, radius = getCells(size, labels)
+    for label, (cx, cy, cz) in enumerate(centres, start=1):
+        image[(x - cx)**2 + (y - cy)**2 + (z - cz)**2 <= radius**2] = label
+    return image
+
+def makeTori(size, labels):
+    """Cubic image of edge size with labels tori, alternating axes."""
+    grid = np.ogrid[:size, :size, :size]
+    image = np.zeros((size, size, size), dtype=np.uint8)
+    centres, radius = getCells(size, labels)
+    for label, centre in enumerate(centres, start=1):
+        axis = label % 3
+        d = [grid[a] - centre[a] for a in range(3)]
+        plane = [d[a] for a in range(3) if a != axis]
+        ring = np.sqrt(plane[0]**2 + plane[1]**2) - 0.65*radius
+        image[ring**2 + d[axis]**2 <= (0.3*radius)**2] = label
+    return image
+
+def getDatasets(sizes, labelCounts, files = True):
+    """
+    GETDATASETS Benchmark images.
+
+    RETURNS:
+        list: (name, multiLabelMatrix, spacing, scale) per image
+    """
+    datasets = []
+    for size in sizes:
+        for labels in labelCounts:
+            for shape, make in (("spheres", makeSpheres),
+                                ("tori", makeTori)):
+                datasets.append(("%s-%d-%d" % (shape, size, labels),
+                                 make(size, labels), [1, 1, 1],
+                                 [0.5, 0.5, 0.5]))
+    if files:
+        # Resampled to isotropic voxels, as in the README demos
+        liver, spacing, _ = ImageIO.readImage(
+            os.path.join(DATA_DIR, "padded_liver.mat"))
+        datasets.append(("padded_liver", liver, spacing, [min(spacing)]*3))
+        vertebra, spacing, _ = ImageIO.readImage(
+            os.path.join(DATA_DIR, "sub-gl003_dir-ax_seg-vert_msk.nii.gz"))
+        datasets.append(("vertebra", vertebra, spacing, [0.8, 0.8, 0.8]))
+    return datasets
+
+def resetPeakRSS():
+    """Reset the peak RSS of the process, False if not supported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as clearRefs:
+            clearRefs.write("5")
+        return True
+    except OSError:
+        return False
+
+def getRSS(field = "VmRSS"):
+    """Current (VmRSS) or peak (VmHWM) RSS in MiB."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])/1024
+    except OSError:
+        pass
+    # ru_maxrss is the peak RSS in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+def measure(function):
+    """
+    MEASURE Run function, silencing its progress messages.
+
+    RETURNS:
+        tuple: (result, seconds, peakMiB, deltaMiB)
+    """
+    reset = resetPeakRSS()
+    start = getRSS()
+    startTime = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function()
+    seconds = time.perf_counter() - startTime
+    peak = getRSS("VmHWM")
+    return result, seconds, peak, peak - start if reset else np.nan
+
+def separateLabels(segImg):
+    labelSeparationInstance = LabelSeparater.LabelSeparation(segImg)
+    labelSeparationInstance.separateLabels()
+    labelSeparationInstance.updateImg()
+    segImg.setOutputLabels()
+
+def preprocessLabels(segImg):
+    for i in range(segImg.getLabelNumber()):
+        preprocesser = Preprocess.ImagePreprocess(segImg, i, False,
+                                                  segImg.isoTolerance)
+        preprocesser.meshPreprocessing()
+        preprocesser.updateImg()
+
+def extractLabels(segImg):
+    for i in range(segImg.getLabelNumber()):
+        isosurfaceExtractor = Extractor.IsosurfaceExtractor(segImg, i,
+                                                            meshArrays=False)
+        isosurfaceExtractor.extractIsosurface()
+        isosurfaceExtractor.updateImg()
+
+def voxelizeLabels(segImg, NB, engine):
+    segImg.allocateNewImg()
+    for i in range(segImg.getLabelNumber()):
+        block, offset = UpsampleMultiLabels.voxelizeLabel(segImg, i, NB,
+                                                          engine)
+        UpsampleMultiLabels.mergeLabel(segImg, i, block, offset)
+    return segImg.newImg
+
+def fillGaps(segImg, newImg, gapFillerClass):
+    segImg.newImg = newImg.copy()
+    gapFiller = gapFillerClass(segImg)
+    gapFiller.fillZeros()
+    gapFiller.updateImg()
+    return segImg.newImg
+
+def benchmarkDataset(name, multiLabelMatrix, spacing, scale, sigma = -1,
+                     iso = -1, stages = STAGES, maxPythonVoxels = 10**6):
+    """
+    BENCHMARKDATASET Time every selected stage on one image.
+
+    RETURNS:
+        list: one dict per stage with dataset, stage, labels, seconds,
+        peakMiB and deltaMiB, seconds None for skipped stages
+    """
+    segImg = ImageBase.SegmentedImage(multiLabelMatrix, sigma, scale,
+                                      spacing, iso, dtype=None)
+    outputVoxels = int(np.prod(segImg.newShape))
+
+    steps = [("separation", lambda: separateLabels(segImg)),
+             ("preprocessing", lambda: preprocessLabels(segImg)),
+             ("extraction", lambda: extractLabels(segImg)),
+             ("voxelizer-numba",
+              lambda: voxelizeLabels(segImg, True, "distance")),
+             ("voxelizer-python",
+              lambda: voxelizeLabels(segImg, False, "distance")),
+             ("voxelizer-scanline",
+              lambda: voxelizeLabels(segImg, True, "scanline")),
+             ("fillgaps-numba",
+              lambda: fillGaps(segImg, voxelized, FillGapsNumba.FillGaps)),
+             ("fillgaps-python",
+              lambda: fillGaps(segImg, voxelized, FillGaps.FillGaps))]
+
+    records = []
+    voxelized = None
+    for stage, step in steps:
+        # Later stages need the first three, so these always run
+        required = stage in ("separation", "preprocessing", "extraction")
+        selected = stage in stages and not (stage in PYTHON_STAGES and
+                                            outputVoxels > maxPythonVoxels)
+        record = dict(dataset=name, stage=stage, labels=None, seconds=None,
+                      peakMiB=None, deltaMiB=None)
+        records.append(record)
+        if not (selected or required):
+            record["labels"] = segImg.getLabelNumber()
+            continue
+
+        if stage.startswith("fillgaps") and voxelized is None:
+            # The gap fillers need a voxelized image
+            with contextlib.redirect_stdout(io.StringIO()):
+                voxelized = voxelizeLabels(segImg, True, "scanline")
+
+        result, seconds, peak, delta = measure(step)
+        if stage.startswith("voxelizer") and voxelized is None:
+            voxelized = result
+        record["labels"] = segImg.getLabelNumber()
+        if selected:
+            record.update(seconds=seconds, peakMiB=peak, deltaMiB=delta)
+    return records
+
+def warmup():
+    """Compile the Numba kernels on a tiny image."""
+    benchmarkDataset("warmup", makeSpheres(8, 2), [1, 1, 1],
+                     [0.5, 0.5, 0.5], maxPythonVoxels=0)
+
+def printRecords(records, baseline = None):
+    """Print a table of records, with time ratios to a baseline."""
+    before = {}
+    for record in baseline or []:
+        before[record["dataset"], record["stage"]] = record["seconds"]
+
+    print("%-22s %-19s %6s %10s %10s %10s %s" % (
+        "dataset", "stage", "labels", "seconds", "peakMiB", "deltaMiB",
+        "ratio" if baseline else ""))
+    for record in records:
+        if record["seconds"] is None:
+            print("%-22s %-19s %6s %10s" % (record["dataset"],
+                                            record["stage"], "", "skipped"))
+            continue
+        ratio = ""
+        old = before.get((record["dataset"], record["stage"]))
+        if old:
+            ratio = "%.2fx" % (record["seconds"]/old)
+        print("%-22s %-19s %6d %10.3f %10.1f %10.1f %s" % (
+            record["dataset"], record["stage"], record["labels"],
+            record["seconds"], record["peakMiB"], record["deltaMiB"], ratio))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the upsampling pipeline stage by stage.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[32, 64],
+                        help="edge lengths of the synthetic images")
+    parser.add_argument("--labels", type=int, nargs="+", default=[1, 8],
+                        help="label counts of the synthetic images")
+    parser.add_argument("--no-files", dest="files", action="store_false",
+                        help="skip padded_liver.mat and the vertebra")
+    parser.add_argument("--stages", nargs="+", choices=STAGES,
+                        default=list(STAGES))
+    parser.add_argument("--max-python-voxels", dest="maxPythonVoxels",
+                        type=int, default=10**6,
+                        help="largest output for the pure Python stages")
+    parser.add_argument("--json", help="write the records to this file")
+    parser.add_argument("--compare", help="records of an earlier run")
+    args = parser.parse_args(argv)
+
+    warmup()
+    records = []
+    for name, matrix, spacing, scale in getDatasets(args.sizes, args.labels,
+                                                    args.files):
+        records += benchmarkDataset(name, matrix, spacing, scale,
+                                    stages=args.stages,
+                                    maxPythonVoxels=args.maxPythonVoxels)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baselineFile:
+            baseline = json.load(baselineFile)
+    printRecords(records, baseline)
+
+    if args.json:
+        with open(args.json, "w") as jsonFile:
+            json.dump(records, jsonFile, indent=1)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+import numpy as np
+from benchmarks import benchmarkMeshPostProcessing
+from benchmarks import benchmarkPointWiseProcess
+from benchmarks import benchmarkStages
+
+def test_synthetic_shapes():
+    for make in [benchmarkStages.makeSpheres, benchmarkStages.makeTori]:
+        image = make(24, 8)
+        assert image.shape == (24, 24, 24)
+        np.testing.assert_array_equal(np.unique(image), np.arange(9))
+
+def test_benchmark_records_every_stage():
+    records = benchmarkStages.benchmarkDataset(
+        "spheres", benchmarkStages.makeSpheres(16, 2), [1, 1, 1], 
+        [0.5, 0.5, 0.5], stages=("separation", "extraction", 
+                                 "voxelizer-scanline", "fillgaps-numba", 
+                                 "fillgaps-python"), 
+        maxPythonVoxels=0)
+
+    assert [record["stage"] for record in records] == list(
+        benchmarkStages.STAGES)
+    for record in records:
+        assert record["labels"] == 2
+        if record["stage"] in ("preprocessing", "voxelizer-numba", 
+                               "voxelizer-python", "fillgaps-python"):
+            assert record["seconds"] is None
+        else:
+            assert record["seconds"] >= 0 and record["peakMiB"] > 0
+
+def test_point_wise_process_matches_legacy_kernel():
+    result = benchmarkPointWiseProcess.benchmarkImage(
+        "tori", benchmarkStages.makeTori(16, 3), 0.25, 1)
+
+    assert result["boundaryPoints"] > 0
+    assert result["legacy"] > 0 and result["parallel"] > 0
+
+def test_mesh_post_processing_reference_and_dice():
+    image = benchmarkStages.makeSpheres(16, 2)
+    reference = benchmarkMeshPostProcessing.makeSpheresReference(16, 2, 1)
+    np.testing.assert_array_equal(reference, image)
+    assert benchmarkMeshPostProcessing.getDice(image, reference) == 1
+    assert benchmarkMeshPostProcessing.getDice(image == 1, reference) == 0.5
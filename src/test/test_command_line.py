@@ -0,0 +1,100 @@
+import numpy as np
+import os
+import vtk
+from vtk.util import numpy_support
+from SegmentationUpsampler import ImageIO
+from SegmentationUpsampler.CommandLine import main
+from SegmentationUpsampler.UpsampleMultiLabels import upsample
+
+base_path = os.path.dirname(__file__)
+data_dir = os.path.join(base_path, "../data/")
+image = np.load(os.path.join(data_dir, "multilabelTestShape.npy"))
+
+options = ["--scale", "0.5", "--sigma", "0.6", "--iso", "0.4", 
+           "--engine", "scanline"]
+
+def test_nifti_round_trip_keeps_orientation(tmp_path):
+    inputPath = os.path.join(data_dir, "sub-gl003_dir-ax_seg-vert_msk.nii.gz")
+    matrix, spacing, header = ImageIO.readImage(inputPath)
+    assert matrix.shape == (512, 512, 214)
+    np.testing.assert_allclose(spacing, [0.291016, 0.291016, 1.25], rtol=1e-6)
+
+    outputPath = str(tmp_path / "vertebra.nii.gz")
+    ImageIO.writeImage(outputPath, matrix[:, :, ::2], [0.3, 0.3, 2.5], header)
+    written, writtenSpacing, writtenHeader = ImageIO.readImage(outputPath)
+    np.testing.assert_array_equal(written, matrix[:, :, ::2])
+    np.testing.assert_allclose(writtenSpacing, [0.3, 0.3, 2.5])
+    for row in range(4):
+        for column in range(4):
+            assert (writtenHeader.GetSFormMatrix().GetElement(row, column) == 
+                    header.GetSFormMatrix().GetElement(row, column))
+
+def test_nifti_rescale_applied_once(tmp_path):
+    # Stored labels 0..7 with scl_slope 2 are read as 0, 2, ..., 14
+    data = image.astype(np.int16)
+    vtkImage = vtk.vtkImageData()
+    vtkImage.SetDimensions(*data.shape)
+    vtkImage.GetPointData().SetScalars(numpy_support.numpy_to_vtk(
+        np.ascontiguousarray(data.transpose(2, 1, 0)).ravel(), deep=1))
+    writer = vtk.vtkNIFTIImageWriter()
+    writer.SetInputData(vtkImage)
+    writer.SetFileName(str(tmp_path / "scaled.nii"))
+    writer.SetRescaleSlope(2.0)
+    writer.Write()
+
+    inputPath = str(tmp_path / "scaled.nii")
+    matrix, spacing, header = ImageIO.readImage(inputPath)
+    np.testing.assert_array_equal(matrix, 2*image)
+
+    outputPath = str(tmp_path / "copy.nii")
+    ImageIO.writeImage(outputPath, matrix, spacing, header)
+    np.testing.assert_array_equal(ImageIO.readImage(outputPath)[0], matrix)
+
+    outputPath = str(tmp_path / "upsampled.nii.gz")
+    assert main([inputPath, outputPath] + options) == 0
+    result = ImageIO.readImage(outputPath)[0]
+    expected = upsample(matrix, [0.5, 0.5, 0.5], sigma=0.6, iso=0.4, 
+                        engine="scanline")
+    np.testing.assert_array_equal(result, expected)
+    assert set(np.unique(result)) <= set(np.unique(matrix))
+
+def test_single_file(tmp_path):
+    inputPath = str(tmp_path / "shape.npy")
+    outputPath = str(tmp_path / "shape.nii.gz")
+    np.save(inputPath, image)
+
+    assert main([inputPath, outputPath] + options) == 0
+    result, spacing, _ = ImageIO.readImage(outputPath)
+    expected = upsample(image, [0.5, 0.5, 0.5], sigma=0.6, iso=0.4, 
+                        engine="scanline")
+    np.testing.assert_array_equal(result, expected)
+    np.testing.assert_allclose(spacing, [0.5, 0.5, 0.5])
+
+    assert main([inputPath, outputPath, "--mesh-repair", "auto", 
+                 "--mesh-simplify", "decimate"] + options) == 0
+    expected = upsample(image, [0.5, 0.5, 0.5], sigma=0.6, iso=0.4, 
+                        engine="scanline", meshRepair="auto", 
+                        meshSimplify="decimate")
+    np.testing.assert_array_equal(ImageIO.readImage(outputPath)[0], expected)
+
+def test_manifest_with_worker_pool(tmp_path):
+    np.save(str(tmp_path / "a.npy"), image)
+    np.save(str(tmp_path / "b.npy"), image[::-1])
+    manifest = tmp_path / "cases.txt"
+    manifest.write_text("# input output\n" + 
+                        "a.npy a.mat\n\n" + 
+                        "b.npy\n" + 
+                        "missing.npy\n")
+
+    outputDir = str(tmp_path / "out")
+    status = main(["--manifest", str(manifest), outputDir, "--jobs", "2"] + 
+                  options)
+    assert status == 1     # missing.npy
+
+    a, spacing, _ = ImageIO.readImage(str(tmp_path / "a.mat"))
+    b = np.load(os.path.join(outputDir, "b.npy"))
+    np.testing.assert_array_equal(a, upsample(image, [0.5, 0.5, 0.5], 
+                                              sigma=0.6, iso=0.4, 
+                                              engine="scanline"))
+    assert a.shape == b.shape
+    assert spacing == [0.5, 0.5, 0.5]
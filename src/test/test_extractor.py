@@ -0,0 +1,99 @@
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+from SegmentationUpsampler import ImageBase, LabelSeparater, Preprocess, Extractor
+
+def test_mesh_arrays_match_cell_traversal():
+    x, y, z = np.mgrid[:20, :20, :20]
+    image = np.float32((x - 9.5)**2 + (y - 9.5)**2 + (z - 9.5)**2 < 36)
+
+    segImg = ImageBase.SegmentedImage(image, 0.6, [0.5, 0.5, 0.5], [1, 1, 1], 0.4)
+    separator = LabelSeparater.LabelSeparation(segImg)
+    separator.separateLabels()
+    separator.updateImg()
+    preprocesser = Preprocess.ImagePreprocess(segImg, 0, False)
+    preprocesser.meshPreprocessing()
+    preprocesser.updateImg()
+
+    extractor = Extractor.IsosurfaceExtractor(segImg, 0)
+    extractor.extractIsosurface()
+    polyData = extractor.polyData
+
+    faces = []
+    cells = polyData.GetPolys()
+    cells.InitTraversal()
+    idList = vtk.vtkIdList()
+    while cells.GetNextCell(idList):
+        faces.append([idList.GetId(0), idList.GetId(1), idList.GetId(2)])
+    points = polyData.GetPoints()
+    nodes = [points.GetPoint(i) for i in range(points.GetNumberOfPoints())]
+
+    np.testing.assert_array_equal(extractor.faces, np.array(faces))
+    np.testing.assert_array_equal(extractor.nodes, np.array(nodes))
+
+    lean = Extractor.IsosurfaceExtractor(segImg, 0, meshArrays=False)
+    lean.extractIsosurface()
+    assert lean.faces is None and lean.nodes is None
+    assert lean.polyData.GetNumberOfCells() == len(faces)
+
+def test_scalars_wrap_cropped_block_in_native_dtype():
+    x, y, z = np.mgrid[:16, :16, :16]
+    image = np.float32((x - 7.5)**2 + (y - 7.5)**2 + (z - 7.5)**2 < 25)
+
+    segImg = ImageBase.SegmentedImage(image, 0.6, [0.5, 0.5, 0.5], [1, 1, 1], 0.4)
+    separator = LabelSeparater.LabelSeparation(segImg)
+    separator.separateLabels()
+    separator.updateImg()
+    preprocesser = Preprocess.ImagePreprocess(segImg, 0, False)
+    preprocesser.meshPreprocessing()
+    preprocesser.updateImg()
+    binImg = segImg.binaryImgList[0]
+    assert binImg.croppedImg.dtype == np.float32
+
+    cells = []
+    for dtype in [np.float32, np.float64]:
+        binImg.croppedImg = binImg.croppedImg.astype(dtype)
+        extractor = Extractor.IsosurfaceExtractor(segImg, 0)
+        extractor.extractIsosurface()
+        scalars = numpy_support.vtk_to_numpy(extractor.scalars)
+        assert scalars.dtype == dtype
+        assert np.shares_memory(scalars, binImg.croppedImg)
+        cells.append(extractor.polyData.GetNumberOfCells())
+    assert cells[0] == cells[1] > 0
+
+def test_mesh_repair_and_simplify_options():
+    x, y, z = np.mgrid[:24, :24, :24]
+    image = np.float32((x - 11.5)**2 + (y - 11.5)**2 + (z - 11.5)**2 < 64)
+
+    segImg = ImageBase.SegmentedImage(image, 0.6, [0.5, 0.5, 0.5], [1, 1, 1], 0.4)
+    separator = LabelSeparater.LabelSeparation(segImg)
+    separator.separateLabels()
+    separator.updateImg()
+    preprocesser = Preprocess.ImagePreprocess(segImg, 0, False)
+    preprocesser.meshPreprocessing()
+    preprocesser.updateImg()
+
+    meshes = {}
+    for meshRepair, meshSimplify in [("always", None), ("auto", None), 
+                                     ("always", "decimate"), 
+                                     ("always", "smooth")]:
+        segImg.meshRepair = meshRepair
+        segImg.meshSimplify = meshSimplify
+        extractor = Extractor.IsosurfaceExtractor(segImg, 0)
+        assert extractor.maxError == 0.25
+        extractor.extractIsosurface()
+        meshes[meshRepair, meshSimplify] = extractor
+
+    default = meshes["always", None]
+    assert Extractor.IsosurfaceExtractor.isWatertight(default.polyData)
+    # Cleaning only renumbers the points of a watertight surface
+    unrepaired = meshes["auto", None]
+    assert len(unrepaired.faces) == len(default.faces)
+    np.testing.assert_array_equal(np.unique(unrepaired.nodes, axis=0), 
+                                  np.unique(default.nodes, axis=0))
+    assert len(meshes["always", "decimate"].faces) < len(default.faces) / 2
+
+    smoothed = meshes["always", "smooth"]
+    np.testing.assert_array_equal(smoothed.faces, default.faces)
+    displacement = np.linalg.norm(smoothed.nodes - default.nodes, axis=1)
+    assert 0 < displacement.max() <= 0.25 + 1e-6
@@ -0,0 +1,82 @@
+import numpy as np
+from SegmentationUpsampler import FillGapsNumba
+
+def fill_reference(new_matrix, inside, dx):
+    # Voxel by voxel scan in raster order
+    new_matrix = new_matrix.copy()
+    xx, yy, zz = new_matrix.shape
+    for x, y, z in np.argwhere(new_matrix == 0):
+        if not inside[int(x*dx), int(y*dx), int(z*dx)]:
+            continue
+        block = new_matrix[max(0, x-1):x+2, max(0, y-1):y+2, 
+                           max(0, z-1):z+2]
+        surroundings = block[block != 0]
+        if len(surroundings):
+            new_matrix[x, y, z] = np.bincount(surroundings).argmax()
+    return new_matrix
+
+def test_fill_kernels_match_raster_scan():
+    rng = np.random.default_rng(0)
+    new_matrix = rng.choice(np.uint8([0, 0, 0, 1, 2, 3]), size=(20, 18, 16))
+    inside = rng.random((10, 9, 8)) < 0.7
+    dx = 0.5
+    ix, iy, iz = (np.array([int(n*dx) for n in range(s)]) 
+                  for s in new_matrix.shape)
+
+    expected = fill_reference(new_matrix, inside, dx)
+
+    candidates = FillGapsNumba.markCandidates(new_matrix, inside, ix, iy, iz)
+    clustered = FillGapsNumba.fillIsolated(new_matrix, candidates)
+    result = FillGapsNumba.fillClustered(new_matrix, candidates, clustered)
+    np.testing.assert_array_equal(result, expected)
+
+def test_fill_slabs_match_whole_grid():
+    rng = np.random.default_rng(1)
+    new_matrix = rng.choice(np.uint8([0, 0, 0, 1, 2, 3]), size=(20, 18, 16))
+    inside = rng.random((10, 9, 8)) < 0.7
+
+    class Image:
+        multiLabelMatrix = inside
+        newImg = new_matrix
+        dx = [0.5, 0.5, 0.5]
+        iso = 0.5
+        binaryImgList = []
+        def getLabelNumber(self):
+            return 0
+
+    gapFiller = FillGapsNumba.FillGaps(Image())
+    gapFiller.inside = inside
+    expected = fill_reference(new_matrix, inside, 0.5)
+
+    result = new_matrix.copy()
+    for start in range(0, 20, 6):
+        stop = min(start + 6, 20)
+        lower, upper = max(start - 1, 0), min(stop + 1, 20)
+        tile = result[lower:upper].copy()
+        tile = gapFiller.fillBlock(tile, lower, start - lower, stop - lower)
+        result[start:stop] = tile[start - lower:stop - lower]
+    np.testing.assert_array_equal(result, expected)
+
+def test_inside_mask_compares_in_double_precision():
+    # float32(0.4) is one float32 ulp above the float64 isovalue 0.4, 
+    # and equal to it in single precision
+    above = np.float32(0.4)
+    below = np.nextafter(above, np.float32(0))
+    croppedImg = np.array([[[above, below]]], dtype=np.float32)
+
+    class Label:
+        bounds = (np.array([1, 1, 1]), np.array([2, 2, 3]))
+    Label.croppedImg = croppedImg
+
+    class Image:
+        multiLabelMatrix = np.zeros((3, 3, 3))
+        newImg = np.zeros((6, 6, 6), dtype=np.uint8)
+        dx = [0.5, 0.5, 0.5]
+        iso = 0.4
+        binaryImgList = [Label()]
+        def getLabelNumber(self):
+            return 1
+
+    inside = FillGapsNumba.FillGaps(Image()).getInsideMask()
+    assert inside[1, 1, 1] and not inside[1, 1, 2]
+    assert np.count_nonzero(inside) == 1
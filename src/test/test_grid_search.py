@@ -0,0 +1,31 @@
+import numpy as np
+import os
+from SegmentationUpsampler.GridSearch import gridSearch
+from SegmentationUpsampler.UpsampleMultiLabels import upsample
+
+base_path = os.path.dirname(__file__)
+data_dir = os.path.join(base_path, "../data/")
+image = np.load(os.path.join(data_dir, "multilabelTestShape.npy"))
+
+def test_grid_search_finds_reference_parameters():
+    scale = [0.5, 0.5, 0.5]
+    reference = upsample(image, scale, sigma=0.6, iso=0.4, engine="scanline")
+
+    results = []
+    for workers in [1, 2]:
+        table, best = gridSearch(image, reference, scale, [0.3, 0.6], 
+                                 [0.3, 0.4, 0.5], engine="scanline", 
+                                 workers=workers)
+        results.append(table)
+        assert best == (0.6, 0.4)
+
+    table = results[0]
+    np.testing.assert_array_equal(results[1], table)
+    assert list(table["sigma"]) == [0.3]*3 + [0.6]*3
+    assert list(table["iso"]) == [0.3, 0.4, 0.5]*2
+
+    row = table[(table["sigma"] == 0.6) & (table["iso"] == 0.4)][0]
+    assert row["mislabels"] == 0 and row["gaps"] == 0
+    assert row["volumeError"] == 0
+    # Raising the isovalue shrinks the labels
+    assert np.all(np.diff(table["volumeError"][3:]) < 0)
@@ -0,0 +1,50 @@
+import json
+import os
+import subprocess
+import sys
+
+base_path = os.path.dirname(__file__)
+
+ENGINES = ("from SegmentationUpsampler import Extractor, FillGaps, " + 
+           "FillGapsNumba, Voxelizer, VoxelizerNumba, VoxelizerScanline")
+
+def importUpsampleMultiLabels(extra = "", repeats = 1):
+    """Best import seconds over fresh interpreters, and vtk/numba loaded."""
+    code = ("import json, sys, time\n" + 
+            "start = time.perf_counter()\n" + 
+            "from SegmentationUpsampler import UpsampleMultiLabels\n" + 
+            extra + "\n" + 
+            "seconds = time.perf_counter() - start\n" + 
+            "print(json.dumps([seconds, sorted({'vtk', 'numba'} & " + 
+            "set(sys.modules))]))")
+    env = dict(os.environ, PYTHONPATH=os.path.join(base_path, ".."))
+    results = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code], env=env, 
+                                capture_output=True, text=True, 
+                                check=True).stdout
+        results.append(json.loads(output))
+    return min(seconds for seconds, _ in results), results[0][1]
+
+def test_import_loads_no_engine():
+    _, modules = importUpsampleMultiLabels(
+        "UpsampleMultiLabels.ValidateInputs(__import__('numpy').zeros(" + 
+        "(2, 2, 2)), -1, [1, 1, 1], [1, 1, 1], -1, False, True)")
+    assert modules == []
+
+def test_engine_selection_loads_its_modules():
+    for extra, expected in [
+            ("UpsampleMultiLabels.getGapFillerClass(False)", []), 
+            ("UpsampleMultiLabels.getGapFillerClass(True)", ["numba"]), 
+            ("UpsampleMultiLabels.getVoxelizerClass(False)", ["vtk"]), 
+            ("UpsampleMultiLabels.getVoxelizerClass(True)", 
+             ["numba", "vtk"])]:
+        assert importUpsampleMultiLabels(extra)[1] == expected
+
+def test_import_time_benchmark():
+    lazy, _ = importUpsampleMultiLabels(repeats=3)
+    eager, modules = importUpsampleMultiLabels(ENGINES, repeats=3)
+    print("UpsampleMultiLabels import %.3f s, with all engines %.3f s" % (
+        lazy, eager))
+    assert modules == ["numba", "vtk"]
+    assert lazy < eager
@@ -0,0 +1,99 @@
+import numpy as np
+import os
+from scipy.ndimage import correlate, gaussian_filter
+from SegmentationUpsampler import ImageBase, LabelSeparater, Preprocess
+from SegmentationUpsampler.IsoSearch import IsovalueSearch
+from SegmentationUpsampler.ShapeMetrics import computeShapeMetrics
+
+rng = np.random.default_rng(1)
+mask = np.zeros((16, 14, 12), dtype=np.float32)
+mask[3:12, 4:10, 2:9] = 1
+mask[rng.random(mask.shape) > 0.9] = 1
+smoothed = gaussian_filter(mask, sigma=0.7)
+
+def test_metrics_match_thresholding():
+    searcher = IsovalueSearch(smoothed)
+    for iso in [0.05, 0.2, 0.4, 0.55, 0.9]:
+        volume, area, _ = computeShapeMetrics(smoothed >= iso)
+        assert searcher.getShapeMetrics(iso) == (volume, area)
+
+def test_linear_search_matches_scan():
+    volume, area, _ = computeShapeMetrics(mask)
+    targetAV = area**(1/2)/volume**(1/3)
+
+    minDiff = 9999
+    expected = 0
+    isovalue = 0
+    while isovalue < 0.6:
+        isovalue += 0.001
+        volume, area, _ = computeShapeMetrics(smoothed >= isovalue)
+        thisAV = area**(1/2)/volume**(1/3)
+        if abs(thisAV - targetAV) < minDiff:
+            minDiff = abs(thisAV - targetAV)
+            expected = isovalue
+
+    searcher = IsovalueSearch(smoothed)
+    assert searcher.linearSearch(targetAV) == expected
+    assert abs(searcher.goldenSectionSearch(targetAV, tolerance=1e-4)
+               - expected) < 0.05
+
+# Surface kernels of the baseline ImagePreprocess
+surfaceKernel = np.array([[[0,0,0],[0,-1,0],[0,0,0]],
+                          [[0,-1,0],[-1,6,-1],[0,-1,0]],
+                          [[0,0,0],[0,-1,0],[0,0,0]]])
+axialKernels = [np.array([[[0,0,0],[0,0,0],[0,0,0]],
+                          [[0,-1,0],[-1,4,-1],[0,-1,0]],
+                          [[0,0,0],[0,0,0],[0,0,0]]]),
+                np.array([[[0,0,0],[0,-1,0],[0,0,0]],
+                          [[0,0,0],[-1,4,-1],[0,0,0]],
+                          [[0,0,0],[0,-1,0],[0,0,0]]]),
+                np.array([[[0,0,0],[0,-1,0],[0,0,0]],
+                          [[0,-1,0],[0,4,0],[0,-1,0]],
+                          [[0,0,0],[0,-1,0],[0,0,0]]])]
+
+def baselineConvolution(array, kernel):
+    # The baseline sparseConvolution wrote its result into array
+    surface = correlate(array, kernel, mode='constant', cval=0)
+    array[array != 0] = surface[array != 0]
+    return array
+
+def baselineAV(array):
+    area = np.sum(np.abs(baselineConvolution(array, surfaceKernel)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (area**(1/2))/(np.sum(array)**(1/3))
+
+def test_default_scan_matches_baseline_loop():
+    image = np.load(os.path.join(os.path.dirname(__file__), 
+                                 "../data/multilabelTestShape.npy"))
+    for sigma in [-1, 0.6]:
+        segImg = ImageBase.SegmentedImage(image, sigma, [0.5, 0.5, 0.5], 
+                                          [1, 1, 1], -1, verbose=False)
+        separator = LabelSeparater.LabelSeparation(segImg)
+        separator.separateLabels()
+        separator.updateImg()
+
+        for i in range(segImg.getLabelNumber()):
+            preprocesser = Preprocess.ImagePreprocess(segImg, i, False)
+            preprocesser.meshPreprocessing()
+
+            # Mask as left by the baseline anisotropic setSigma
+            array = np.int32(segImg.binaryImgList[i].labelMask)
+            if sigma == -1:
+                for kernel in axialKernels + [surfaceKernel]:
+                    baselineConvolution(array, kernel)
+                baselineAV(array)
+
+            # The per-isovalue loop of the baseline computeIso
+            originalAV = baselineAV(array)
+            minDiff = 9999
+            expected = 0
+            isovalue = 0
+            while isovalue < 0.6:
+                isovalue += 0.001
+                thisAV = baselineAV(np.int32(preprocesser.croppedMatrix >= 
+                                             isovalue))
+                if abs(thisAV - originalAV) < minDiff:
+                    minDiff = abs(thisAV - originalAV)
+                    expected = isovalue
+
+            assert preprocesser.iso == expected
@@ -0,0 +1,83 @@
+import numpy as np
+from SegmentationUpsampler import ImageBase, LabelSeparater
+
+def test_separate_labels_sparse():
+    image = np.zeros((8, 9, 10), dtype=np.float32)
+    image[1:3, 1:4, 1:5] = 2
+    image[4:8, 2:9, 3:10] = 5
+    image[0, 0, 0] = 7
+
+    segImg = ImageBase.SegmentedImage(image, 0.5, [1, 1, 1], [1, 1, 1], 0.5)
+    separator = LabelSeparater.LabelSeparation(segImg)
+    separator.separateLabels()
+    separator.updateImg()
+
+    np.testing.assert_array_equal(segImg.labels, [5, 2, 7])
+    np.testing.assert_array_equal(segImg.labelVolume, [196, 24, 1])
+    assert segImg.labelSlices[0] == (slice(4, 8), slice(2, 9), slice(3, 10))
+    assert segImg.labelMasks[1].shape == (2, 3, 4)
+
+    for i in range(segImg.getLabelNumber()):
+        binImg, label = segImg.getLabel(i)
+        assert binImg.dtype == np.float32
+        np.testing.assert_array_equal(binImg, image == label)
+
+def test_separate_labels_memmap_slabs(tmp_path):
+    image = np.zeros((8, 9, 10), dtype=np.float32)
+    image[1:3, 1:4, 1:5] = 2
+    image[4:8, 2:9, 3:10] = 5
+    image[0, 0, 0] = 7
+    np.save(tmp_path / "image.npy", image)
+    mapped = np.load(tmp_path / "image.npy", mmap_mode="r")
+
+    segImg = ImageBase.SegmentedImage(mapped, 0.5, [1, 1, 1], [1, 1, 1], 0.5)
+    separator = LabelSeparater.LabelSeparation(segImg, chunkSize=90)
+    separator.separateLabels()
+    separator.updateImg()
+
+    assert separator.chunkRows == 1
+    np.testing.assert_array_equal(segImg.labels, [5, 2, 7])
+    np.testing.assert_array_equal(segImg.labelVolume, [196, 24, 1])
+    assert segImg.labelSlices[1] == (slice(1, 3), slice(1, 4), slice(1, 5))
+    for i in range(segImg.getLabelNumber()):
+        binImg, label = segImg.getLabel(i)
+        np.testing.assert_array_equal(binImg, image == label)
+
+def test_separate_labels_integer_input():
+    image = np.zeros((8, 9, 10), dtype=np.uint16)
+    image[1:3, 1:4, 1:5] = 2
+    image[4:8, 2:9, 3:10] = 500
+    image[0, 0, 0] = 7
+
+    for dtype, chunkSize in [(np.uint16, 2**22), (np.uint16, 90), 
+                             (np.int32, 2**22)]:
+        segImg = ImageBase.SegmentedImage(image.astype(dtype), 0.5, 
+                                          [1, 1, 1], [1, 1, 1], 0.5)
+        separator = LabelSeparater.LabelSeparation(segImg, chunkSize)
+        separator.separateLabels()
+        separator.updateImg()
+
+        assert segImg.labels.dtype == dtype
+        np.testing.assert_array_equal(segImg.labels, [500, 2, 7])
+        np.testing.assert_array_equal(segImg.labelVolume, [196, 24, 1])
+        assert segImg.labelSlices[1] == (slice(1, 3), slice(1, 4), slice(1, 5))
+        for i in range(segImg.getLabelNumber()):
+            binImg, label = segImg.getLabel(i)
+            np.testing.assert_array_equal(binImg, image == label)
+
+def test_label_statistics():
+    image = np.zeros((8, 9, 10), dtype=np.uint8)
+    image[1:3, 1:4, 1:5] = 2
+    image[4:8, 2:9, 3:10] = 5
+
+    segImg = ImageBase.SegmentedImage(image, 0.5, [1, 1, 1], [0.5, 1, 2], 0.5)
+    separator = LabelSeparater.LabelSeparation(segImg)
+    separator.separateLabels()
+    separator.updateImg()
+
+    labels, voxelCounts, volumes, lower, upper = segImg.getLabelStatistics()
+    np.testing.assert_array_equal(labels, [5, 2])
+    np.testing.assert_array_equal(voxelCounts, [196, 24])
+    np.testing.assert_allclose(volumes, [196, 24])
+    np.testing.assert_array_equal(lower, [[4, 2, 3], [1, 1, 1]])
+    np.testing.assert_array_equal(upper, [[8, 9, 10], [3, 4, 5]])
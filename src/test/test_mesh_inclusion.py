@@ -0,0 +1,21 @@
+import numpy as np
+import vtk
+from SegmentationUpsampler import MeshInclusion
+
+def test_batched_distance_matches_pointwise():
+    sphere = vtk.vtkSphereSource()
+    sphere.SetRadius(2.0)
+    sphere.SetThetaResolution(24)
+    sphere.SetPhiResolution(24)
+    sphere.Update()
+    distanceFilter = MeshInclusion.getDistanceFilter(sphere.GetOutput())
+
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-3, 3, size=(500, 3))
+    expected = np.array([distanceFilter.EvaluateFunction(p) for p in points])
+
+    np.testing.assert_array_equal(
+        MeshInclusion.signedDistance(distanceFilter, points), expected)
+    np.testing.assert_array_equal(
+        MeshInclusion.insideMesh(distanceFilter, points), expected < 0)
+    assert MeshInclusion.insideMesh(distanceFilter, []).shape == (0,)
@@ -0,0 +1,24 @@
+import numpy as np
+from scipy.ndimage import gaussian_filter
+from SegmentationUpsampler import ImageBase, LabelSeparater, Preprocess
+
+def test_smoothing_padded_box_matches_full_image():
+    image = np.zeros((30, 25, 20), dtype=np.float32)
+    image[0:8, 3:12, 10:20] = 1     # touches the grid edges
+    image[15:22, 14:25, 0:6] = 2
+    image[12:14, 5:7, 8:9] = 3
+
+    for sigma in [0.6, 1.3, -1]:
+        segImg = ImageBase.SegmentedImage(image, sigma, [0.5, 0.5, 0.5], 
+                                          [1, 1, 1], 0.4, lowMemory=False)
+        separator = LabelSeparater.LabelSeparation(segImg)
+        separator.separateLabels()
+        separator.updateImg()
+
+        for i in range(segImg.getLabelNumber()):
+            preprocesser = Preprocess.ImagePreprocess(segImg, i, False)
+            preprocesser.meshPreprocessing()
+
+            binaryImg = segImg.binaryImgList[i]
+            expected = gaussian_filter(binaryImg.binImg, sigma=binaryImg.sigma)
+            np.testing.assert_array_equal(preprocesser.smoothMatrix, expected)
@@ -0,0 +1,55 @@
+import logging
+import numpy as np
+import os
+from SegmentationUpsampler.Profiler import Profiler
+from SegmentationUpsampler.UpsampleMultiLabels import upsample
+
+base_path = os.path.dirname(__file__)
+data_dir = os.path.join(base_path, "../data/")
+image = np.load(os.path.join(data_dir, "multilabelTestShape.npy"))
+
+def test_profiler_records_every_stage(capsys, caplog):
+    received = []
+    profiler = Profiler(callback=received.append)
+    expected = upsample(image, [0.5, 0.5, 0.5], sigma=0.6, iso=0.4, 
+                        engine="scanline", fillGaps=True)
+    capsys.readouterr()
+
+    with caplog.at_level(logging.DEBUG, logger="SegmentationUpsampler"):
+        result = upsample(image, [0.5, 0.5, 0.5], sigma=0.6, iso=0.4, 
+                          engine="scanline", fillGaps=True, 
+                          profiler=profiler, verbose=False)
+    np.testing.assert_array_equal(result, expected)
+    assert capsys.readouterr().out == ""
+
+    labels = len(np.unique(image)) - 1
+    assert received == profiler.records
+    assert len(caplog.records) == len(profiler.records)
+    stages = [record["stage"] for record in profiler.records]
+    assert stages == (["separation", "compilation"] + 
+                      ["preprocessing", "extraction", "voxelization"]*labels + 
+                      ["fillGaps"])
+
+    summary = profiler.getSummary()
+    assert list(summary) == ["separation", "compilation", "preprocessing", 
+                             "extraction", "voxelization", "fillGaps"]
+    assert summary["separation"]["counts"]["labels"] == labels
+    assert summary["preprocessing"]["counts"]["voxels"] == np.count_nonzero(
+        image)
+    assert summary["extraction"]["counts"]["triangles"] > 0
+    assert summary["voxelization"]["counts"]["crossings"] > 0
+    assert summary["fillGaps"]["counts"]["voxels"] == result.size
+    assert abs(profiler.getTotalSeconds() - 
+               sum(total["seconds"] for total in summary.values())) < 1e-9
+    assert "voxelization" in str(profiler)
+
+def test_profiler_with_tiles_and_process_workers():
+    for options in [dict(tileSize=40, fillGaps=True), 
+                    dict(workers=2, backend="process")]:
+        profiler = Profiler()
+        upsample(image, [0.5, 0.5, 0.5], sigma=0.6, iso=0.4, NB=True, 
+                 profiler=profiler, verbose=False, **options)
+        summary = profiler.getSummary()
+        assert summary["preprocessing"]["calls"] == len(np.unique(image)) - 1
+        assert summary["voxelization"]["counts"]["boundaryPoints"] > 0
+        assert summary["compilation"]["calls"] >= 1
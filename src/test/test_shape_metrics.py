@@ -0,0 +1,38 @@
+import numpy as np
+from scipy.ndimage import correlate
+from SegmentationUpsampler.ShapeMetrics import computeShapeMetrics
+
+def kernelArea(mask, kernel):
+    # Reference: surface kernel applied at every non-zero voxel
+    surface = correlate(mask, kernel, mode='constant', cval=0)
+    return np.sum(np.abs(surface * (mask != 0)))
+
+def test_shape_metrics_match_surface_kernels():
+    rng = np.random.default_rng(0)
+    mask = np.int32(rng.random((12, 9, 7)) > 0.6)
+    mask[0, 0, 0] = 1
+
+    kernel = np.array([[[0,0,0],[0,-1,0],[0,0,0]],
+                       [[0,-1,0],[-1,6,-1],[0,-1,0]],
+                       [[0,0,0],[0,-1,0],[0,0,0]]])
+    kernelX = np.array([[[0,0,0],[0,0,0],[0,0,0]],
+                        [[0,-1,0],[-1,4,-1],[0,-1,0]],
+                        [[0,0,0],[0,0,0],[0,0,0]]])
+    kernelY = np.array([[[0,0,0],[0,-1,0],[0,0,0]],
+                        [[0,0,0],[-1,4,-1],[0,0,0]],
+                        [[0,0,0],[0,-1,0],[0,0,0]]])
+    kernelZ = np.array([[[0,0,0],[0,-1,0],[0,0,0]],
+                        [[0,-1,0],[0,4,0],[0,-1,0]],
+                        [[0,0,0],[0,-1,0],[0,0,0]]])
+
+    volume, area, (Ax, Ay, Az) = computeShapeMetrics(mask)
+    assert volume == np.sum(mask)
+    assert area == kernelArea(mask, kernel)
+    assert Ax == kernelArea(mask, kernelX)
+    assert Ay == kernelArea(mask, kernelY)
+    assert Az == kernelArea(mask, kernelZ)
+
+def test_shape_metrics_cube():
+    mask = np.zeros((6, 6, 6))
+    mask[1:4, 1:4, 1:4] = 1
+    assert computeShapeMetrics(mask) == (27, 54, (36, 36, 36))
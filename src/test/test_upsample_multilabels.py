@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 from SegmentationUpsampler.UpsampleMultiLabels import upsample
 import os
 
@@ -53,3 +54,84 @@ def test_upsample_nbtrue_filltrue():
 
     result = upsample(image, scale, sigma=sigma, iso=iso, spacing=spacing, fillGaps=fillGaps, NB=NB)
     np.testing.assert_array_equal(result, expected)
+
+def test_upsample_workers_match_serial():
+    expected = np.load(os.path.join(data_dir, "NBTrueFillGapsFalse.npy"))
+    scale = [0.5, 0.5, 0.5]
+
+    for backend in ["thread", "process"]:
+        result = upsample(image, scale, sigma=0.6, iso=0.4, fillGaps=False, 
+                          NB=True, workers=2, backend=backend)
+        np.testing.assert_array_equal(result, expected)
+
+def test_upsample_scanline_engine():
+    # Parity differs from the distance test only for voxels on the 
+    # surface or beside open mesh edges at the crop boundary
+    expected = np.load(os.path.join(data_dir, "NBTrueFillGapsFalse.npy"))
+    scale = [0.5, 0.5, 0.5]
+
+    result = upsample(image, scale, sigma=0.6, iso=0.4, fillGaps=False, 
+                      engine="scanline")
+    assert np.count_nonzero(result != expected) <= 10
+
+def test_upsample_tiled_output_file(tmp_path):
+    expected = np.load(os.path.join(data_dir, "NBTrueFillGapsFalse.npy"))
+    scale = [0.5, 0.5, 0.5]
+    outputPath = os.path.join(tmp_path, "upsampled.npy")
+
+    result = upsample(image, scale, sigma=0.6, iso=0.4, fillGaps=False, 
+                      tileSize=7, outputPath=outputPath)
+    np.testing.assert_array_equal(result, expected)
+    np.testing.assert_array_equal(np.load(outputPath), expected)
+
+def test_upsample_memmap_input_and_out(tmp_path):
+    expected = np.load(os.path.join(data_dir, "NBTrueFillGapsFalse.npy"))
+    scale = [0.5, 0.5, 0.5]
+    mapped = np.load(os.path.join(data_dir, "multilabelTestShape.npy"), 
+                     mmap_mode="r")
+    out = np.lib.format.open_memmap(os.path.join(tmp_path, "out.npy"), 
+                                    mode="w+", dtype=np.uint8, 
+                                    shape=expected.shape)
+
+    result = upsample(mapped, scale, sigma=0.6, iso=0.4, fillGaps=False, 
+                      out=out)
+    assert result is out
+    np.testing.assert_array_equal(out, expected)
+
+def test_upsample_large_label_values():
+    expected = np.load(os.path.join(data_dir, "NBTrueFillGapsFalse.npy"))
+    expected = expected.astype(np.uint16) * 1000
+    scale = [0.5, 0.5, 0.5]
+    labels = image.astype(np.uint16) * 1000
+
+    result = upsample(labels, scale, sigma=0.6, iso=0.4, fillGaps=False)
+    assert result.dtype == np.uint16
+    np.testing.assert_array_equal(result, expected)
+
+    result, lookupTable = upsample(labels, scale, sigma=0.6, iso=0.4, 
+                                   fillGaps=False, compact=True)
+    assert result.dtype == np.uint8
+    np.testing.assert_array_equal(lookupTable, np.arange(8) * 1000)
+    np.testing.assert_array_equal(lookupTable[result], expected)
+
+def test_upsample_mesh_post_processing():
+    expected = np.load(os.path.join(data_dir, "NBTrueFillGapsFalse.npy"))
+    scale = [0.5, 0.5, 0.5]
+
+    result = upsample(image, scale, sigma=0.6, iso=0.4, fillGaps=False, 
+                      engine="scanline", meshRepair="auto")
+    np.testing.assert_array_equal(
+        result, upsample(image, scale, sigma=0.6, iso=0.4, fillGaps=False, 
+                         engine="scanline"))
+
+    # Surfaces move by at most a quarter of an input voxel
+    for meshSimplify in ["decimate", "smooth"]:
+        result = upsample(image, scale, sigma=0.6, iso=0.4, fillGaps=False, 
+                          meshSimplify=meshSimplify)
+        assert np.count_nonzero(result != expected) < 0.02*np.count_nonzero(
+            expected)
+
+    for options in [dict(meshRepair="sometimes"), 
+                    dict(meshSimplify="remesh")]:
+        with pytest.raises(ValueError):
+            upsample(image, scale, **options)
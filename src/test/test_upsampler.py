@@ -0,0 +1,101 @@
+import numpy as np
+import os
+import pytest
+from SegmentationUpsampler.Profiler import Profiler
+from SegmentationUpsampler.StageCache import StageCache
+from SegmentationUpsampler.Upsampler import Upsampler
+from SegmentationUpsampler.UpsampleMultiLabels import upsample
+
+base_path = os.path.dirname(__file__)
+data_dir = os.path.join(base_path, "../data/")
+image = np.load(os.path.join(data_dir, "multilabelTestShape.npy"))
+
+def test_sweep_matches_upsample_and_reuses_stages():
+    scale = [0.5, 0.5, 0.5]
+    upsampler = Upsampler(image, scale)
+    labelNumber = len(np.unique(image)) - 1
+
+    for sigma, iso in [(0.6, 0.4), (0.6, 0.3), (-1, -1), (0.6, 0.4)]:
+        result = upsampler.upsample(sigma, iso, fillGaps=True, 
+                                    engine="scanline")
+        expected = upsample(image, scale, sigma=sigma, iso=iso, 
+                            fillGaps=True, engine="scanline")
+        np.testing.assert_array_equal(result, expected)
+
+    # Labels are separated once, smoothing runs once per sigma and 
+    # meshing once per (sigma, iso)
+    assert upsampler.cache.misses["labels"] == 1
+    assert upsampler.cache.misses["smooth"] == 2*labelNumber
+    assert upsampler.cache.misses["mesh"] == 3*labelNumber
+    assert upsampler.cache.hits["smooth"] == 2*labelNumber
+    assert upsampler.cache.hits["mesh"] == labelNumber
+
+def test_iso_tolerance_selects_golden_section_search():
+    scale = [0.5, 0.5, 0.5]
+    upsampler = Upsampler(image, scale)
+    upsampler.upsample(0.6, -1, engine="scanline")
+    scanned = [binImg.iso for binImg in upsampler.segImg.binaryImgList]
+
+    result = upsampler.upsample(0.6, -1, engine="scanline", 
+                                isoTolerance=1e-4)
+    searched = [binImg.iso for binImg in upsampler.segImg.binaryImgList]
+    expected = upsample(image, scale, sigma=0.6, iso=-1, engine="scanline", 
+                        isoTolerance=1e-4)
+    np.testing.assert_array_equal(result, expected)
+
+    # Meshes are cached per tolerance, and the search is not limited 
+    # to the steps of the scan
+    assert upsampler.cache.misses["mesh"] == 2*len(scanned)
+    assert searched != scanned
+    assert all(0 <= iso <= 0.6 for iso in searched)
+    assert any(abs(iso*1000 - round(iso*1000)) > 1e-6 for iso in searched)
+
+    with pytest.raises(ValueError):
+        upsample(image, scale, isoTolerance=0)
+
+def test_mesh_options_and_profiler():
+    scale = [0.5, 0.5, 0.5]
+    upsampler = Upsampler(image, scale)
+    labelNumber = len(np.unique(image)) - 1
+
+    for meshRepair, meshSimplify in [("always", None), ("auto", "decimate"), 
+                                     ("always", None)]:
+        profiler = Profiler()
+        result = upsampler.upsample(0.6, 0.4, engine="scanline", 
+                                    meshRepair=meshRepair, 
+                                    meshSimplify=meshSimplify, 
+                                    profiler=profiler)
+        expected = upsample(image, scale, sigma=0.6, iso=0.4, 
+                            engine="scanline", meshRepair=meshRepair, 
+                            meshSimplify=meshSimplify)
+        np.testing.assert_array_equal(result, expected)
+        stages = {record["stage"] for record in profiler.records}
+        assert {"compilation", "voxelization"} <= stages
+
+    # Meshes are cached per mesh options, and only computed stages are 
+    # recorded
+    assert upsampler.cache.misses["mesh"] == 2*labelNumber
+    assert upsampler.cache.hits["mesh"] == labelNumber
+    assert "extraction" not in stages
+
+def test_memory_ceiling():
+    upsampler = Upsampler(image, [0.5, 0.5, 0.5], maxCacheBytes=0)
+    first = upsampler.upsample(0.6, 0.4, engine="scanline")
+    second = upsampler.upsample(0.6, 0.4, engine="scanline")
+    np.testing.assert_array_equal(first, second)
+    assert len(upsampler.cache) == 0
+    assert sum(upsampler.cache.hits.values()) == 0
+
+def test_stage_cache_evicts_least_recently_used():
+    cache = StageCache(maxBytes=10)
+    cache.put(("a", 1), "a", 4)
+    cache.put(("b", 1), "b", 4)
+    assert cache.get(("a", 1)) == "a"
+    cache.put(("c", 1), "c", 4)     # evicts b, used less recently than a
+    assert ("b", 1) not in cache
+    assert cache.get(("a", 1)) == "a" and cache.get(("c", 1)) == "c"
+    assert cache.nbytes == 8
+
+    assert not cache.put(("d", 1), "d", 11)
+    cache.setMaxBytes(4)
+    assert list(cache.entries) == [("c", 1)]
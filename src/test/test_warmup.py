@@ -0,0 +1,47 @@
+import subprocess
+import sys
+import numpy as np
+from SegmentationUpsampler import FillGapsNumba
+from SegmentationUpsampler import VoxelizerNumba
+from SegmentationUpsampler import VoxelizerScanline
+from SegmentationUpsampler.Profiler import Profiler
+from SegmentationUpsampler.UpsampleMultiLabels import warmup
+
+def test_package_import_does_not_load_vtk_or_numba():
+    code = ("import sys, SegmentationUpsampler; " + 
+            "print(sorted({'vtk', 'numba'} & set(sys.modules)))")
+    result = subprocess.run([sys.executable, "-c", code], 
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+def test_warmup_compiles_pipeline_signatures():
+    warmup(dtypes=(np.uint8, np.uint16))
+    assert "float32" in {str(signature[0].dtype) for signature in 
+                         VoxelizerNumba.pointWiseProcess.signatures}
+    assert {str(signature[0].dtype) for signature in 
+            FillGapsNumba.fillClustered.signatures} >= {"uint8", "uint16"}
+
+    profiler = Profiler()
+    assert warmup(dtypes=(np.uint8, np.uint16), profiler=profiler) == 0
+    assert [record["stage"] for record in profiler.records] == [
+        "compilation"]
+    assert profiler.records[0]["counts"] == {"kernels": 0}
+
+def test_warmup_compiles_scanline_signatures():
+    warmup(gapFiller=False, engine="scanline")
+    assert len(VoxelizerScanline.rowCrossings.signatures) >= 1
+    assert "float32" in {str(signature[0].dtype) for signature in 
+                         VoxelizerScanline.fillRows.signatures}
+
+    # A fresh process loads both kernels from the disk cache
+    code = ("from SegmentationUpsampler import VoxelizerScanline as V; " + 
+            "V.warmup(); " + 
+            "print(sum(len(k.stats.cache_hits) " + 
+            "for k in (V.rowCrossings, V.fillRows)))")
+    result = subprocess.run([sys.executable, "-c", code], 
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "2"
+
+    profiler = Profiler()
+    assert warmup(gapFiller=False, profiler=profiler, engine="scanline") == 0
+    assert profiler.records[0]["counts"] == {"kernels": 0}